@@ -0,0 +1,150 @@
+# benchmarks/chapter_bodies.py
+"""
+Хранение текстов глав: степень сжатия и задержки кодеков на русской прозе, затем размер БД
+и скорость выборок по главам — текст в строке chapters (прежняя схема) против chapter_bodies.
+
+    python -m benchmarks.chapter_bodies --chapters 500
+    python -m benchmarks.chapter_bodies --db sqlite:////app/data/storywriter.db   # тексты из своей БД
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from infrastructure.chapter_store import ChapterBodyStore, _zstd, decode_body, encode_body
+from infrastructure.database.models import Base, Book, Chapter
+
+SAMPLE = Path(__file__).parent / "data" / "prose_ru.txt"
+
+
+def sample_chapters(count: int) -> list:
+    """Главы из предложений образца в случайном порядке — без повторов внутри главы"""
+    sentences = re.split(r"(?<=[.!?»])\s+", SAMPLE.read_text(encoding="utf-8").strip())
+    chapters = []
+    for seed in range(count):
+        shuffled = sentences[:]
+        random.Random(seed).shuffle(shuffled)
+        chapters.append(" ".join(shuffled))
+    return chapters
+
+
+def db_chapters(db_url: str) -> list:
+    engine = create_engine(db_url)
+    session = sessionmaker(bind=engine)()
+    try:
+        store = ChapterBodyStore(session)
+        keys = [key for (key,) in session.query(Chapter.body_hash).filter(Chapter.body_hash.isnot(None))]
+        return list(store.get_many(keys).values())
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def timed(func, repeat: int = 5) -> float:
+    """Медиана, мкс"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e6
+
+
+def codec_table(texts: list):
+    variants = [("zlib", 1), ("zlib", 6), ("zlib", 9)]
+    if _zstd() is not None:
+        variants += [("zstd", 3), ("zstd", 10)]
+    raw = sum(len(t.encode("utf-8")) for t in texts)
+    print(f"\n{len(texts)} глав, в среднем {raw / len(texts) / 1024:.1f} КБ UTF-8")
+    print(f"{'codec':<8} {'ratio':>6} {'encode, µs':>11} {'decode, µs':>11}")
+    for codec, level in variants:
+        encoded = [encode_body(t, codec=codec, level=level) for t in texts]
+        compressed = sum(len(data) for _, data, _ in encoded)
+        encode_us = statistics.mean(timed(lambda t=t: encode_body(t, codec=codec, level=level)) for t in texts[:50])
+        decode_us = statistics.mean(timed(lambda e=e: decode_body(e[0], e[1])) for e in encoded[:50])
+        print(f"{codec}-{level:<3} {raw / compressed:>6.2f} {encode_us:>11.0f} {decode_us:>11.0f}")
+
+
+def fill_inline(path: str, texts: list):
+    """Прежняя схема: текст в колонке chapters.content"""
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE chapters (id INTEGER PRIMARY KEY, book_id INTEGER, number INTEGER NOT NULL, "
+            "title VARCHAR(200), generate_flag BOOLEAN, content TEXT, context_summary TEXT)"
+        ))
+        conn.execute(text("CREATE UNIQUE INDEX uq_chapters_book_number ON chapters (book_id, number)"))
+        conn.execute(
+            text(
+                "INSERT INTO chapters (book_id, number, title, generate_flag, content, context_summary) "
+                "VALUES (1, :n, :title, 0, :content, :summary)"
+            ),
+            [{"n": n, "title": f"Глава {n}", "content": t, "summary": t[:300]} for n, t in enumerate(texts, 1)]
+        )
+    return engine
+
+
+def fill_bodies(path: str, texts: list):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Book(id=1, title="Книга", user_id=1))
+    store = ChapterBodyStore(session)
+    for n, t in enumerate(texts, 1):
+        key, length = store.put(t)
+        session.add(Chapter(
+            book_id=1, number=n, title=f"Глава {n}", generate_flag=False,
+            body_hash=key, body_bytes=length, context_summary=t[:300]
+        ))
+    session.commit()
+    session.close()
+    return engine
+
+
+def storage_table(texts: list):
+    print(f"\nБД из {len(texts)} глав")
+    print(f"{'layout':<8} {'size, KB':>9} {'outline scan, µs':>17} {'read chapter, µs':>17}")
+    scan = "SELECT id, number, title, generate_flag FROM chapters WHERE book_id = 1 ORDER BY number"
+    middle = len(texts) // 2
+    with tempfile.TemporaryDirectory() as tmp:
+        for layout, fill in (("inline", fill_inline), ("bodies", fill_bodies)):
+            path = os.path.join(tmp, f"{layout}.db")
+            engine = fill(path, texts)
+            with engine.connect() as conn:
+                scan_us = timed(lambda: conn.execute(text(scan)).all(), repeat=20)
+                if layout == "inline":
+                    read = lambda: conn.execute(
+                        text("SELECT content FROM chapters WHERE book_id = 1 AND number = :n"), {"n": middle}
+                    ).scalar()
+                else:
+                    session = sessionmaker(bind=conn)()
+                    store = ChapterBodyStore(session)
+                    key = session.query(Chapter.body_hash).filter(Chapter.number == middle).scalar()
+                    read = lambda: store.get(key)
+                read_us = timed(read, repeat=20)
+            engine.dispose()
+            print(f"{layout:<8} {os.path.getsize(path) / 1024:>9.0f} {scan_us:>17.0f} {read_us:>17.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк хранения текстов глав")
+    parser.add_argument("--chapters", type=int, default=500, help="сколько глав из образца прозы")
+    parser.add_argument("--db", default=None, help="взять тексты глав из этой БД вместо образца")
+    args = parser.parse_args()
+
+    texts = db_chapters(args.db) if args.db else sample_chapters(args.chapters)
+    if not texts:
+        raise SystemExit("Нет текстов глав")
+    codec_table(texts)
+    storage_table(texts)
+
+
+if __name__ == "__main__":
+    main()
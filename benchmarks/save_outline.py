@@ -0,0 +1,77 @@
+# benchmarks/save_outline.py
+"""
+Сравнение путей записи сюжета: построчный (ORM, flush на каждую главу) и пакетный
+(OutlineManager._insert_outline_rows). Каждый режим пишет N сюжетов в свою файловую БД SQLite.
+
+    python -m benchmarks.save_outline --outlines 200 --chapters 12 --storylines 7
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from infrastructure.database.models import Base
+from infrastructure.outline_manager import OutlineManager
+
+
+def make_outline(chapters: int, storylines: int) -> tuple:
+    lines = [f"Линия {i}" for i in range(1, storylines + 1)]
+    outline = [
+        {
+            "chapter": n,
+            "title": f"Глава {n}",
+            "events": {line: f"Событие линии «{line}» в главе {n}." for line in lines},
+        }
+        for n in range(1, chapters + 1)
+    ]
+    return lines, outline
+
+
+def run(bulk: bool, outlines: int, chapters: int, storylines: int) -> dict:
+    lines, outline = make_outline(chapters, storylines)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        statements = []
+        event.listen(engine, "before_cursor_execute", lambda *args: statements.append(1))
+        session = sessionmaker(bind=engine)()
+        try:
+            manager = OutlineManager(session)
+            started = time.perf_counter()
+            for i in range(outlines):
+                manager.save_outline(f"Книга {i}", "Описание", lines, outline, user_id=1, bulk=bulk)
+            elapsed = time.perf_counter() - started
+        finally:
+            session.close()
+            engine.dispose()
+    return {
+        "mode": "bulk" if bulk else "per-row",
+        "total_s": elapsed,
+        "ms_per_outline": elapsed * 1000 / outlines,
+        "statements_per_outline": len(statements) / outlines,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк OutlineManager.save_outline")
+    parser.add_argument("--outlines", type=int, default=200)
+    parser.add_argument("--chapters", type=int, default=12)
+    parser.add_argument("--storylines", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{args.outlines} сюжетов × {args.chapters} глав × {args.storylines} линий")
+    print(f"{'mode':<8} {'total, s':>9} {'ms/outline':>11} {'SQL/outline':>12}")
+    results = [run(bulk, args.outlines, args.chapters, args.storylines) for bulk in (False, True)]
+    for result in results:
+        print(
+            f"{result['mode']:<8} {result['total_s']:>9.2f} {result['ms_per_outline']:>11.2f} "
+            f"{result['statements_per_outline']:>12.1f}"
+        )
+    print(f"speedup: ×{results[0]['total_s'] / results[1]['total_s']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
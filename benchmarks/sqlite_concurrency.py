@@ -0,0 +1,160 @@
+# benchmarks/sqlite_concurrency.py
+"""
+Несколько процессов (как воркеры gunicorn) одновременно читают страницу сюжета и пишут в одну
+файловую БД SQLite: сохраняют тексты глав, переключают флаги, правят события.
+Сравнивает прежний движок (rollback journal, без повторов) и профиль sqlite_profile.py.
+
+    python -m benchmarks.sqlite_concurrency --workers 4 --ops 300
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from config.settings import settings
+from infrastructure.database.migrations import run_migrations
+from infrastructure.database.models import Base, Chapter
+from infrastructure.database.sqlite_profile import create_db_engine, is_lock_error
+from infrastructure.outline_manager import OutlineManager
+
+CHAPTERS = 40
+STORYLINES = [f"Линия {i}" for i in range(1, 7)]
+
+
+def prepare(db_url: str):
+    engine = create_db_engine(db_url, tuned=False)
+    Base.metadata.create_all(engine)
+    run_migrations(engine)
+    session = sessionmaker(bind=engine)()
+    chapters = [
+        {"chapter": n, "title": f"Глава {n}", "events": {line: f"Событие {n}" for line in STORYLINES}}
+        for n in range(1, CHAPTERS + 1)
+    ]
+    OutlineManager(session).save_outline("Книга", "Описание", STORYLINES, chapters, user_id=1)
+    session.close()
+    engine.dispose()
+
+
+def generation_worker(db_url: str, tuned: bool, chapters: int, hold: float, results):
+    """Фоновая генерация: пишет текст главы и держит транзакцию открытой hold секунд до commit"""
+    engine = create_db_engine(db_url, tuned=tuned)
+    session = sessionmaker(bind=engine)()
+    errors = 0
+    for number in range(1, chapters + 1):
+        try:
+            chapter = session.query(Chapter).filter(Chapter.book_id == 1, Chapter.number == number).one()
+            chapter.content = "Текст " * 5000
+            session.flush()
+            time.sleep(hold)
+            session.commit()
+        except Exception as e:
+            if not is_lock_error(e):
+                raise
+            session.rollback()
+            errors += 1
+    session.close()
+    engine.dispose()
+    results.put(({"read": [], "write": []}, errors))
+
+
+def worker(db_url: str, tuned: bool, ops: int, seed: int, results):
+    if not tuned:
+        settings.SQLITE_LOCK_RETRIES = 0  # прежнее поведение: ошибка уходит пользователю
+    engine = create_db_engine(db_url, tuned=tuned)
+    session = sessionmaker(bind=engine)()
+    manager = OutlineManager(session)
+    rng = random.Random(seed)
+    text = "Слово " * 3000  # ~18 КБ — текст главы
+    latencies = {"read": [], "write": []}
+    errors = 0
+    for _ in range(ops):
+        number = rng.randint(1, CHAPTERS)
+        roll = rng.random()
+        kind = "read" if roll < 0.5 else "write"
+        started = time.perf_counter()
+        try:
+            if roll < 0.5:
+                manager.load_outline(1)
+            elif roll < 0.8:
+                manager.update_chapter_summary(1, number, f"Резюме {rng.random()}", content=text)
+            elif roll < 0.9:
+                manager.toggle_chapter_generate(1, number, rng.random() < 0.5)
+            else:
+                manager.update_plot_event(1, number, rng.choice(STORYLINES), f"Правка {rng.random()}")
+        except Exception as e:
+            if not is_lock_error(e):
+                raise
+            session.rollback()
+            errors += 1
+            continue
+        latencies[kind].append(time.perf_counter() - started)
+    session.close()
+    engine.dispose()
+    results.put((latencies, errors))
+
+
+def p95(values):
+    return statistics.quantiles(values, n=20)[-1] * 1000 if len(values) > 1 else 0.0
+
+
+def run(tuned: bool, workers: int, ops: int, directory: str = None, hold: float = 0.0) -> dict:
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        db_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        prepare(db_url)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=worker, args=(db_url, tuned, ops, seed, results))
+            for seed in range(workers)
+        ]
+        if hold:
+            processes.append(multiprocessing.Process(
+                target=generation_worker, args=(db_url, tuned, max(1, ops // 20), hold, results)
+            ))
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+    reads = [value for latencies, _ in collected for value in latencies["read"]]
+    writes = [value for latencies, _ in collected for value in latencies["write"]]
+    return {
+        "mode": "tuned" if tuned else "legacy",
+        "ops_per_s": (len(reads) + len(writes)) / elapsed,
+        "read_p95_ms": p95(reads),
+        "write_p95_ms": p95(writes),
+        "lock_errors": sum(errors for _, errors in collected),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк конкурентного доступа к SQLite")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--ops", type=int, default=300, help="операций на процесс")
+    parser.add_argument("--hold", type=float, default=0.0,
+                        help="ещё один процесс-генератор держит транзакцию записи столько секунд")
+    parser.add_argument("--dir", default=None, help="каталог для БД (по умолчанию системный temp; tmpfs скрывает цену fsync)")
+    args = parser.parse_args()
+
+    print(
+        f"{args.workers} процессов × {args.ops} операций (50% чтение сюжета, 50% запись)"
+        + (f", генератор держит транзакцию {args.hold} с" if args.hold else "")
+    )
+    print(f"{'mode':<7} {'ops/s':>8} {'read p95, ms':>13} {'write p95, ms':>14} {'locked':>7}")
+    for tuned in (False, True):
+        result = run(tuned, args.workers, args.ops, args.dir, args.hold)
+        print(
+            f"{result['mode']:<7} {result['ops_per_s']:>8.1f} {result['read_p95_ms']:>13.1f} "
+            f"{result['write_p95_ms']:>14.1f} {result['lock_errors']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
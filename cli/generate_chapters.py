@@ -5,16 +5,242 @@ from infrastructure.database import init_db, get_session
 from infrastructure.outline_manager import OutlineManager
 from domain.book_logic import BookGenerator
 from infrastructure.llm_client import LLMClientFactory
+from infrastructure.async_executor import BoundedExecutor
+from infrastructure.summary_compaction import SummaryCompactor
+from infrastructure.context_index import ChapterRetriever
+from infrastructure.generation_runs import GenerationRuns
+from infrastructure.token_usage import track_usage
+from infrastructure.prompt_cache import prompt_cache_scope
 from logger import logger
 import argparse
+import asyncio
+import copy
+from contextlib import ExitStack, nullcontext
+from typing import Callable, Optional
 
 
-def generate_chapters_for_book(book_id: int, user_id: int, language: str = settings.DEFAULT_LANGUAGE):
+def _chapter_context(data: dict, chapter_num: int) -> tuple:
+    """(chapter_data, [(номер, резюме)] предыдущих глав) из результата OutlineManager.load_outline"""
+    storylines = data["storylines"]
+    chapters = sorted(data["chapters"], key=lambda x: x["Chapter"])
+    row = next((ch for ch in chapters if int(ch["Chapter"]) == chapter_num), None)
+    if row is None:
+        raise ValueError(f"Глава {chapter_num} не найдена в сюжете")
+
+    # Собираем контекст предыдущих глав
+    previous = [
+        (int(ch["Chapter"]), ch["Summary"])
+        for ch in chapters
+        if int(ch["Chapter"]) < chapter_num and ch.get("Summary")
+    ]
+
+    # Подготовка данных
+    chapter_data = {
+        "chapter": chapter_num,
+        "title": row["Title"],
+        "events": {sl: row[sl] for sl in storylines if sl in row}
+    }
+    return chapter_data, previous
+
+
+def build_chapter_context(data: dict, chapter_num: int, compactor: Optional[SummaryCompactor] = None) -> tuple:
+    """
+    Готовит данные для промпта главы из результата OutlineManager.load_outline:
+    (chapter_data, previous_summaries)
+    compactor — сжимает резюме давних глав в дайджесты (для длинных книг).
+    """
+    chapter_data, previous = _chapter_context(data, chapter_num)
+    if compactor is not None:
+        previous_summaries = compactor.compact(previous)
+    else:
+        previous_summaries = [f"Глава {number}: {summary}" for number, summary in previous]
+    return chapter_data, previous_summaries
+
+
+async def abuild_chapter_context(data: dict, chapter_num: int, compactor: Optional[SummaryCompactor] = None) -> tuple:
+    """Асинхронная версия build_chapter_context: дайджесты запрашиваются без блокировки цикла событий"""
+    chapter_data, previous = _chapter_context(data, chapter_num)
+    if compactor is not None:
+        previous_summaries = await compactor.acompact(previous)
+    else:
+        previous_summaries = [f"Глава {number}: {summary}" for number, summary in previous]
+    return chapter_data, previous_summaries
+
+
+async def _generate_pipelined(
+    book: Book,
+    data: dict,
+    to_generate: list,
+    generator: BookGenerator,
+    manager: OutlineManager,
+    progress_callback: Optional[Callable[[int, int, int], None]] = None,
+    reconcile: bool = False,
+    max_concurrency: int = None,
+    runs: Optional[GenerationRuns] = None,
+    run_id: int = None
+):
+    """
+    Конвейерная генерация:
+    1) плановые резюме всех выбранных глав одним коротким запросом;
+    2) полные тексты параллельно (не больше max_concurrency) — каждая глава получает
+       в контекст реальные резюме уже написанных глав и плановые — для остальных;
+    3) (reconcile=True) резюме каждой главы пересобирается по её фактическому тексту.
+    Возвращает список ошибок по главам (пустой — всё сохранено).
+    runs/run_id — журнал запуска: состояние каждой главы пишется по мере готовности.
+    """
+    storylines = data["storylines"]
+    total = len(to_generate)
+    targets = [build_chapter_context(data, int(row["Chapter"]))[0] for row in to_generate]
+
+    with track_usage() as usage:
+        planned = generator.plan_summaries(book.premise, storylines, targets)
+    manager.record_llm_usage(book.id, usage, operation="summary_plan")
+
+    # Копия сюжета, где резюме ненаписанных глав заменены плановыми
+    planned_data = copy.deepcopy(data)
+    rows = {int(row["Chapter"]): row for row in planned_data["chapters"]}
+    for number, summary in planned.items():
+        rows[number]["Summary"] = summary
+
+    done = 0
+    if progress_callback:
+        progress_callback(done, total, targets[0]["chapter"] if targets else None)
+
+    compactor = make_compactor(generator, manager, book.id)
+    retriever = make_retriever(generator, manager, book.id)
+
+    async def write_chapter(chapter_data: dict):
+        nonlocal done
+        chapter_num = chapter_data["chapter"]
+        with runs.track_chapter(run_id, chapter_num) if runs else nullcontext():
+            with track_usage() as usage:
+                _, previous_summaries = await abuild_chapter_context(planned_data, chapter_num, compactor)
+            manager.record_llm_usage(book.id, usage, operation="summary_digest")
+            passages = retrieve_passages(retriever, chapter_data, previous_summaries)
+
+            with track_usage() as usage:
+                chapter_text, summary = await generator.agenerate_chapter(
+                    chapter_data=chapter_data,
+                    book_description=book.premise,
+                    storylines=storylines,
+                    previous_summaries=previous_summaries,
+                    chapter_length=settings.CHAPTER_LENGTH,
+                    context_passages=passages
+                )
+                if reconcile:
+                    summary = await generator.areconcile_summary(chapter_data, chapter_text, fallback=summary)
+
+            # Все корутины выполняются в одном потоке — сессия между await не используется конкурентно
+            manager.update_chapter_summary(
+                book_id=book.id,
+                chapter_number=chapter_num,
+                summary=summary,
+                content=chapter_text
+            )
+            manager.record_llm_usage(book.id, usage, operation="chapter", chapter_number=chapter_num)
+        # Главы, которые стартуют позже, получат уже настоящее резюме
+        rows[chapter_num]["Summary"] = summary
+
+        done += 1
+        logger.debug(f"✅ Глава {chapter_num} сохранена в БД ({done}/{total})")
+        if progress_callback:
+            progress_callback(done, total, chapter_num)
+
+    executor = BoundedExecutor(max_concurrency)
+    results = await executor.map(write_chapter, targets, return_exceptions=True)
+    return [
+        (chapter_data["chapter"], result)
+        for chapter_data, result in zip(targets, results)
+        if isinstance(result, Exception)
+    ]
+
+
+def make_compactor(generator: BookGenerator, manager: OutlineManager, book_id: int) -> Optional[SummaryCompactor]:
+    if not settings.SUMMARY_COMPACTION_ENABLED:
+        return None
+    return SummaryCompactor(generator, manager, book_id)
+
+
+def make_retriever(generator: BookGenerator, manager: OutlineManager, book_id: int) -> Optional[ChapterRetriever]:
+    if not settings.RETRIEVAL_ENABLED:
+        return None
+    return ChapterRetriever(manager, book_id, count_tokens=generator.count_tokens)
+
+
+def retrieve_passages(retriever: Optional[ChapterRetriever], chapter_data: dict, previous_summaries: list) -> list:
+    """Релевантные фрагменты предыдущих глав, которых ещё нет в previous_summaries"""
+    if retriever is None:
+        return []
+    return retriever.retrieve(chapter_data, exclude=previous_summaries)
+
+
+def start_or_resume_run(
+    runs: GenerationRuns,
+    book_id: int,
+    chapters: list,
+    resume: bool = False,
+    job_id: int = None
+) -> tuple:
+    """
+    (run, строки глав к генерации).
+    Задача очереди, которую подхватили заново после перезапуска воркера, продолжает свой запуск;
+    resume=True продолжает последний незавершённый запуск книги. Иначе — новый запуск по флагам Generate.
+    """
+    run = runs.get_resumable(book_id, job_id=job_id) if job_id is not None else None
+    if run is None and resume:
+        run = runs.get_resumable(book_id)
+        if run is None:
+            logger.info(f"Незавершённых запусков для книги {book_id} нет — начинаем новый")
+
+    if run is None:
+        to_generate = [row for row in chapters if row.get("Generate") == True]
+        return runs.start(book_id, [int(row["Chapter"]) for row in to_generate], job_id=job_id), to_generate
+
+    rows = {int(row["Chapter"]): row for row in chapters}
+    to_generate = []
+    for number in runs.unfinished_chapters(run.id):
+        row = rows.get(number)
+        if row is None:
+            runs.chapter_skipped(run.id, number, "Глава удалена из сюжета")
+        elif not row.get("Generate") and row.get("HasContent"):
+            # Глава сохранена, но отметка в журнале не успела записаться (падение между коммитами)
+            runs.chapter_done(run.id, number)
+        else:
+            to_generate.append(row)
+
+    if job_id is not None and run.job_id != job_id:
+        runs.attach_job(run.id, job_id)
+    runs.resume(run.id)
+    logger.info(f"Продолжаем запуск {run.id} для книги {book_id}: осталось глав {len(to_generate)}")
+    return run, to_generate
+
+
+def generate_chapters_for_book(
+    book_id: int,
+    user_id: int,
+    language: str = settings.DEFAULT_LANGUAGE,
+    progress_callback: Optional[Callable[[int, int, int], None]] = None,
+    raise_errors: bool = False,
+    pipelined: Optional[bool] = None,
+    resume: bool = False,
+    job_id: int = None
+):
     """
-    Основная логика генерации глав — для вызова из веб-слоя.
+    Основная логика генерации глав — для вызова из веб-слоя и фонового воркера.
     НЕ использует argparse, не вызывает init_db напрямую.
+    progress_callback(done, total, current_chapter) вызывается перед и после каждой главы.
+    raise_errors=True пробрасывает исключение наружу (нужно воркеру, чтобы сохранить текст ошибки).
+    pipelined=True — конвейерный режим (см. _generate_pipelined), по умолчанию CHAPTER_PIPELINE_ENABLED.
+    resume=True — продолжить последний незавершённый запуск; job_id — задача очереди, чей запуск
+    продолжается автоматически (см. start_or_resume_run).
     """
+    if pipelined is None:
+        pipelined = settings.CHAPTER_PIPELINE_ENABLED
+
     session = get_session()
+    runs = GenerationRuns(session)
+    run = None
+    cache_scope = ExitStack()
 
     try:
         # Проверяем, что книга существует и принадлежит пользователю
@@ -23,7 +249,7 @@ def generate_chapters_for_book(book_id: int, user_id: int, language: str = setti
             logger.error(f"Книга {book_id} не найдена или доступ запрещён для {user_id=}")
             return False
 
-        llm = LLMClientFactory.create_client(language)
+        llm = LLMClientFactory.get_client(language)
         generator = BookGenerator(llm)
         manager = OutlineManager(session)
 
@@ -37,60 +263,101 @@ def generate_chapters_for_book(book_id: int, user_id: int, language: str = setti
 
         storylines = data["storylines"]
         chapters = sorted(data["chapters"], key=lambda x: x["Chapter"])
+        run, to_generate = start_or_resume_run(runs, book_id, chapters, resume=resume, job_id=job_id)
+        total = len(to_generate)
+        # Кэши общего префикса промптов глав живут столько же, сколько запуск
+        cache_scope.enter_context(prompt_cache_scope(f"book-{book_id}-run-{run.id}"))
 
-        # Генерируем главы
-        for row in chapters:
-            if row.get("Generate") != True:
-                continue
+        already = runs.finished_count(run.id)
+        if progress_callback and already:
+            # Прогресс продолженного запуска считается от всех его глав
+            report = progress_callback
+            progress_callback = lambda done, total, current: report(already + done, already + total, current)
+
+        if pipelined and total > 1:
+            errors = asyncio.run(_generate_pipelined(
+                book, data, to_generate, generator, manager,
+                progress_callback=progress_callback,
+                reconcile=settings.CHAPTER_PIPELINE_RECONCILE,
+                runs=runs,
+                run_id=run.id
+            ))
+            if errors:
+                for chapter_num, error in errors:
+                    logger.error(f"Глава {chapter_num} не сгенерирована: {error}")
+                raise errors[0][1]
+            runs.finish(run.id)
+            logger.info(f"Генерация для '{book.title}' завершена (конвейерный режим).")
+            return True
+
+        compactor = make_compactor(generator, manager, book_id)
+        retriever = make_retriever(generator, manager, book_id)
 
+        # Генерируем главы
+        for done, row in enumerate(to_generate):
             chapter_num = int(row["Chapter"])
             logger.info(f"Generating chapter {chapter_num}...")
+            if progress_callback:
+                progress_callback(done, total, chapter_num)
 
-            # Собираем контекст предыдущих глав
-            previous_summaries = []
-            for ch in chapters:
-                prev_num = int(ch["Chapter"])
-                if prev_num < chapter_num and ch.get("Summary"):
-                    previous_summaries.append(f"Глава {prev_num}: {ch['Summary']}")
-
-            # Подготовка данных
-            chapter_data = {
-                "chapter": chapter_num,
-                "title": row["Title"],
-                "events": {sl: row[sl] for sl in storylines if sl in row}
-            }
-
-            # Генерация
-            chapter_text, summary = generator.generate_chapter(
-                chapter_data=chapter_data,
-                book_description=book.premise,
-                storylines=storylines,
-                previous_summaries=previous_summaries,
-                chapter_length=settings.CHAPTER_LENGTH  # ✅ Исправил опечатку: LENGHT → LENGTH
-            )
+            with runs.track_chapter(run.id, chapter_num):
+                with track_usage() as usage:
+                    chapter_data, previous_summaries = build_chapter_context(data, chapter_num, compactor)
+                manager.record_llm_usage(book_id, usage, operation="summary_digest")
+                passages = retrieve_passages(retriever, chapter_data, previous_summaries)
 
-            # Сохранение напрямую в БД
-            manager.update_chapter_summary(
-                book_id=book_id,
-                chapter_number=chapter_num,
-                summary=summary,
-                content=chapter_text
-            )
+                # Генерация
+                with track_usage() as usage:
+                    chapter_text, summary = generator.generate_chapter(
+                        chapter_data=chapter_data,
+                        book_description=book.premise,
+                        storylines=storylines,
+                        previous_summaries=previous_summaries,
+                        chapter_length=settings.CHAPTER_LENGTH,  # ✅ Исправил опечатку: LENGHT → LENGTH
+                        context_passages=passages
+                    )
+
+                # Сохранение напрямую в БД
+                manager.update_chapter_summary(
+                    book_id=book_id,
+                    chapter_number=chapter_num,
+                    summary=summary,
+                    content=chapter_text
+                )
+                manager.record_llm_usage(book_id, usage, operation="chapter", chapter_number=chapter_num)
+                # Следующая глава этого же запуска должна видеть новое резюме
+                row["Summary"] = summary
 
             logger.debug(f"✅ Глава {chapter_num} сохранена в БД. Summary: {summary[:60]}...")
 
+        if progress_callback:
+            progress_callback(total, total, None)
+
+        runs.finish(run.id)
         logger.info(f"Генерация для '{book.title}' завершена.")
         return True
 
     except Exception as e:
         logger.error(f"Ошибка при генерации глав: {e}")
+        if run is not None:
+            session.rollback()
+            runs.fail(run.id, str(e))
+        if raise_errors:
+            raise
         return False
 
     finally:
+        cache_scope.close()
         session.close()  # ✅ Обязательно закрываем сессию
 
 
-def main(book_id: int, user_id: int, language: str = settings.DEFAULT_LANGUAGE):
+def main(
+    book_id: int,
+    user_id: int,
+    language: str = settings.DEFAULT_LANGUAGE,
+    pipelined: Optional[bool] = None,
+    resume: bool = False
+):
     """
     CLI-интерфейс. Инициализирует БД и вызывает основную логику.
     """
@@ -98,7 +365,9 @@ def main(book_id: int, user_id: int, language: str = settings.DEFAULT_LANGUAGE):
     init_db(settings.DATABASE_URL)
 
     # Вызываем основную логику
-    success = generate_chapters_for_book(book_id=book_id, user_id=user_id, language=language)
+    success = generate_chapters_for_book(
+        book_id=book_id, user_id=user_id, language=language, pipelined=pipelined, resume=resume
+    )
     return success
 
 
@@ -106,7 +375,18 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Сгенерировать главы книги")
     parser.add_argument("--book-id", type=int, required=True, help="ID книги")
     parser.add_argument("--user-id", type=int, default=1, help="ID пользователя")
-    parser.add_argument("--language", default="gemini", help="LLM: gemini, openai и т.д.")
+    parser.add_argument("--language", default=settings.DEFAULT_LANGUAGE, help="Язык книги")
+    parser.add_argument(
+        "--pipelined", action="store_true", default=None,
+        help="Плановые резюме, затем тексты глав параллельно (LLM_MAX_CONCURRENCY)"
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="Продолжить последний незавершённый запуск с первой несгенерированной главы"
+    )
     args = parser.parse_args()
 
-    main(book_id=args.book_id, user_id=args.user_id, language=args.language)
\ No newline at end of file
+    main(
+        book_id=args.book_id, user_id=args.user_id, language=args.language,
+        pipelined=args.pipelined, resume=args.resume
+    )
\ No newline at end of file
@@ -3,21 +3,22 @@ import argparse
 from infrastructure.llm_client import LLMClientFactory
 from infrastructure.database import init_db, get_session
 from infrastructure.outline_manager import OutlineManager
+from infrastructure.async_executor import run_bounded
 from domain.book_logic import BookGenerator
 from config.settings import settings
 from logger import logger
 
-def main(description: str, language: str, title: str = "Новая книга"):
+def main(description: str, language: str, title: str = "Новая книга", chapter_count: int = None):
     # Инициализируем БД
     Session = init_db(settings.DATABASE_URL)
     session = get_session()
 
     # Генерируем сюжет
-    llm = LLMClientFactory.create_client(language)
+    llm = LLMClientFactory.get_client(language)
     generator = BookGenerator(llm)
     logger.info(f"Generating book outline: {description}")
 
-    storylines, chapters = generator.generate_outline(description)
+    storylines, chapters = generator.generate_outline(description, chapter_count=chapter_count)
 
     # Сохраняем в БД
     manager = OutlineManager(session)
@@ -31,11 +32,65 @@ def main(description: str, language: str, title: str = "Новая книга"):
 
     logger.info(f"✅ Сюжет сохранён в БД: книга '{title}'")
 
+
+def main_many(
+    descriptions: list, language: str, title: str = "Новая книга", max_concurrency: int = None, chapter_count: int = None
+):
+    """
+    Генерирует сюжеты нескольких книг одновременно (не больше max_concurrency запросов к LLM),
+    сохраняет их в БД последовательно.
+    """
+    init_db(settings.DATABASE_URL)
+    session = get_session()
+
+    llm = LLMClientFactory.get_client(language)
+    generator = BookGenerator(llm)
+    logger.info(f"Generating {len(descriptions)} book outlines concurrently")
+
+    results = run_bounded(
+        lambda description: generator.agenerate_outline(description, chapter_count=chapter_count),
+        descriptions,
+        max_concurrency=max_concurrency,
+        return_exceptions=True
+    )
+
+    try:
+        manager = OutlineManager(session)
+        for i, (description, result) in enumerate(zip(descriptions, results), start=1):
+            if isinstance(result, Exception):
+                logger.error(f"❌ Не удалось сгенерировать сюжет '{description[:50]}': {result}")
+                continue
+
+            storylines, chapters = result
+            book_title = title if len(descriptions) == 1 else f"{title} {i}"
+            manager.save_outline(
+                book_title=book_title,
+                premise=description,
+                storylines=storylines,
+                chapters=chapters,
+                user_id=1  # временно
+            )
+            logger.info(f"✅ Сюжет сохранён в БД: книга '{book_title}'")
+    finally:
+        session.close()
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Сгенерировать сюжет книги")
-    parser.add_argument("--description", required=True, help="Описание книги")
+    parser.add_argument("--description", required=True, action="append",
+                        help="Описание книги (можно указать несколько раз — сюжеты сгенерируются параллельно)")
     parser.add_argument("--title", default="Моя книга", help="Название книги")
     parser.add_argument("--language", default="gemini", help="Язык LLM")
+    parser.add_argument("--chapters", type=int, default=None,
+                        help="Количество глав (больше OUTLINE_SINGLE_CALL_MAX_CHAPTERS — сюжет строится по актам)")
+    parser.add_argument("--concurrency", type=int, default=settings.LLM_MAX_CONCURRENCY,
+                        help="Сколько запросов к LLM выполнять одновременно")
     args = parser.parse_args()
 
-    main(args.description, args.language, args.title)
\ No newline at end of file
+    if len(args.description) == 1:
+        main(args.description[0], args.language, args.title, chapter_count=args.chapters)
+    else:
+        main_many(
+            args.description, args.language, args.title,
+            max_concurrency=args.concurrency, chapter_count=args.chapters
+        )
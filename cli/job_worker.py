@@ -0,0 +1,109 @@
+# cli/job_worker.py
+import argparse
+import os
+import socket
+import threading
+import time
+
+from config.settings import settings
+from infrastructure.database import init_db, get_session
+from infrastructure.job_queue import JobQueue
+from cli.generate_chapters import generate_chapters_for_book
+from logger import logger
+
+
+def start_heartbeat(job_id: int, interval: float = None) -> threading.Event:
+    """
+    Фоновый поток обновляет heartbeat_at задачи, пока не выставлено возвращённое событие.
+    Прогресс пишется только между главами, а одна глава с повторами и backoff может идти
+    дольше JOB_STALE_SECONDS — без этого requeue_stale отдал бы задачу второму воркеру.
+    """
+    interval = interval or settings.JOB_HEARTBEAT_SECONDS
+    stop = threading.Event()
+
+    def beat():
+        session = get_session()  # сессия SQLAlchemy не потокобезопасна — у потока своя
+        try:
+            queue = JobQueue(session)
+            while not stop.wait(interval):
+                try:
+                    queue.heartbeat(job_id)
+                except Exception as e:
+                    session.rollback()
+                    logger.warning(f"⚠️ Не удалось обновить heartbeat задачи {job_id}: {e}")
+        finally:
+            session.close()
+
+    threading.Thread(target=beat, name=f"job-{job_id}-heartbeat", daemon=True).start()
+    return stop
+
+
+def run_job(job_id: int, book_id: int, user_id: int):
+    """Выполняет одну задачу генерации и пишет прогресс по главам в БД"""
+    progress_session = get_session()
+    queue = JobQueue(progress_session)
+    heartbeat = start_heartbeat(job_id)
+
+    def on_progress(done: int, total: int, current_chapter: int):
+        queue.update_progress(job_id, done=done, total=total, current_chapter=current_chapter)
+
+    try:
+        success = generate_chapters_for_book(
+            book_id=book_id,
+            user_id=user_id,
+            progress_callback=on_progress,
+            raise_errors=True,
+            job_id=job_id  # после перезапуска воркера задача продолжит свой запуск, а не начнёт заново
+        )
+        if success:
+            queue.finish(job_id)
+            logger.info(f"✅ Задача {job_id} выполнена")
+        else:
+            queue.fail(job_id, "Книга не найдена или сюжет не сгенерирован")
+    except Exception as e:
+        logger.error(f"❌ Задача {job_id} завершилась с ошибкой: {e}")
+        progress_session.rollback()
+        queue.fail(job_id, str(e))
+    finally:
+        heartbeat.set()
+        progress_session.close()
+
+
+def work(poll_interval: float = settings.JOB_POLL_INTERVAL, once: bool = False):
+    """
+    Основной цикл воркера: забирает задачи из очереди по одной.
+    Несколько воркеров можно запускать параллельно — claim_next атомарен.
+    """
+    worker_name = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info(f"Воркер {worker_name} запущен")
+
+    while True:
+        session = get_session()
+        try:
+            queue = JobQueue(session)
+            queue.requeue_stale(settings.JOB_STALE_SECONDS)
+            job = queue.claim_next(worker_name)
+            job_info = (job.id, job.book_id, job.user_id) if job else None
+        finally:
+            session.close()
+
+        if job_info:
+            logger.info(f"Воркер {worker_name} взял задачу {job_info[0]} (book_id={job_info[1]})")
+            run_job(*job_info)
+        elif once:
+            return
+        else:
+            time.sleep(poll_interval)
+
+
+def main(once: bool = False):
+    init_db(settings.DATABASE_URL)
+    work(once=once)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Фоновый воркер генерации глав")
+    parser.add_argument("--once", action="store_true", help="Обработать очередь и выйти")
+    args = parser.parse_args()
+
+    main(once=args.once)
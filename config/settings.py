@@ -12,7 +12,7 @@ class Settings(BaseSettings):
 
     )
 
-    LLM_PROVIDER: str = Field(default="gemini", env="LLM_PROVIDER")  # gemini, openai, etc.
+    LLM_PROVIDER: str = Field(default="gemini", env="LLM_PROVIDER")  # gemini, openai, fake
 
     # GEMINI_API_KEY: str
     # MODEL_NAME: str = "gemini-2.0-flash"
@@ -24,7 +24,65 @@ class Settings(BaseSettings):
     # OpenAI-specific settings
     OPENAI_API_KEY: str = Field(default="", env="OPENAI_API_KEY")
     OPENAI_MODEL: str = Field(default="gpt-4-turbo", env="OPENAI_MODEL")
+    LLM_STRUCTURED_OUTPUT: bool = Field(default=True, env="LLM_STRUCTURED_OUTPUT")  # JSON-схема/JSON-режим провайдера
+    OPENAI_MAX_OUTPUT_TOKENS: int = Field(default=4096, env="OPENAI_MAX_OUTPUT_TOKENS")
+
+    # Бюджет токенов
+    LONG_PROMPT_WARNING_TOKENS: int = Field(default=10000, env="LONG_PROMPT_WARNING_TOKENS")
+    CHAPTER_INPUT_TOKEN_BUDGET: int = Field(default=12000, env="CHAPTER_INPUT_TOKEN_BUDGET")  # промпт главы целиком
     
+    # Fake-провайдер (LLM_PROVIDER=fake): детерминированные ответы без сети
+    FAKE_LLM_MODEL: str = Field(default="fake-1", env="FAKE_LLM_MODEL")
+    FAKE_LLM_SEED: int = Field(default=42, env="FAKE_LLM_SEED")
+    FAKE_LLM_LATENCY_MS: float = Field(default=0.0, env="FAKE_LLM_LATENCY_MS")  # медиана задержки
+    FAKE_LLM_LATENCY_SIGMA: float = Field(default=0.5, env="FAKE_LLM_LATENCY_SIGMA")  # «тяжесть хвоста» (лог-нормальное)
+    FAKE_LLM_CHAPTER_WORDS: int = Field(default=1000, env="FAKE_LLM_CHAPTER_WORDS")
+    FAKE_LLM_OUTLINE_CHAPTERS: int = Field(default=10, env="FAKE_LLM_OUTLINE_CHAPTERS")
+    FAKE_LLM_RATE_LIMIT_RATE: float = Field(default=0.0, env="FAKE_LLM_RATE_LIMIT_RATE")  # доля ответов 429
+    FAKE_LLM_MALFORMED_RATE: float = Field(default=0.0, env="FAKE_LLM_MALFORMED_RATE")  # доля битых JSON
+    FAKE_LLM_REPLAY_PATH: str = Field(default="", env="FAKE_LLM_REPLAY_PATH")  # JSONL из LLM_RECORD_PATH
+    LLM_RECORD_PATH: str = Field(default="", env="LLM_RECORD_PATH")  # записывать ответы реального провайдера
+
+    LLM_MAX_CONCURRENCY: int = Field(default=4, env="LLM_MAX_CONCURRENCY")  # одновременных async-запросов к LLM
+
+    # Длинные книги: сюжет строится по актам, главы актов — параллельно (domain/outline_acts.py)
+    OUTLINE_SINGLE_CALL_MAX_CHAPTERS: int = Field(default=12, env="OUTLINE_SINGLE_CALL_MAX_CHAPTERS")  # больше — по актам
+    OUTLINE_CHAPTERS_PER_ACT: int = Field(default=10, env="OUTLINE_CHAPTERS_PER_ACT")
+    OUTLINE_WEB_MAX_CHAPTERS: int = Field(default=40, env="OUTLINE_WEB_MAX_CHAPTERS")  # веб строит сюжет внутри запроса; длиннее — через CLI
+
+    OUTLINE_BULK_INSERT: bool = Field(default=True, env="OUTLINE_BULK_INSERT")  # пакетная запись сюжета (save_outline)
+
+    # Конвейерная генерация глав: плановые резюме, затем тексты параллельно (cli/generate_chapters.py)
+    CHAPTER_PIPELINE_ENABLED: bool = Field(default=False, env="CHAPTER_PIPELINE_ENABLED")
+    CHAPTER_PIPELINE_RECONCILE: bool = Field(default=False, env="CHAPTER_PIPELINE_RECONCILE")  # сверять резюме с текстом
+
+    # Пул HTTP-соединений клиентов из реестра (infrastructure/llm_registry.py)
+    LLM_HTTP_MAX_CONNECTIONS: int = Field(default=10, env="LLM_HTTP_MAX_CONNECTIONS")
+    LLM_HTTP_KEEPALIVE_SECONDS: float = Field(default=60.0, env="LLM_HTTP_KEEPALIVE_SECONDS")
+
+    # Общий для всех процессов лимит запросов к LLM (infrastructure/rate_limiter.py)
+    RATE_LIMIT_ENABLED: bool = Field(default=True, env="RATE_LIMIT_ENABLED")
+    RATE_LIMIT_DB_PATH: str = Field(default="/app/data/rate_limits.db", env="RATE_LIMIT_DB_PATH")
+    RATE_LIMIT_RPM: int = Field(default=60, env="RATE_LIMIT_RPM")  # запросов в минуту
+    RATE_LIMIT_TPM: int = Field(default=1_000_000, env="RATE_LIMIT_TPM")  # токенов в минуту
+    RATE_LIMIT_EXPECTED_OUTPUT_TOKENS: int = Field(default=2000, env="RATE_LIMIT_EXPECTED_OUTPUT_TOKENS")
+    RATE_LIMIT_MAX_RETRIES: int = Field(default=5, env="RATE_LIMIT_MAX_RETRIES")  # повторов на 429/503
+
+    # Таймауты, автоматический выключатель и резервный провайдер (infrastructure/resilience.py)
+    LLM_REQUEST_TIMEOUT: float = Field(default=300.0, env="LLM_REQUEST_TIMEOUT")  # дедлайн одного запроса, секунды (глава — до 90 с)
+    LLM_RESILIENCE_ENABLED: bool = Field(default=True, env="LLM_RESILIENCE_ENABLED")
+    LLM_FALLBACK_PROVIDER: str = Field(default="", env="LLM_FALLBACK_PROVIDER")  # например, openai
+    LLM_HEDGE_ENABLED: bool = Field(default=False, env="LLM_HEDGE_ENABLED")  # дублирующий запрос после p95
+    LLM_HEDGE_MIN_SAMPLES: int = Field(default=20, env="LLM_HEDGE_MIN_SAMPLES")  # замеров до расчёта p95
+    CIRCUIT_BREAKER_FAILURES: int = Field(default=5, env="CIRCUIT_BREAKER_FAILURES")  # ошибок подряд до размыкания
+    CIRCUIT_BREAKER_RESET_SECONDS: float = Field(default=60.0, env="CIRCUIT_BREAKER_RESET_SECONDS")
+
+    # Кэш ответов LLM (infrastructure/llm_cache.py)
+    LLM_CACHE_ENABLED: bool = Field(default=False, env="LLM_CACHE_ENABLED")
+    LLM_CACHE_PATH: str = Field(default="/app/data/llm_cache.db", env="LLM_CACHE_PATH")
+    LLM_CACHE_MAX_ENTRIES: int = Field(default=5000, env="LLM_CACHE_MAX_ENTRIES")
+    LLM_CACHE_TTL_SECONDS: int = Field(default=7 * 24 * 3600, env="LLM_CACHE_TTL_SECONDS")
+
     CHAPTERS_DIR: str = "chapters"
     DEFAULT_LANGUAGE: str = Field(default="Русский", env="DEFAULT_LANGUAGE")
     LOG_LEVEL: str = "INFO"
@@ -33,6 +91,46 @@ class Settings(BaseSettings):
     CHAPTER_LENGTH: str = "800-1200 words" # for prompt
     
     DATABASE_URL: str = Field(default="sqlite:////app/data/storywriter.db", env="DATABASE_URL")
+
+    # Хранение текстов глав (infrastructure/chapter_store.py)
+    CHAPTER_BODY_CODEC: str = Field(default="zlib", env="CHAPTER_BODY_CODEC")  # zlib или zstd (пакет zstandard)
+    CHAPTER_BODY_LEVEL: int = Field(default=6, env="CHAPTER_BODY_LEVEL")  # уровень сжатия
+
+    # Профиль SQLite для нескольких воркеров gunicorn (infrastructure/database/sqlite_profile.py)
+    SQLITE_TUNING_ENABLED: bool = Field(default=True, env="SQLITE_TUNING_ENABLED")
+    SQLITE_JOURNAL_MODE: str = Field(default="WAL", env="SQLITE_JOURNAL_MODE")
+    SQLITE_BUSY_TIMEOUT_MS: int = Field(default=15000, env="SQLITE_BUSY_TIMEOUT_MS")  # ждать блокировку, мс
+    SQLITE_SYNCHRONOUS: str = Field(default="NORMAL", env="SQLITE_SYNCHRONOUS")  # в WAL безопасно для целостности
+    SQLITE_MMAP_SIZE: int = Field(default=268_435_456, env="SQLITE_MMAP_SIZE")  # байт, 0 — без mmap
+    SQLITE_POOL_SIZE: int = Field(default=5, env="SQLITE_POOL_SIZE")  # соединений на процесс
+    SQLITE_LOCK_RETRIES: int = Field(default=3, env="SQLITE_LOCK_RETRIES")  # повторов записи после «database is locked»
+
+    # Сжатие резюме предыдущих глав для длинных книг (infrastructure/summary_compaction.py)
+    SUMMARY_COMPACTION_ENABLED: bool = Field(default=True, env="SUMMARY_COMPACTION_ENABLED")
+    SUMMARY_RECENT_CHAPTERS: int = Field(default=6, env="SUMMARY_RECENT_CHAPTERS")  # последние главы — дословно
+    SUMMARY_ARC_SIZE: int = Field(default=8, env="SUMMARY_ARC_SIZE")  # глав в одной арке
+    SUMMARY_MAX_ARCS: int = Field(default=3, env="SUMMARY_MAX_ARCS")  # дайджестов арок до сворачивания в книжный
+
+    # Поиск релевантных фрагментов предыдущих глав для промпта (infrastructure/context_index.py)
+    RETRIEVAL_ENABLED: bool = Field(default=True, env="RETRIEVAL_ENABLED")
+    RETRIEVAL_TOP_K: int = Field(default=6, env="RETRIEVAL_TOP_K")
+    RETRIEVAL_TOKEN_BUDGET: int = Field(default=1500, env="RETRIEVAL_TOKEN_BUDGET")
+    RETRIEVAL_PASSAGE_CHARS: int = Field(default=800, env="RETRIEVAL_PASSAGE_CHARS")  # длина фрагмента
+
+    # Кэш общего префикса промптов глав у провайдера (infrastructure/prompt_cache.py)
+    PROMPT_CACHE_ENABLED: bool = Field(default=True, env="PROMPT_CACHE_ENABLED")
+    PROMPT_CACHE_MIN_TOKENS: int = Field(default=1024, env="PROMPT_CACHE_MIN_TOKENS")  # короче — не кэшируем
+    PROMPT_CACHE_TTL_SECONDS: int = Field(default=3600, env="PROMPT_CACHE_TTL_SECONDS")
+
+    # Пометка глав на перегенерацию после правки сюжета (domain/invalidation.py)
+    STALE_PROPAGATION: str = Field(default="window", env="STALE_PROPAGATION")  # none, window, all
+    STALE_PROPAGATION_WINDOW: int = Field(default=2, env="STALE_PROPAGATION_WINDOW")  # следующих написанных глав
+
+    # Фоновая очередь генерации глав (cli/job_worker.py)
+    JOB_POLL_INTERVAL: float = Field(default=2.0, env="JOB_POLL_INTERVAL")  # секунды между опросами очереди
+    JOB_STALE_SECONDS: int = Field(default=600, env="JOB_STALE_SECONDS")  # без heartbeat дольше — задача возвращается в очередь
+    JOB_HEARTBEAT_SECONDS: float = Field(default=30.0, env="JOB_HEARTBEAT_SECONDS")  # heartbeat из фонового потока, пока задача идёт
+    CHAPTER_STREAM_LOCK_SECONDS: int = Field(default=600, env="CHAPTER_STREAM_LOCK_SECONDS")  # отметка потоковой генерации главы старше — считается брошенной
   
     WEB_APP_SECRET_KEY: str = Field(default="super-secret-key", env="WEB_APP_SECRET_KEY")
     FLASK_ENV: str = Field(default="development", env="FLASK_ENV") 
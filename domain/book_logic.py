@@ -1,17 +1,65 @@
 #domain/book_logic.py
+import asyncio
 import json
 import re
+import time
 from logger import logger 
-import unicodedata
+from config.settings import settings
+from domain.generation_hooks import record_retry, timed_generation
+from domain.retry import backoff_delay
+from domain.tokenizer import count_tokens
+from domain.prompt_prefix import cache_prefix
+from domain.cache_policy import retry_cache_policy
+from domain.json_stream import extract_fields, normalize_text
+from domain.outline_acts import act_count, act_sizes, merge_acts, missing_arcs
 
 MAX_RETRIES = 3
 
+# Схемы структурированного ответа (LLM_STRUCTURED_OUTPUT): провайдер сам гарантирует формат
+CHAPTER_SCHEMA = {
+    "title": "chapter",
+    "type": "object",
+    "properties": {
+        "text": {"type": "string", "description": "полный текст главы"},
+        "summary": {"type": "string", "description": "резюме главы из трёх предложений"},
+    },
+    "required": ["text", "summary"],
+    "additionalProperties": False,
+}
+SUMMARY_SCHEMA = {
+    "title": "summary",
+    "type": "object",
+    "properties": {"summary": {"type": "string", "description": "резюме главы из трёх предложений"}},
+    "required": ["summary"],
+    "additionalProperties": False,
+}
+# Ключи events и summaries зависят от книги — схемой их не описать, просим просто JSON-объект
+JSON_OBJECT = {"type": "object"}
+
 class BookGenerator:
-    def __init__(self, llm_client):
+    def __init__(self, llm_client, input_token_budget: int = None):
         self.llm = llm_client
+        # Бюджет входных токенов на промпт главы (0 — без ограничения)
+        self.input_token_budget = (
+            settings.CHAPTER_INPUT_TOKEN_BUDGET if input_token_budget is None else input_token_budget
+        )
+
+    def json_kwargs(self, schema: dict) -> dict:
+        """Аргументы структурированного ответа для клиента (пусто, если режим выключен)"""
+        return {"json_schema": schema} if settings.LLM_STRUCTURED_OUTPUT else {}
+
+    def count_tokens(self, text: str) -> int:
+        provider = getattr(self.llm, "provider", None)
+        model = getattr(self.llm, "model_name", None)
+        return count_tokens(
+            text,
+            provider=provider if isinstance(provider, str) else "gemini",
+            model=model if isinstance(model, str) else None
+        )
     
-    def generate_outline(self, book_description: str) -> tuple:
-        prompt = f"""
+    def build_outline_prompt(self, book_description: str, chapter_count: int = None) -> str:
+        chapters_hint = f"Ровно {chapter_count} глав" if chapter_count else "От 8 до 12 глав"
+        return f"""
             Создай подробную структуру книги на основе этого описания:
             {book_description}
 
@@ -22,44 +70,247 @@ class BookGenerator:
                 "title": название главы,
                 "events": словарь, где ключи — названия линий, а значения — краткое развитие (по одному предложению)
 
-            Включи от 8 до 12 глав. Обеспечь логичное развитие сюжета по всем линиям.
+            {chapters_hint}. Обеспечь логичное развитие сюжета по всем линиям.
             """
-        
-        try:
-            result = self.llm.generate_text(prompt)
-            if not result or not isinstance(result, str):
-                result = "{}"
 
-            # ✅ Используем extract_json
-            data = self.extract_json(result)
+    def validate_outline(self, data: dict) -> list:
+        """Список проблем ответа со структурой книги (пустой — ответ годен)"""
+        problems = []
+        chapters = data.get("chapters")
+        if not isinstance(chapters, list) or not chapters:
+            return ["chapters"]
+        storylines = data.get("storylines")
+        if not isinstance(storylines, list) or not storylines:
+            problems.append("storylines")
+        elif len(set(map(str, storylines))) != len(storylines):
+            problems.append("storylines.unique")
+        for index, chapter in enumerate(chapters, start=1):
+            if not isinstance(chapter, dict) or not isinstance(chapter.get("events"), dict):
+                problems.append(f"chapters[{index}].events")
+        numbers = [chapter.get("chapter") for chapter in chapters if isinstance(chapter, dict)]
+        if None not in numbers and len(set(numbers)) != len(numbers):
+            problems.append("chapters.numbers")  # в БД номер главы уникален в пределах книги
+        return problems
 
-            if not data:
-                raise ValueError("LLM вернул пустой или нечитаемый ответ")
+    def repair_outline(self, data: dict) -> dict:
+        """
+        Локальный ремонт без повторного запроса: линии — из ключей events, повторы линий убираются,
+        номер и название главы — по порядку (повторяющиеся номера — тоже). Главы без events не чинятся.
+        """
+        chapters = data["chapters"]
+        if isinstance(data.get("storylines"), list):
+            data["storylines"] = list(dict.fromkeys(data["storylines"]))
+        numbers = [chapter.get("chapter") for chapter in chapters if isinstance(chapter, dict)]
+        if len(set(numbers)) != len(numbers):
+            logger.warning("Номера глав повторяются — нумеруем по порядку")
+            for index, chapter in enumerate(chapters, start=1):
+                if isinstance(chapter, dict):
+                    chapter["chapter"] = index
+        if not isinstance(data.get("storylines"), list) or not data["storylines"]:
+            storylines = []
+            for chapter in chapters:
+                for line in (chapter.get("events") or {}) if isinstance(chapter, dict) else ():
+                    if line not in storylines:
+                        storylines.append(line)
+            data["storylines"] = storylines
+            logger.warning(f"Сюжетные линии восстановлены из событий глав: {storylines}")
+        for index, chapter in enumerate(chapters, start=1):
+            if isinstance(chapter, dict):
+                chapter.setdefault("chapter", index)
+                chapter.setdefault("title", f"Глава {chapter['chapter']}")
+        return data
 
-            storylines = data.get("storylines")
-            chapters = data.get("chapters")
+    def parse_outline_response(self, result: str) -> tuple:
+        """Разбирает JSON-ответ модели на (storylines, chapters)"""
+        if not result or not isinstance(result, str):
+            result = "{}"
 
-            if not isinstance(storylines, list) or not isinstance(chapters, list):
-                raise ValueError("storylines и chapters должны быть списками")
+        # ✅ Используем extract_json
+        data = self.extract_json(result)
 
-            if len(storylines) == 0 or len(chapters) == 0:
-                raise ValueError("storylines и chapters не могут быть пустыми")
+        if not data:
+            raise ValueError("LLM вернул пустой или нечитаемый ответ")
 
-            return storylines, chapters
+        if self.validate_outline(data):
+            data = self.repair_outline(data) if isinstance(data.get("chapters"), list) else data
+            problems = self.validate_outline(data)
+            if problems:
+                raise ValueError(f"Некорректная структура книги: {', '.join(problems)}")
 
-        except Exception as e:
-            logger.error(f"Ошибка при генерации сюжета: {e}")
-            raise ValueError("Failed to parse LLM response") from e
+        return data["storylines"], data["chapters"]
+
+    @staticmethod
+    def is_long_outline(chapter_count: int = None) -> bool:
+        """Слишком много глав для одного ответа — сюжет строится по актам (agenerate_outline_by_acts)"""
+        return bool(chapter_count) and chapter_count > settings.OUTLINE_SINGLE_CALL_MAX_CHAPTERS
+
+    @timed_generation("outline")
+    def generate_outline(self, book_description: str, chapter_count: int = None) -> tuple:
+        if self.is_long_outline(chapter_count):
+            return asyncio.run(self.agenerate_outline_by_acts(book_description, chapter_count))
+        prompt = self.build_outline_prompt(book_description, chapter_count)
+
+        for attempt in range(MAX_RETRIES):
+            try:
+                with retry_cache_policy(attempt):
+                    result = self.llm.generate_text(prompt, **self.json_kwargs(JSON_OBJECT))
+                return self.parse_outline_response(result)
+
+            except Exception as e:
+                logger.error(f"Ошибка при генерации сюжета (попытка {attempt + 1}): {e}")
+                if attempt == MAX_RETRIES - 1:
+                    raise ValueError("Failed to parse LLM response") from e
+                record_retry(getattr(self.llm, "provider", "unknown"), "outline")
+                time.sleep(backoff_delay(attempt))
+
+    @timed_generation("outline")
+    async def agenerate_outline(self, book_description: str, chapter_count: int = None) -> tuple:
+        """Асинхронная версия generate_outline — для пакетной генерации нескольких книг"""
+        if self.is_long_outline(chapter_count):
+            return await self.agenerate_outline_by_acts(book_description, chapter_count)
+        prompt = self.build_outline_prompt(book_description, chapter_count)
+
+        for attempt in range(MAX_RETRIES):
+            try:
+                with retry_cache_policy(attempt):
+                    result = await self.llm.agenerate_text(prompt, **self.json_kwargs(JSON_OBJECT))
+                return self.parse_outline_response(result)
+
+            except Exception as e:
+                logger.error(f"Ошибка при генерации сюжета (попытка {attempt + 1}): {e}")
+                if attempt == MAX_RETRIES - 1:
+                    raise ValueError("Failed to parse LLM response") from e
+                record_retry(getattr(self.llm, "provider", "unknown"), "outline")
+                await asyncio.sleep(backoff_delay(attempt))
+
+
+    # --- Иерархический сюжет: акты и арки линий, затем главы каждого акта параллельно ---
+
+    def build_acts_prompt(self, book_description: str, chapter_count: int, acts: int) -> str:
+        return f"""
+            Создай план большой книги ({chapter_count} глав) на основе этого описания:
+            {book_description}
+
+            Раздели книгу ровно на {acts} актов. Верни ТОЛЬКО JSON с такими ключами:
+            - "storylines": список названий сюжетных линий (5–7 штук)
+            - "acts": список актов по порядку с полями:
+                "title": название акта,
+                "summary": что происходит в акте (2–3 предложения),
+                "arcs": словарь, где ключи — названия линий, а значения — развитие линии в этом акте
+
+            Каждая линия должна развиваться в каждом акте.
+            """
+
+    def parse_acts_response(self, result: str) -> tuple:
+        """
+        Разбирает план актов на (storylines, acts). Другое число актов допустимо —
+        главы распределяются по фактическому; без линий или без актов — ошибка.
+        """
+        data = self.extract_json(result if isinstance(result, str) else "")
+        storylines, plan = data.get("storylines"), data.get("acts")
+        if not isinstance(storylines, list) or not storylines:
+            raise ValueError("В плане актов нет сюжетных линий")
+        if not isinstance(plan, list) or not plan or not all(isinstance(act, dict) for act in plan):
+            raise ValueError("В плане нет актов")
+        return storylines, plan
+
+    def build_act_prompt(
+        self, book_description: str, storylines: list, acts: list, act_index: int, first_chapter: int, chapter_count: int
+    ) -> str:
+        plan = "\n".join(
+            f"Акт {number}: {act.get('title', '')} — {act.get('summary', '')}"
+            for number, act in enumerate(acts, start=1)
+        )
+        act = acts[act_index]
+        arcs = json.dumps(act.get("arcs") or {}, ensure_ascii=False)
+        last_chapter = first_chapter + chapter_count - 1
+        return f"""
+            Ты расписываешь по главам один акт книги.
+
+            ОПИСАНИЕ КНИГИ: {book_description}
+
+            ПЛАН ВСЕЙ КНИГИ:
+            {plan}
 
+            ТЕКУЩИЙ АКТ {act_index + 1}: {act.get('title', '')}
+            {act.get('summary', '')}
+            Развитие линий в этом акте: {arcs}
+
+            Глав в этом акте: {chapter_count} (главы {first_chapter}–{last_chapter} книги).
+            Ключи events — ровно эти сюжетные линии: {json.dumps(storylines, ensure_ascii=False)}
+
+            Верни ТОЛЬКО JSON: {{"chapters": [список глав с полями "chapter", "title", "events"]}},
+            где "events" — словарь «линия → краткое развитие (одно предложение)».
+            Каждая линия должна получить хотя бы одно событие в этом акте.
+            """
+
+    def parse_act_response(self, result: str, storylines: list) -> list:
+        """Главы одного акта; акт, в котором какая-то линия не развивается, считается неудачным"""
+        data = self.extract_json(result if isinstance(result, str) else "")
+        chapters = data.get("chapters")
+        problems = self.validate_outline({"storylines": storylines, "chapters": chapters})
+        if problems:
+            raise ValueError(f"Некорректные главы акта: {', '.join(problems)}")
+        missing = missing_arcs(storylines, chapters)
+        if missing:
+            raise ValueError(f"В акте нет событий линий: {', '.join(missing)}")
+        return chapters
+
+    async def _arequest(self, prompt: str, parse, reason: str):
+        """Запрос с разбором ответа и повторами (ошибки провайдера и негодный ответ повторяются одинаково)"""
+        for attempt in range(MAX_RETRIES):
+            try:
+                with retry_cache_policy(attempt):
+                    result = await self.llm.agenerate_text(prompt, **self.json_kwargs(JSON_OBJECT))
+                return parse(result)
+            except Exception as e:
+                logger.error(f"Ошибка при генерации ({reason}, попытка {attempt + 1}): {e}")
+                if attempt == MAX_RETRIES - 1:
+                    raise ValueError("Failed to parse LLM response") from e
+                record_retry(getattr(self.llm, "provider", "unknown"), reason)
+                await asyncio.sleep(backoff_delay(attempt))
+
+    async def agenerate_outline_by_acts(self, book_description: str, chapter_count: int) -> tuple:
+        """
+        Сюжет длинной книги: один запрос на акты и арки линий, затем главы каждого акта —
+        параллельно (не больше LLM_MAX_CONCURRENCY запросов). Время растёт с числом актов
+        в волне, а не с числом глав; ни один ответ не упирается в лимит выходных токенов.
+        """
+        planned = act_count(chapter_count, settings.OUTLINE_CHAPTERS_PER_ACT)
+        storylines, acts = await self._arequest(
+            self.build_acts_prompt(book_description, chapter_count, planned),
+            self.parse_acts_response,
+            "outline_acts"
+        )
+        acts_total = min(len(acts), chapter_count)
+        acts = acts[:acts_total]
+        sizes = act_sizes(chapter_count, acts_total)
+        firsts = [1 + sum(sizes[:index]) for index in range(acts_total)]
+        logger.info(f"План из {acts_total} актов готов, расписываем главы: {sizes}")
+
+        semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+
+        async def expand(act_index: int) -> list:
+            prompt = self.build_act_prompt(
+                book_description, storylines, acts, act_index, firsts[act_index], sizes[act_index]
+            )
+            async with semaphore:
+                return await self._arequest(
+                    prompt, lambda result: self.parse_act_response(result, storylines), "outline_act"
+                )
+
+        act_chapters = await asyncio.gather(*(expand(act_index) for act_index in range(acts_total)))
+        chapters = merge_acts(act_chapters)
+        logger.info(f"Сюжет по актам собран: {len(chapters)} глав, {len(storylines)} линий")
+        return storylines, chapters
 
     def extract_json(self, text: str) -> dict:
         """Извлекает JSON из текста ответа, обрабатывая различные форматы и невидимые символы"""
         if not text or not isinstance(text, str):
             return {}
 
-        # Удаляем zero-width spaces и другие невидимые символы
-        text = re.sub(r'[\u200b\u200c\u200d\u2060\ufeff]', '', text)  # Основные zero-width
-        text = unicodedata.normalize('NFKC', text)  # Нормализация Unicode
+        # Невидимые символы и NFKC — один раз для всего ответа, дальше работаем с подстроками
+        text = normalize_text(text)
 
         try:
             return json.loads(text)
@@ -70,8 +321,7 @@ class BookGenerator:
         match = re.search(r'```(?:json)?\s*\n(.*?)\n```', text, re.DOTALL | re.IGNORECASE)
         if match:
             try:
-                cleaned = re.sub(r'[\u200b\u200c\u200d\u2060\ufeff]', '', match.group(1))
-                return json.loads(cleaned)
+                return json.loads(match.group(1))
             except json.JSONDecodeError as e:
                 logger.warning(f"Не удалось распарсить JSON из блока: {e}")
 
@@ -80,39 +330,120 @@ class BookGenerator:
         end = text.rfind('}')
         if start != -1 and end != -1 and end > start:
             try:
-                fragment = text[start:end+1]
-                fragment = re.sub(r'[\u200b\u200c\u200d\u2060\ufeff]', '', fragment)
-                return json.loads(fragment)
+                return json.loads(text[start:end+1])
             except json.JSONDecodeError as e:
                 logger.warning(f"Не удалось распарсить JSON из фрагмента: {e}")
 
         logger.error(f"❌ Не удалось извлечь JSON из ответа LLM:\n{text}")
         return {}
 
-    def generate_chapter(
-        self, 
-        chapter_data: dict, 
-        book_description: str, 
+    def build_chapter_prompt(
+        self,
+        chapter_data: dict,
+        book_description: str,
         storylines: list,
         previous_summaries: list,
-        chapter_length: str = "800-1200 слов"
-    ) -> tuple:
-        prev_text = "\n".join(previous_summaries) if previous_summaries else "None"
-        
-        prompt = f"""
-            ОПИСАНИЕ КНИГИ: {book_description}
+        chapter_length: str = "800-1200 слов",
+        context_passages: list = None
+    ) -> str:
+        """
+        context_passages — релевантные фрагменты предыдущих глав (ChapterRetriever), уже ограниченные
+        своим бюджетом; входят в обязательную часть промпта.
+        """
+        context_passages = context_passages or []
+        events_json = json.dumps(chapter_data['events'], indent=2, ensure_ascii=False)
 
-            СЮЖЕТНЫЕ ЛИНИИ: {", ".join(storylines)}
+        if not self.input_token_budget:
+            return self._render_chapter_prompt(
+                chapter_data, book_description, storylines, previous_summaries, events_json, chapter_length,
+                context_passages
+            )
+
+        # Сначала — промпт без резюме: это обязательная часть
+        base_prompt = self._render_chapter_prompt(
+            chapter_data, book_description, storylines, [], events_json, chapter_length, context_passages
+        )
+        base_tokens = self.count_tokens(base_prompt)
+
+        if base_tokens > self.input_token_budget:
+            # Сжимаем события (без отступов). Список линий не урезаем: он в общем префиксе,
+            # и промпт должен начинаться с того же chapter_prompt_prefix, что помечен для кэша
+            events_json = json.dumps(chapter_data['events'], ensure_ascii=False)
+            base_prompt = self._render_chapter_prompt(
+                chapter_data, book_description, storylines, [], events_json, chapter_length, context_passages
+            )
+            base_tokens = self.count_tokens(base_prompt)
+            logger.warning(
+                f"Глава {chapter_data['chapter']}: обязательная часть промпта {base_tokens} токенов "
+                f"при бюджете {self.input_token_budget}"
+            )
+
+        fitted = self._fit_summaries(previous_summaries, self.input_token_budget - base_tokens)
+        return self._render_chapter_prompt(
+            chapter_data, book_description, storylines, fitted, events_json, chapter_length, context_passages
+        )
+
+    def _fit_summaries(self, previous_summaries: list, available_tokens: int) -> list:
+        """
+        Оставляет самые свежие резюме, которые помещаются в бюджет.
+        Ранние главы отбрасываются первыми — для продолжения сюжета важнее ближайший контекст.
+        """
+        if not previous_summaries:
+            return []
 
+        fitted = []
+        used = 0
+        for summary in reversed(previous_summaries):
+            tokens = self.count_tokens(summary) + 1  # +1 — перевод строки
+            if used + tokens > available_tokens:
+                break
+            fitted.append(summary)
+            used += tokens
+        fitted.reverse()
+
+        dropped = len(previous_summaries) - len(fitted)
+        if dropped:
+            logger.info(f"Бюджет промпта: опущено резюме ранних глав — {dropped} из {len(previous_summaries)}")
+            fitted.insert(0, f"(резюме {dropped} ранних глав опущены)")
+        return fitted
+
+    def _render_chapter_prompt(
+        self,
+        chapter_data: dict,
+        book_description: str,
+        storylines: list,
+        previous_summaries: list,
+        events_json: str,
+        chapter_length: str,
+        context_passages: list = None
+    ) -> str:
+        prev_text = "\n".join(previous_summaries) if previous_summaries else "None"
+        passages_text = ""
+        if context_passages:
+            joined = "\n\n".join(context_passages)
+            passages_text = f"""
+            ФРАГМЕНТЫ ПРЕДЫДУЩИХ ГЛАВ, СВЯЗАННЫЕ С ЭТОЙ ГЛАВОЙ (сохраняй согласованность деталей):
+            {joined}
+"""
+
+        # Сначала общий для всех глав книги префикс (кэшируется провайдером), затем то, что меняется
+        return self.chapter_prompt_prefix(book_description, storylines, chapter_length) + f"""
             РЕЗЮМЕ ПРЕДЫДУЩИХ ГЛАВ:
             {prev_text}
-
+{passages_text}
             ТРЕБОВАНИЯ К ТЕКУЩЕЙ ГЛАВЕ:
             Глава {chapter_data['chapter']}: {chapter_data['title']}
             Развитие сюжета:
-            {json.dumps(chapter_data['events'], indent=2, ensure_ascii=False)}
+            {events_json}
+            """
 
-            Напиши:
+    def chapter_prompt_prefix(self, book_description: str, storylines: list, chapter_length: str) -> str:
+        """
+        Неизменная для всей книги начальная часть промпта главы: правила ответа, описание, линии.
+        Одинаковый префикс у всех глав позволяет провайдеру кэшировать его (domain/prompt_prefix.py).
+        """
+        return f"""
+            Ты пишешь книгу по главам. Для главы, описанной в конце, напиши:
             1. Полный текст главы ({chapter_length})
             2. Краткое резюме из трёх предложений — только ключевые события
 
@@ -120,36 +451,255 @@ class BookGenerator:
 
             Верни ответ в формате JSON:
             {{"text": "полный текст главы", "summary": "резюме из трёх предложений. Если упоминаешь имена, добавь описания, кто это и что представляет."}}
+
+            ОПИСАНИЕ КНИГИ: {book_description}
+
+            СЮЖЕТНЫЕ ЛИНИИ: {", ".join(storylines)}
+"""
+
+    @staticmethod
+    def validate_chapter(data: dict) -> list:
+        """Поля ответа главы, которые отсутствуют или некорректны (пустой список — ответ годен)"""
+        return [
+            field for field in ("text", "summary")
+            if not isinstance(data.get(field), str) or not data[field].strip()
+        ]
+
+    def split_chapter_response(self, result: str, chapter_number, fields: dict = None) -> tuple:
+        """
+        (текст, резюме) из ответа модели; резюме — None, если его нужно дозапросить (repair_summary).
+        Без текста ответ бесполезен — ValueError, и вызов повторяется целиком.
+        fields — поля, уже извлечённые JSONFieldStream по ходу стрима (ответ не разбирается повторно).
+        Ответ разбирается потоковым парсером за один проход; extract_json — запасной путь для
+        ответов, которые он не понял.
+        """
+        data = fields if fields is not None else extract_fields(result)
+        if self.validate_chapter(data):
+            data = self.extract_json(result) or data
+        problems = self.validate_chapter(data) if data else ["text", "summary"]
+        if "text" in problems:
+            logger.error(f"Error processing chapter {chapter_number}: invalid fields {problems}")
+            raise ValueError(f"Failed to process chapter response: invalid fields {problems}")
+        if problems:
+            logger.warning(f"Глава {chapter_number}: некорректное резюме в ответе — дозапросим только его")
+            return data["text"], None
+        return data["text"], data["summary"]
+
+    def parse_chapter_response(self, result: str, chapter_number) -> tuple:
+        """Разбирает JSON-ответ модели на (текст главы, резюме) — строго, без ремонта"""
+        text, summary = self.split_chapter_response(result, chapter_number)
+        if summary is None:
+            raise ValueError("Failed to process chapter response: invalid fields ['summary']")
+        return text, summary
+
+    def build_summary_plan_prompt(self, book_description: str, storylines: list, chapters: list) -> str:
+        outline = "\n".join(
+            f"Глава {ch['chapter']}: {ch['title']}\n{json.dumps(ch['events'], ensure_ascii=False)}"
+            for ch in chapters
+        )
+        return f"""
+            ОПИСАНИЕ КНИГИ: {book_description}
+
+            СЮЖЕТНЫЕ ЛИНИИ: {", ".join(storylines)}
+
+            ПЛАН ГЛАВ:
+            {outline}
+
+            Для каждой главы из плана напиши краткое резюме из трёх предложений — что в ней произойдёт
+            и чем она закончится. Если упоминаешь имена, добавь описания, кто это.
+
+            ВАЖНО: ВСЁ — НА РУССКОМ ЯЗЫКЕ.
+
+            Верни ТОЛЬКО JSON: {{"summaries": {{"номер главы": "резюме из трёх предложений"}}}}
             """
-        
-        
+
+    @staticmethod
+    def events_summary(chapter_data: dict) -> str:
+        """Резюме из событий сюжета — запасной вариант, если модель не вернула план"""
+        events = "; ".join(f"{line}: {event}" for line, event in chapter_data["events"].items() if event)
+        return f"{chapter_data['title']}. {events}"
+
+    @timed_generation("summary_plan")
+    def plan_summaries(self, book_description: str, storylines: list, chapters: list) -> dict:
+        """
+        Первая фаза конвейерной генерации: плановые резюме глав одним коротким запросом.
+        Они заменяют резюме ещё не написанных глав, поэтому тексты можно писать параллельно.
+        Возвращает {номер главы: резюме}; для глав без ответа — резюме из событий.
+        """
+        planned = {}
+        try:
+            result = self.llm.generate_text(
+                self.build_summary_plan_prompt(book_description, storylines, chapters),
+                **self.json_kwargs(JSON_OBJECT)
+            )
+            summaries = self.extract_json(result).get("summaries") or {}
+            if isinstance(summaries, dict):
+                planned = {int(number): str(text) for number, text in summaries.items() if str(number).isdigit()}
+        except Exception as e:
+            logger.warning(f"Не удалось получить плановые резюме, используем события сюжета: {e}")
+
+        return {
+            ch["chapter"]: planned.get(ch["chapter"]) or self.events_summary(ch)
+            for ch in chapters
+        }
+
+    def build_reconcile_prompt(self, chapter_data: dict, chapter_text: str) -> str:
+        return f"""
+            Глава {chapter_data['chapter']}: {chapter_data['title']}
+
+            ТЕКСТ ГЛАВЫ:
+            {chapter_text}
+
+            Напиши краткое резюме этой главы из трёх предложений — только то, что действительно
+            произошло в тексте. Если упоминаешь имена, добавь описания, кто это.
+
+            ВАЖНО: ВСЁ — НА РУССКОМ ЯЗЫКЕ.
+
+            Верни ТОЛЬКО JSON: {{"summary": "резюме из трёх предложений"}}
+            """
+
+    @timed_generation("summary_reconcile")
+    async def areconcile_summary(self, chapter_data: dict, chapter_text: str, fallback: str) -> str:
+        """Сверка резюме с написанным текстом (необязательная третья фаза). При ошибке — fallback"""
+        try:
+            result = await self.llm.agenerate_text(
+                self.build_reconcile_prompt(chapter_data, chapter_text), **self.json_kwargs(SUMMARY_SCHEMA)
+            )
+            summary = self.extract_json(result).get("summary")
+            if isinstance(summary, str) and summary.strip():
+                return summary
+        except Exception as e:
+            logger.warning(f"Сверка резюме главы {chapter_data['chapter']} не удалась: {e}")
+        return fallback
+
+    @timed_generation("summary_repair")
+    def repair_summary(self, chapter_data: dict, chapter_text: str) -> str:
+        """
+        Ремонт ответа главы: дозапрашиваем только резюме по готовому тексту — короткий вызов
+        вместо повторной генерации всей главы. Если и он не удался — резюме из событий сюжета.
+        """
+        record_retry(getattr(self.llm, "provider", "unknown"), "repair")
+        try:
+            result = self.llm.generate_text(
+                self.build_reconcile_prompt(chapter_data, chapter_text), **self.json_kwargs(SUMMARY_SCHEMA)
+            )
+            summary = self.extract_json(result).get("summary")
+            if isinstance(summary, str) and summary.strip():
+                return summary
+        except Exception as e:
+            logger.warning(f"Ремонт резюме главы {chapter_data['chapter']} не удался: {e}")
+        return self.events_summary(chapter_data)
+
+    @timed_generation("summary_repair")
+    async def arepair_summary(self, chapter_data: dict, chapter_text: str) -> str:
+        """Асинхронная версия repair_summary"""
+        record_retry(getattr(self.llm, "provider", "unknown"), "repair")
+        try:
+            result = await self.llm.agenerate_text(
+                self.build_reconcile_prompt(chapter_data, chapter_text), **self.json_kwargs(SUMMARY_SCHEMA)
+            )
+            summary = self.extract_json(result).get("summary")
+            if isinstance(summary, str) and summary.strip():
+                return summary
+        except Exception as e:
+            logger.warning(f"Ремонт резюме главы {chapter_data['chapter']} не удался: {e}")
+        return self.events_summary(chapter_data)
+
+    def build_digest_prompt(self, parts: list, start_chapter: int, end_chapter: int) -> str:
+        joined = "\n".join(parts)
+        return f"""
+            Ниже — краткие резюме глав {start_chapter}–{end_chapter} книги (по порядку):
+            {joined}
+
+            Сожми их в одно связное резюме из 4–6 предложений: ключевые события, изменения
+            в положении героев и открытые сюжетные линии. Если упоминаешь имена, добавь, кто это.
+
+            ВАЖНО: ВСЁ — НА РУССКОМ ЯЗЫКЕ. Верни только текст резюме, без JSON и заголовков.
+            """
+
+    @timed_generation("summary_digest")
+    def summarize_digest(self, parts: list, start_chapter: int, end_chapter: int) -> str:
+        """Дайджест диапазона глав для компактного контекста длинных книг"""
+        result = self.llm.generate_text(self.build_digest_prompt(parts, start_chapter, end_chapter))
+        text = normalize_text(result or "").strip()
+        if not text:
+            raise ValueError(f"LLM вернул пустой дайджест глав {start_chapter}–{end_chapter}")
+        return text
+
+    @timed_generation("summary_digest")
+    async def asummarize_digest(self, parts: list, start_chapter: int, end_chapter: int) -> str:
+        """Асинхронная версия summarize_digest"""
+        result = await self.llm.agenerate_text(self.build_digest_prompt(parts, start_chapter, end_chapter))
+        text = normalize_text(result or "").strip()
+        if not text:
+            raise ValueError(f"LLM вернул пустой дайджест глав {start_chapter}–{end_chapter}")
+        return text
+
+    @timed_generation("chapter")
+    def generate_chapter(
+        self, 
+        chapter_data: dict, 
+        book_description: str, 
+        storylines: list,
+        previous_summaries: list,
+        chapter_length: str = "800-1200 слов",
+        context_passages: list = None
+    ) -> tuple:
+        prompt = self.build_chapter_prompt(
+            chapter_data, book_description, storylines, previous_summaries, chapter_length, context_passages
+        )
+        prefix = self.chapter_prompt_prefix(book_description, storylines, chapter_length)
+
+        # Повторяем и ошибки провайдера, и ответы без текста главы
         for attempt in range(MAX_RETRIES):
             try:
-                result = self.llm.generate_text(prompt)
+                with cache_prefix(prefix), retry_cache_policy(attempt):
+                    result = self.llm.generate_text(prompt, **self.json_kwargs(CHAPTER_SCHEMA))
+                text, summary = self.split_chapter_response(result, chapter_data['chapter'])
+                break
             except Exception as e:
                 logger.warning(f"Attempt {attempt+1} failed: {e}")
                 if attempt == MAX_RETRIES - 1:
                     raise
-            
-        try:
-            # Используем улучшенный парсинг JSON
-            data = self.extract_json(result)
-            
-            if not data:
-                raise ValueError("Empty JSON response")
-            
-            # Проверяем наличие обязательных полей
-            if "text" not in data or "summary" not in data:
-                raise KeyError("Missing required fields in response")
-            
-            return data["text"], data["summary"]
-        
-        except (ValueError, KeyError, json.JSONDecodeError) as e:
-            # Сохраняем проблемный ответ для отладки
-            # error_filename = f"error_chapter_{chapter_data['chapter']}.txt"
-            # with open(error_filename, "w", encoding="utf-8") as f:
-                # f.write(f"Prompt:\n{prompt}\n\nResponse:\n{result}")
-            
-            logger.error(f"Error processing chapter {chapter_data['chapter']}: {e}")
-            # logger.error(f"Full error response saved to {error_filename}")
-            raise ValueError(f"Failed to process chapter response: {e}") from e
\ No newline at end of file
+                record_retry(getattr(self.llm, "provider", "unknown"), "generator")
+                time.sleep(backoff_delay(attempt))
+
+        if summary is None:
+            summary = self.repair_summary(chapter_data, text)
+        return text, summary
+
+    @timed_generation("chapter")
+    async def agenerate_chapter(
+        self,
+        chapter_data: dict,
+        book_description: str,
+        storylines: list,
+        previous_summaries: list,
+        chapter_length: str = "800-1200 слов",
+        context_passages: list = None
+    ) -> tuple:
+        """
+        Асинхронная версия generate_chapter — для глав, чей контекст уже известен
+        (их можно писать одновременно через BoundedExecutor).
+        """
+        prompt = self.build_chapter_prompt(
+            chapter_data, book_description, storylines, previous_summaries, chapter_length, context_passages
+        )
+        prefix = self.chapter_prompt_prefix(book_description, storylines, chapter_length)
+
+        for attempt in range(MAX_RETRIES):
+            try:
+                with cache_prefix(prefix), retry_cache_policy(attempt):
+                    result = await self.llm.agenerate_text(prompt, **self.json_kwargs(CHAPTER_SCHEMA))
+                text, summary = self.split_chapter_response(result, chapter_data['chapter'])
+                break
+            except Exception as e:
+                logger.warning(f"Attempt {attempt+1} failed: {e}")
+                if attempt == MAX_RETRIES - 1:
+                    raise
+                record_retry(getattr(self.llm, "provider", "unknown"), "generator")
+                await asyncio.sleep(backoff_delay(attempt))
+
+        if summary is None:
+            summary = await self.arepair_summary(chapter_data, text)
+        return text, summary
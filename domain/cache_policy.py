@@ -0,0 +1,29 @@
+# domain/cache_policy.py
+"""
+Обход кэша ответов LLM без зависимости домена от инфраструктуры. Повтор после ответа,
+который не прошёл проверку, должен уйти к провайдеру: кэш вернул бы тот же негодный ответ.
+Кэш (infrastructure/llm_cache.py) в таком режиме не читает запись, а перезаписывает её свежим ответом.
+"""
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+_fresh: ContextVar[bool] = ContextVar("llm_fresh_response", default=False)
+
+
+@contextmanager
+def fresh_response():
+    """Запросы внутри блока идут мимо кэша ответов; новый ответ заменяет закэшированный"""
+    token = _fresh.set(True)
+    try:
+        yield
+    finally:
+        _fresh.reset(token)
+
+
+def retry_cache_policy(attempt: int):
+    """Первая попытка может взять ответ из кэша, повторы — только свежий"""
+    return fresh_response() if attempt else nullcontext()
+
+
+def fresh_response_required() -> bool:
+    return _fresh.get()
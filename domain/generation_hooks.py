@@ -0,0 +1,44 @@
+# domain/generation_hooks.py
+"""
+Наблюдение за операциями BookGenerator без зависимости домена от инфраструктуры.
+Метрики подключаются через set_generation_observer (см. infrastructure/metrics.py);
+пока наблюдатель не задан, хуки ничего не делают.
+"""
+import functools
+import inspect
+from contextlib import nullcontext
+
+_observer = None
+
+
+def set_generation_observer(observer):
+    """observer.observe_generation(operation) — контекстный менеджер, observer.record_retry(provider, reason)"""
+    global _observer
+    _observer = observer
+
+
+def observe_generation(operation: str):
+    return _observer.observe_generation(operation) if _observer else nullcontext()
+
+
+def timed_generation(operation: str):
+    """Декоратор для методов BookGenerator (sync и async)"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with observe_generation(operation):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with observe_generation(operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_retry(provider: str, reason: str):
+    if _observer:
+        _observer.record_retry(provider, reason)
@@ -0,0 +1,44 @@
+# domain/invalidation.py
+from typing import Iterable, List
+
+PROPAGATION_POLICIES = ("none", "window", "all")
+
+
+def stale_chapters(edited: int, written: Iterable[int], policy: str = "window", window: int = 2) -> List[int]:
+    """
+    Главы, которые устарели после правки событий главы edited.
+
+    Граф зависимостей: глава N зависит от своих событий и от резюме глав < N. Правка событий
+    главы edited делает устаревшей её саму; её новое резюме изменит контекст всех следующих глав,
+    поэтому policy ограничивает, насколько далеко вниз распространяется устаревание:
+      none   — только сама глава;
+      window — плюс window следующих написанных глав (им резюме правленой главы достаётся дословно);
+      all    — все следующие написанные главы.
+    written — номера уже написанных глав: ненаписанные перегенерировать нечего, а ненаписанная
+    правленая глава ещё не попала в контекст следующих (её резюме нет), и устаревших нет вовсе.
+    """
+    if policy not in PROPAGATION_POLICIES:
+        raise ValueError(f"Неизвестная политика устаревания: {policy}")
+
+    written = sorted(set(written))
+    if edited not in written:
+        return []
+    return [edited] + stale_after(edited + 1, written, policy=policy, window=window)
+
+
+def stale_after(position: int, written: Iterable[int], policy: str = "window", window: int = 2) -> List[int]:
+    """
+    Главы, которые устарели после вставки или удаления главы: position — номер (в новой нумерации)
+    первой главы, чей контекст изменился. Правленой написанной главы здесь нет, поэтому
+    policy задаёт только распространение вниз: none — ничего, window — window написанных глав
+    начиная с position, all — все написанные главы начиная с position.
+    """
+    if policy not in PROPAGATION_POLICIES:
+        raise ValueError(f"Неизвестная политика устаревания: {policy}")
+
+    downstream = [number for number in sorted(set(written)) if number >= position]
+    if policy == "window":
+        downstream = downstream[:max(0, window)]
+    elif policy == "none":
+        downstream = []
+    return downstream
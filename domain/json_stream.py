@@ -0,0 +1,169 @@
+# domain/json_stream.py
+import re
+import unicodedata
+from typing import Dict, Iterable, Optional
+
+# Невидимые символы, которые модели иногда вставляют в ответ
+ZERO_WIDTH_RE = re.compile('[\u200b\u200c\u200d\u2060\ufeff]')
+_ZERO_WIDTH = frozenset('\u200b\u200c\u200d\u2060\ufeff')
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+def normalize_text(text: str) -> str:
+    """Одна нормализация готового значения: без zero-width символов, NFKC"""
+    return unicodedata.normalize('NFKC', ZERO_WIDTH_RE.sub('', text))
+
+
+class JSONFieldStream:
+    """
+    Инкрементальный разбор ответа вида {"text": "...", "summary": "..."} по мере прихода кусков.
+
+    Строковые поля верхнего уровня декодируются посимвольно за один проход: feed() возвращает
+    новые куски значений (для показа в потоке), а готовые поля появляются в completed сразу,
+    как только закрылась их строка — не дожидаясь конца ответа. Нормализация (NFKC) делается
+    один раз над готовым значением. Преамбула до первой «{» (```json и т.п.) пропускается;
+    значения других полей (числа, вложенные объекты) пропускаются без разбора.
+    """
+    def __init__(self, fields: Iterable[str] = ("text", "summary")):
+        self.fields = set(fields)
+        self.completed: Dict[str, str] = {}
+        self.finished = False  # закрыта фигурная скобка верхнего уровня
+        self._state = "preamble"
+        self._key = []
+        self._value = []
+        self._current = None  # имя поля, чья строка сейчас читается
+        self._escape = None  # незаконченная escape-последовательность на стыке кусков
+        self._depth = 0  # вложенность пропускаемого значения
+        self._skip_in_string = False
+
+    def partial(self, field: str) -> Optional[str]:
+        """Уже полученная часть поля (без нормализации) — или готовое значение"""
+        if field in self.completed:
+            return self.completed[field]
+        if field == self._current:
+            return "".join(self._value)
+        return None
+
+    def feed(self, chunk: str) -> Dict[str, str]:
+        """Принимает очередной кусок ответа, возвращает {поле: новый декодированный текст}"""
+        deltas: Dict[str, list] = {}
+        for char in chunk:
+            state = self._state
+            if state == "string":
+                decoded = self._string_char(char)
+                if decoded and self._current in self.fields:
+                    deltas.setdefault(self._current, []).append(decoded)
+            elif char in _ZERO_WIDTH:
+                continue
+            elif state == "preamble":
+                if char == "{":
+                    self._state = "key_or_end"
+            elif state == "key_or_end":
+                if char == '"':
+                    self._key = []
+                    self._state = "key"
+                elif char == "}":
+                    self._finish()
+            elif state == "key":
+                if self._escape is not None or char == "\\":
+                    self._escape = None if self._escape is not None else ""
+                    self._key.append(char)
+                elif char == '"':
+                    self._state = "colon"
+                else:
+                    self._key.append(char)
+            elif state == "colon":
+                if char == ":":
+                    self._state = "value"
+            elif state == "value":
+                if char == '"':
+                    self._current = "".join(self._key)
+                    self._value = []
+                    self._state = "string"
+                elif not char.isspace():
+                    self._current = None
+                    self._depth = 1 if char in "{[" else 0
+                    self._state = "skip"
+                    if not self._depth:
+                        self._skip_scalar(char)
+            elif state == "skip":
+                self._skip_char(char)
+            elif state == "comma":
+                if char == ",":
+                    self._state = "key_or_end"
+                elif char == "}":
+                    self._finish()
+        return {field: "".join(parts) for field, parts in deltas.items()}
+
+    def _finish(self):
+        self.finished = True
+        self._state = "done"
+
+    def _string_char(self, char: str) -> str:
+        if self._escape is not None:
+            self._escape += char
+            if self._escape[0] == "u":
+                if len(self._escape) < 5:
+                    return ""
+                decoded = chr(int(self._escape[1:], 16))
+            else:
+                decoded = _ESCAPES.get(self._escape, self._escape)
+            self._escape = None
+            return self._append(decoded)
+        if char == "\\":
+            self._escape = ""
+            return ""
+        if char == '"':
+            if self._current in self.fields:
+                self.completed[self._current] = normalize_text(self._join_surrogates())
+            self._current = None
+            self._value = []
+            self._state = "comma"
+            return ""
+        return self._append(char)
+
+    def _append(self, decoded: str) -> str:
+        if self._current in self.fields:
+            self._value.append(decoded)
+        return decoded
+
+    def _join_surrogates(self) -> str:
+        # 😀 приходят двумя escape-последовательностями — склеиваем в один символ;
+        # половина пары без второй (ответ оборвался посреди неё) становится U+FFFD, а не исключением
+        value = "".join(self._value)
+        if any("\ud800" <= ch <= "\udfff" for ch in value):
+            value = value.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+        return value
+
+    def _skip_scalar(self, char: str):
+        if char == ",":
+            self._state = "key_or_end"
+        elif char == "}":
+            self._finish()
+
+    def _skip_char(self, char: str):
+        if self._depth == 0:
+            self._skip_scalar(char)
+            return
+        if self._skip_in_string:
+            if self._escape is not None:
+                self._escape = None
+            elif char == "\\":
+                self._escape = ""
+            elif char == '"':
+                self._skip_in_string = False
+        elif char == '"':
+            self._skip_in_string = True
+        elif char in "{[":
+            self._depth += 1
+        elif char in "}]":
+            self._depth -= 1
+            if self._depth == 0:
+                self._state = "comma"
+
+
+def extract_fields(text: str, fields: Iterable[str] = ("text", "summary")) -> Dict[str, str]:
+    """Разбор готового ответа тем же потоковым парсером — один проход, без копий подстрок"""
+    stream = JSONFieldStream(fields)
+    stream.feed(text)
+    return stream.completed
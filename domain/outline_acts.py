@@ -0,0 +1,38 @@
+# domain/outline_acts.py
+import math
+from typing import List
+
+
+def act_count(total_chapters: int, chapters_per_act: int) -> int:
+    return max(1, math.ceil(total_chapters / max(1, chapters_per_act)))
+
+
+def act_sizes(total_chapters: int, acts: int) -> List[int]:
+    """Число глав в каждом акте: поровну, остаток — первым актам (10 глав на 3 акта → 4, 3, 3)"""
+    base, extra = divmod(total_chapters, acts)
+    return [base + (1 if index < extra else 0) for index in range(acts)]
+
+
+def missing_arcs(storylines: List[str], chapters: List[dict]) -> List[str]:
+    """Линии, у которых нет ни одного непустого события в этих главах (акт их потерял)"""
+    present = {
+        line
+        for chapter in chapters
+        for line, description in (chapter.get("events") or {}).items()
+        if description and str(description).strip()
+    }
+    return [line for line in storylines if line not in present]
+
+
+def merge_acts(act_chapters: List[List[dict]]) -> List[dict]:
+    """Склеивает главы актов по порядку и нумерует их заново с 1 (модель нумерует акты как попало)"""
+    chapters = []
+    for chapters_of_act in act_chapters:
+        for chapter in chapters_of_act:
+            number = len(chapters) + 1
+            chapters.append({
+                **chapter,
+                "chapter": number,
+                "title": chapter.get("title") or f"Глава {number}",
+            })
+    return chapters
@@ -0,0 +1,74 @@
+# domain/outline_merge.py
+import re
+from difflib import SequenceMatcher
+from typing import Dict, List, Tuple
+
+TITLE_SIMILARITY = 0.75  # минимальная похожесть названий, чтобы считать главу/линию той же самой
+SAME_NUMBER_BONUS = 0.1  # при равной похожести предпочитаем главу с тем же номером
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", (text or "").lower().replace("ё", "е")).strip(" .!?«»\"'")
+
+
+def similarity(a: str, b: str) -> float:
+    a, b = _normalize(a), _normalize(b)
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def _greedy(scores: List[Tuple[float, int, int]], threshold: float) -> Dict[int, int]:
+    """Пары (новый индекс → старый индекс) по убыванию score, каждый элемент — не больше одного раза"""
+    pairs, used = {}, set()
+    for score, new_index, old_index in sorted(scores, key=lambda item: -item[0]):
+        if score < threshold or new_index in pairs or old_index in used:
+            continue
+        pairs[new_index] = old_index
+        used.add(old_index)
+    return pairs
+
+
+def match_storylines(new_names: List[str], old_names: List[str], threshold: float = TITLE_SIMILARITY) -> Dict[int, int]:
+    """Сопоставляет новые сюжетные линии старым по названию (переименование линии — та же линия)"""
+    scores = [
+        (similarity(new, old), i, j)
+        for i, new in enumerate(new_names)
+        for j, old in enumerate(old_names)
+    ]
+    return _greedy(scores, threshold)
+
+
+def match_chapters(
+    new_chapters: List[Tuple[int, str]],
+    old_chapters: List[Tuple[int, str]],
+    threshold: float = TITLE_SIMILARITY
+) -> Dict[int, int]:
+    """
+    Сопоставляет главы нового сюжета существующим: (номер, название) → индекс старой главы.
+    Сначала по похожести названий (глава могла сместиться), затем оставшиеся — по совпадению номера.
+    """
+    scores = [
+        (similarity(new_title, old_title) + (SAME_NUMBER_BONUS if new_number == old_number else 0.0), i, j)
+        for i, (new_number, new_title) in enumerate(new_chapters)
+        for j, (old_number, old_title) in enumerate(old_chapters)
+    ]
+    pairs = _greedy(scores, threshold)
+
+    used = set(pairs.values())
+    old_by_number = {number: j for j, (number, _) in enumerate(old_chapters) if j not in used}
+    for i, (number, _) in enumerate(new_chapters):
+        j = old_by_number.get(number)
+        if i not in pairs and j is not None:
+            pairs[i] = j
+            used.add(j)
+    return pairs
+
+
+def normalize_events(events: dict) -> Dict[str, str]:
+    """События главы без пустых значений и лишних пробелов — для сравнения старого и нового сюжета"""
+    return {
+        line: str(description).strip()
+        for line, description in (events or {}).items()
+        if description is not None and str(description).strip()
+    }
@@ -0,0 +1,30 @@
+# domain/prompt_prefix.py
+"""
+Разметка общего префикса промпта для кэша провайдера. Домен только помечает префикс;
+сам кэш (хэндлы Gemini, OpenAI prompt caching, симуляция) — в infrastructure/prompt_cache.py.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from config.settings import settings
+
+_current_prefix: ContextVar[Optional[str]] = ContextVar("prompt_cache_prefix", default=None)
+
+
+@contextmanager
+def cache_prefix(prefix: str):
+    """
+    Помечает общий для всех глав книги префикс промпта (описание, линии, правила ответа):
+    провайдер кэширует его — Gemini cached content, OpenAI prompt caching, fake — симуляция.
+    """
+    token = _current_prefix.set(prefix if settings.PROMPT_CACHE_ENABLED else None)
+    try:
+        yield
+    finally:
+        _current_prefix.reset(token)
+
+
+def current_prefix() -> Optional[str]:
+    """Префикс, помеченный ближайшим cache_prefix, или None"""
+    return _current_prefix.get()
@@ -0,0 +1,13 @@
+# domain/retry.py
+import random
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0, retry_after: float = None) -> float:
+    """
+    Экспоненциальная задержка с полным джиттером (attempt считается с 0).
+    Если провайдер прислал Retry-After — ждём не меньше него.
+    """
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
@@ -0,0 +1,96 @@
+# domain/tokenizer.py
+import hashlib
+import os
+import re
+import tempfile
+from functools import lru_cache
+
+from logger import logger
+
+# Слова (буквы/цифры), отдельные знаки пунктуации и прочие символы
+_TOKEN_RE = re.compile(r"[A-Za-z]+|[Ѐ-ӿ]+|\d+|[^\sA-Za-zЀ-ӿ\d]")
+
+# Сколько символов в среднем приходится на токен (замерено на русской и английской прозе)
+_CHARS_PER_TOKEN = {
+    "gemini": {"latin": 4.0, "cyrillic": 3.2},
+    "openai": {"latin": 4.0, "cyrillic": 2.6},
+}
+
+
+def _bpe_cached(encoding_name: str) -> bool:
+    """
+    Лежит ли BPE-файл кодировки в локальном кэше tiktoken (тот же путь, что у tiktoken.load):
+    иначе get_encoding скачивает его при первом вызове, и без сети подсчёт токенов повиснет.
+    """
+    if "TIKTOKEN_CACHE_DIR" in os.environ:
+        cache_dir = os.environ["TIKTOKEN_CACHE_DIR"]
+    elif "DATA_GYM_CACHE_DIR" in os.environ:
+        cache_dir = os.environ["DATA_GYM_CACHE_DIR"]
+    else:
+        cache_dir = os.path.join(tempfile.gettempdir(), "data-gym-cache")
+    if not cache_dir:
+        return False
+    blob = f"https://openaipublic.blob.core.windows.net/encodings/{encoding_name}.tiktoken"
+    return os.path.exists(os.path.join(cache_dir, hashlib.sha1(blob.encode()).hexdigest()))
+
+
+@lru_cache(maxsize=8)
+def _tiktoken_encoding(model: str):
+    """
+    tiktoken — необязательная зависимость: если её нет, кодировка не скачана заранее
+    или не загрузилась, используем локальную оценку
+    """
+    try:
+        import tiktoken
+        from tiktoken.model import encoding_name_for_model
+    except ImportError:
+        return None
+    try:
+        name = encoding_name_for_model(model)
+    except KeyError:
+        name = "cl100k_base"
+    if not _bpe_cached(name):
+        logger.info(f"Кодировка tiktoken {name} не скачана — токены {model} считаются оценкой")
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning(f"Не удалось загрузить кодировку tiktoken {name}, токены считаются оценкой: {e}")
+        return None
+
+
+def _piece_tokens(length: int, chars_per_token: float) -> int:
+    return max(1, round(length / chars_per_token))
+
+
+def estimate_tokens(text: str, provider: str = "gemini") -> int:
+    """
+    Локальная оценка числа токенов без обращения к сети.
+    В отличие от len(text.split()) учитывает, что кириллица дробится на токены сильнее латиницы.
+    """
+    if not text:
+        return 0
+    ratios = _CHARS_PER_TOKEN.get(provider, _CHARS_PER_TOKEN["gemini"])
+    tokens = 0
+    for piece in _TOKEN_RE.findall(text):
+        first = piece[0]
+        if first.isascii() and first.isalpha():
+            tokens += _piece_tokens(len(piece), ratios["latin"])
+        elif "Ѐ" <= first <= "ӿ":
+            tokens += _piece_tokens(len(piece), ratios["cyrillic"])
+        elif first.isdigit():
+            tokens += _piece_tokens(len(piece), 3)
+        else:
+            tokens += 1
+    return tokens
+
+
+def count_tokens(text: str, provider: str = "gemini", model: str = None) -> int:
+    """Число токенов для провайдера: точный подсчёт через tiktoken для OpenAI (если установлен), иначе оценка"""
+    if not text:
+        return 0
+    if provider == "openai" and model:
+        encoding = _tiktoken_encoding(model)
+        if encoding is not None:
+            return len(encoding.encode(text))
+    return estimate_tokens(text, provider)
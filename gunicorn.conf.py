@@ -0,0 +1,23 @@
+# gunicorn.conf.py
+import os
+import shutil
+
+# Метрики Prometheus общие для всех воркеров gunicorn. Переменная задаётся здесь, а не в образе:
+# фоновый воркер очереди (cli/job_worker.py) gunicorn не запускает, ему multiprocess-режим не нужен
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus")
+
+from prometheus_client import multiprocess  # после PROMETHEUS_MULTIPROC_DIR — режим выбирается при импорте
+
+
+def on_starting(server):
+    """Каталог метрик очищаем при старте мастера — иначе подхватятся счётчики прошлого запуска"""
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Метрики завершившегося воркера больше не должны учитываться как «живые»"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,55 @@
+# infrastructure/async_executor.py
+import asyncio
+from typing import Any, Awaitable, Callable, Iterable, List
+
+from config.settings import settings
+from logger import logger
+
+
+class BoundedExecutor:
+    """
+    Запускает корутины конкурентно, но не больше max_concurrency одновременно
+    (чтобы не упереться в квоты провайдера и лимиты соединений).
+    """
+    def __init__(self, max_concurrency: int = None):
+        self.max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+        self._semaphore = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Семафор создаётся внутри работающего event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def submit(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        async with self.semaphore:
+            return await func(*args, **kwargs)
+
+    async def map(
+        self,
+        func: Callable[[Any], Awaitable[Any]],
+        items: Iterable[Any],
+        return_exceptions: bool = False
+    ) -> List[Any]:
+        """
+        Применяет func к каждому элементу. Результаты — в порядке items.
+        return_exceptions=True — ошибки возвращаются вместо результата, остальные задачи не отменяются.
+        """
+        items = list(items)
+        logger.debug(f"BoundedExecutor: {len(items)} задач, параллельно до {self.max_concurrency}")
+        return await asyncio.gather(
+            *(self.submit(func, item) for item in items),
+            return_exceptions=return_exceptions
+        )
+
+
+def run_bounded(
+    func: Callable[[Any], Awaitable[Any]],
+    items: Iterable[Any],
+    max_concurrency: int = None,
+    return_exceptions: bool = False
+) -> List[Any]:
+    """Синхронная обёртка для CLI и веб-слоя: выполняет BoundedExecutor.map в новом event loop"""
+    executor = BoundedExecutor(max_concurrency)
+    return asyncio.run(executor.map(func, items, return_exceptions=return_exceptions))
@@ -0,0 +1,92 @@
+# infrastructure/chapter_store.py
+import hashlib
+import zlib
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import delete, exists, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session as DBSession
+
+from config.settings import settings
+from infrastructure.database.models import Chapter, ChapterBody
+from logger import logger
+
+
+@lru_cache(maxsize=1)
+def _zstd():
+    """zstandard — необязательная зависимость: без неё пишем zlib"""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def body_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def encode_body(text: str, codec: str = None, level: int = None) -> Tuple[str, bytes, int]:
+    """(кодек, сжатые байты, длина несжатого UTF-8)"""
+    codec = codec or settings.CHAPTER_BODY_CODEC
+    level = settings.CHAPTER_BODY_LEVEL if level is None else level
+    raw = text.encode("utf-8")
+    if codec == "zstd":
+        if _zstd() is not None:
+            return "zstd", _zstd().ZstdCompressor(level=level).compress(raw), len(raw)
+        logger.warning("Пакет zstandard не установлен — тексты глав сжимаются zlib")
+    return "zlib", zlib.compress(raw, level), len(raw)
+
+
+def decode_body(codec: str, data: bytes) -> str:
+    if codec == "zstd":
+        if _zstd() is None:
+            raise RuntimeError("Текст главы сжат zstd, а пакет zstandard не установлен")
+        return _zstd().ZstdDecompressor().decompress(data).decode("utf-8")
+    return zlib.decompress(data).decode("utf-8")
+
+
+class ChapterBodyStore:
+    """
+    Тексты глав вне строки chapters: сжатые, по sha256 содержимого. Chapter хранит только
+    body_hash/body_bytes, поэтому выборки по главам не читают прозу; текст загружается
+    явно — на странице главы и при экспорте. Без commit — транзакцией управляет вызывающий.
+    """
+    def __init__(self, session: DBSession):
+        self.session = session
+
+    def put(self, text: str) -> Tuple[str, int]:
+        """Сохраняет текст (повторный — не дублируется), возвращает (hash, длина в байтах)"""
+        key = body_hash(text)
+        codec, data, length = encode_body(text)
+        self.session.execute(
+            insert(ChapterBody)
+            .values(hash=key, codec=codec, data=data, byte_length=length)
+            .on_conflict_do_nothing(index_elements=["hash"])
+        )
+        return key, length
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        if not key:
+            return None
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        keys = [key for key in set(keys) if key]
+        if not keys:
+            return {}
+        rows = self.session.execute(
+            select(ChapterBody.hash, ChapterBody.codec, ChapterBody.data).where(ChapterBody.hash.in_(keys))
+        )
+        return {key: decode_body(codec, data) for key, codec, data in rows}
+
+    def prune(self, keys: Iterable[str] = None) -> int:
+        """Удаляет тексты, на которые не ссылается ни одна глава (только среди keys, если заданы)"""
+        statement = delete(ChapterBody).where(~exists().where(Chapter.body_hash == ChapterBody.hash))
+        if keys is not None:
+            keys = [key for key in set(keys) if key]
+            if not keys:
+                return 0
+            statement = statement.where(ChapterBody.hash.in_(keys))
+        return self.session.execute(statement, execution_options={"synchronize_session": False}).rowcount
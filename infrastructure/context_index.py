@@ -0,0 +1,145 @@
+# infrastructure/context_index.py
+import math
+import re
+from collections import Counter
+from typing import Callable, List, Optional
+
+from config.settings import settings
+from logger import logger
+
+_WORD_RE = re.compile(r"[a-zа-яё0-9]+")
+_NAME_RE = re.compile(r"(?<![.!?]\s)(?<!^)\b([A-ZА-ЯЁ][a-zа-яё]{2,})")
+_STEM_LENGTH = 6  # грубый стемминг: русские окончания отрезаются, корень остаётся
+
+
+def terms(text: str) -> List[str]:
+    """Слова текста, приведённые к «основе» (нижний регистр, первые 6 букв, без коротких слов)"""
+    return [word[:_STEM_LENGTH] for word in _WORD_RE.findall(text.lower().replace("ё", "е")) if len(word) > 2]
+
+
+def split_passages(text: str, max_chars: int = None) -> List[str]:
+    """Режет текст главы на фрагменты по абзацам, не длиннее max_chars (короткие абзацы склеиваются)"""
+    max_chars = max_chars or settings.RETRIEVAL_PASSAGE_CHARS
+    passages, current = [], ""
+    for paragraph in (p.strip() for p in re.split(r"\n\s*\n|\n", text or "")):
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 1 > max_chars:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n{paragraph}" if current else paragraph
+        # Очень длинный абзац режем по предложениям
+        while len(current) > max_chars:
+            cut = current.rfind(". ", 0, max_chars)
+            cut = cut + 1 if cut > 0 else max_chars
+            passages.append(current[:cut].strip())
+            current = current[cut:].strip()
+    if current:
+        passages.append(current)
+    return passages
+
+
+class BM25Index:
+    """BM25 по списку фрагментов — чистый Python, без внешних сервисов"""
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_terms = [Counter(terms(doc)) for doc in documents]
+        self.doc_lengths = [sum(counts.values()) for counts in self.doc_terms]
+        self.avg_length = (sum(self.doc_lengths) / len(documents)) if documents else 0.0
+        df = Counter()
+        for counts in self.doc_terms:
+            df.update(counts.keys())
+        n = len(documents)
+        self.idf = {term: math.log((n - freq + 0.5) / (freq + 0.5) + 1) for term, freq in df.items()}
+
+    def score(self, query: Counter, index: int) -> float:
+        counts = self.doc_terms[index]
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[index] / (self.avg_length or 1))
+        total = 0.0
+        for term, weight in query.items():
+            tf = counts.get(term)
+            if tf:
+                total += weight * self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+        return total
+
+    def search(self, query: Counter, k: int = None) -> List[tuple]:
+        """[(индекс документа, score)] по убыванию score, только совпавшие"""
+        scored = [(i, self.score(query, i)) for i in range(len(self.doc_terms))]
+        scored = [item for item in scored if item[1] > 0]
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:k] if k else scored
+
+
+def build_query(chapter_data: dict) -> Counter:
+    """
+    Запрос для главы: название, сюжетные линии с событиями и сами события.
+    Имена (слова с заглавной буквы не в начале предложения) весят вдвое больше.
+    """
+    active = {line: event for line, event in chapter_data["events"].items() if event}
+    query = Counter(terms(" ".join([chapter_data.get("title", ""), *active.keys(), *active.values()])))
+    for event in active.values():
+        for name in _NAME_RE.findall(event):
+            for term in terms(name):
+                query[term] += 1
+    return query
+
+
+class ChapterRetriever:
+    """
+    Выбирает из фрагментов предыдущих глав (резюме и абзацы, таблица chapter_passages)
+    top_k самых релевантных текущей главе — в пределах token_budget.
+    Индекс пополняется в OutlineManager.update_chapter_summary; главы, записанные до включения
+    поиска, индексируются при первом обращении.
+    """
+    def __init__(
+        self,
+        manager,
+        book_id: int,
+        top_k: int = None,
+        token_budget: int = None,
+        count_tokens: Optional[Callable[[str], int]] = None
+    ):
+        self.manager = manager
+        self.book_id = book_id
+        self.top_k = top_k or settings.RETRIEVAL_TOP_K
+        self.token_budget = settings.RETRIEVAL_TOKEN_BUDGET if token_budget is None else token_budget
+        self.count_tokens = count_tokens or (lambda text: len(terms(text)) + 1)
+        self._backfilled = False
+
+    def retrieve(self, chapter_data: dict, exclude: List[str] = ()) -> List[str]:
+        """
+        Фрагменты глав до chapter_data["chapter"] для промпта, в порядке глав.
+        exclude — тексты, которые уже есть в промпте (дословные резюме): такие фрагменты пропускаются.
+        """
+        if not self._backfilled:
+            self.manager.index_missing_passages(self.book_id)
+            self._backfilled = True
+
+        passages = [
+            p for p in self.manager.get_chapter_passages(self.book_id, before_chapter=chapter_data["chapter"])
+            if not any(p.text in known for known in exclude)
+        ]
+        if not passages:
+            return []
+
+        index = BM25Index([p.text for p in passages])
+        selected, used = [], 0
+        for i, score in index.search(build_query(chapter_data)):
+            tokens = self.count_tokens(passages[i].text)
+            if used + tokens > self.token_budget:
+                continue
+            selected.append(passages[i])
+            used += tokens
+            if len(selected) >= self.top_k:
+                break
+
+        logger.debug(
+            f"Поиск контекста для главы {chapter_data['chapter']}: {len(selected)} из {len(passages)} "
+            f"фрагментов, ~{used} токенов"
+        )
+        selected.sort(key=lambda p: (p.chapter_number, p.kind != "summary", p.position))
+        return [
+            f"Глава {p.chapter_number}{' (резюме)' if p.kind == 'summary' else ''}: {p.text}"
+            for p in selected
+        ]
@@ -0,0 +1,240 @@
+# infrastructure/database/migrations.py
+"""
+Версионные миграции схемы для существующих БД. create_all создаёт только недостающие таблицы,
+поэтому всё, что меняет уже созданные (индексы, колонки), добавляется сюда новой версией.
+Несколько процессов gunicorn стартуют одновременно, поэтому каждая миграция выполняется под блокировкой
+записи SQLite (BEGIN IMMEDIATE) и журнал schema_migrations перечитывается уже под ней — миграцию применяет
+ровно один процесс, остальные дожидаются её и пропускают.
+"""
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from logger import logger
+
+
+def _create_index(conn: Connection, name: str, table: str, columns: Tuple[str, ...]):
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+
+def _create_unique_index(conn: Connection, name: str, table: str, columns: Tuple[str, ...]):
+    """
+    Уникальный индекс uq_*; если в старых данных уже есть повторы — обычный индекс ix_* на тех же
+    колонках (поиск всё равно ускоряется, а данные пользователя не удаляются молча).
+    """
+    cols = ", ".join(columns)
+    duplicate = conn.execute(
+        text(f"SELECT 1 FROM {table} GROUP BY {cols} HAVING count(*) > 1 LIMIT 1")
+    ).first()
+    if duplicate:
+        fallback = "ix_" + name[len("uq_"):] if name.startswith("uq_") else name
+        logger.warning(f"⚠️ В {table} есть повторы ({cols}) — вместо {name} создан неуникальный {fallback}")
+        _create_index(conn, fallback, table, columns)
+        return
+    conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} ({cols})"))
+
+
+def _outline_indexes(conn: Connection):
+    """Индексы горячих выборок OutlineManager и маршрутов (см. __table_args__ в models.py)"""
+    # Повторы событий (глава, линия) безопасно схлопнуть: load_outline и так показывал одно из них
+    keep = "SELECT max(id) FROM plot_events GROUP BY chapter_id, plot_line_id"
+    for event_id, chapter_id, plot_line_id, description in conn.execute(text(
+        f"SELECT id, chapter_id, plot_line_id, description FROM plot_events WHERE id NOT IN ({keep})"
+    )):
+        logger.warning(
+            f"🧹 Удалён повтор события {event_id} (глава {chapter_id}, линия {plot_line_id}): {description!r}"
+        )
+    removed = conn.execute(text(f"DELETE FROM plot_events WHERE id NOT IN ({keep})")).rowcount
+    if removed:
+        logger.warning(f"🧹 Удалено повторов событий сюжета: {removed}")
+    _create_unique_index(conn, "uq_chapters_book_number", "chapters", ("book_id", "number"))
+    _create_unique_index(conn, "uq_plot_events_chapter_line", "plot_events", ("chapter_id", "plot_line_id"))
+    _create_unique_index(conn, "uq_plot_lines_book_name", "plot_lines", ("book_id", "name"))
+    _create_index(conn, "ix_plot_events_plot_line_id", "plot_events", ("plot_line_id",))
+    _create_index(conn, "ix_books_user_id", "books", ("user_id",))
+
+
+def _columns(conn: Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+
+
+def _drop_column(conn: Connection, table: str, column: str):
+    """
+    ALTER TABLE ... DROP COLUMN есть только в SQLite 3.35+; на более старой таблица пересобирается
+    без колонки: новая таблица с теми же колонками, ключами и индексами, копия строк, переименование.
+    """
+    if sqlite3.sqlite_version_info >= (3, 35, 0):
+        conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+        return
+
+    logger.info(f"SQLite {sqlite3.sqlite_version} без DROP COLUMN — пересобираем {table} без {column}")
+    keep = [row for row in conn.execute(text(f"PRAGMA table_info({table})")) if row[1] != column]
+    definitions = []
+    for _, name, type_, notnull, default, _ in keep:
+        definitions.append(
+            f'"{name}" {type_}' + (" NOT NULL" if notnull else "") + (f" DEFAULT {default}" if default is not None else "")
+        )
+    primary_key = [row[1] for row in sorted(keep, key=lambda row: row[5]) if row[5]]
+    if primary_key:
+        definitions.append(f"PRIMARY KEY ({', '.join(primary_key)})")
+    for fk in conn.execute(text(f"PRAGMA foreign_key_list({table})")):
+        if fk[3] != column:
+            definitions.append(f'FOREIGN KEY ("{fk[3]}") REFERENCES {fk[2]} ("{fk[4]}")')
+    # Индексы по удаляемой колонке не переносятся
+    indexes = [
+        sql for name, sql in conn.execute(
+            text("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL"),
+            {"table": table}
+        ).all()
+        if column not in {row[2] for row in conn.execute(text(f'PRAGMA index_info("{name}")'))}
+    ]
+
+    columns = ", ".join(f'"{row[1]}"' for row in keep)
+    conn.execute(text("PRAGMA defer_foreign_keys = ON"))  # ссылки на таблицу снова верны к коммиту
+    conn.execute(text(f"CREATE TABLE {table}_rebuild ({', '.join(definitions)})"))
+    conn.execute(text(f"INSERT INTO {table}_rebuild ({columns}) SELECT {columns} FROM {table}"))
+    conn.execute(text(f"DROP TABLE {table}"))
+    conn.execute(text(f"ALTER TABLE {table}_rebuild RENAME TO {table}"))
+    for sql in indexes:
+        conn.execute(text(sql))
+
+
+def _chapter_bodies(conn: Connection):
+    """
+    Тексты глав — из chapters.content в сжатые chapter_bodies (infrastructure/chapter_store.py);
+    в chapters остаются body_hash/body_bytes, колонка content удаляется.
+    """
+    from infrastructure.chapter_store import body_hash, encode_body  # хранилище импортирует модели
+    from .models import ChapterBody
+
+    ChapterBody.__table__.create(conn, checkfirst=True)
+    columns = _columns(conn, "chapters")
+    if "body_hash" not in columns:
+        conn.execute(text("ALTER TABLE chapters ADD COLUMN body_hash VARCHAR(64)"))
+    if "body_bytes" not in columns:
+        conn.execute(text("ALTER TABLE chapters ADD COLUMN body_bytes INTEGER"))
+    _create_index(conn, "ix_chapters_body_hash", "chapters", ("body_hash",))
+    if "content" not in columns:
+        return
+
+    moved, last_id = 0, 0
+    while True:
+        # Пачками по id — не держим в памяти тексты всей базы
+        rows = conn.execute(
+            text(
+                "SELECT id, content FROM chapters WHERE id > :last AND content IS NOT NULL AND content != '' "
+                "ORDER BY id LIMIT 200"
+            ),
+            {"last": last_id}
+        ).all()
+        if not rows:
+            break
+        for chapter_id, content in rows:
+            key = body_hash(content)
+            codec, data, length = encode_body(content)
+            conn.execute(
+                text(
+                    "INSERT OR IGNORE INTO chapter_bodies (hash, codec, data, byte_length, created_at) "
+                    "VALUES (:hash, :codec, :data, :length, :created)"
+                ),
+                {"hash": key, "codec": codec, "data": data, "length": length, "created": datetime.utcnow()}
+            )
+            conn.execute(
+                text("UPDATE chapters SET body_hash = :hash, body_bytes = :length WHERE id = :id"),
+                {"hash": key, "length": length, "id": chapter_id}
+            )
+        moved += len(rows)
+        last_id = rows[-1][0]
+
+    _drop_column(conn, "chapters", "content")
+    logger.info(f"📦 Тексты глав перенесены в chapter_bodies: {moved}. Место в файле освободит VACUUM")
+
+
+def _chapter_stream_marker(conn: Connection):
+    """Отметка потоковой генерации главы: второй поток той же главы получает отказ"""
+    if "stream_started_at" not in _columns(conn, "chapters"):
+        conn.execute(text("ALTER TABLE chapters ADD COLUMN stream_started_at DATETIME"))
+
+
+def _summary_digest_unique(conn: Connection):
+    """
+    Один дайджест на диапазон глав: save_summary_digest делает upsert по уникальному индексу.
+    Дайджесты — пересчитываемый кэш, поэтому повторы схлопываются до последнего сохранённого.
+    """
+    removed = conn.execute(text(
+        "DELETE FROM summary_digests WHERE id NOT IN "
+        "(SELECT max(id) FROM summary_digests GROUP BY book_id, level, start_chapter, end_chapter)"
+    )).rowcount
+    if removed:
+        logger.info(f"🧹 Удалены повторы дайджестов резюме: {removed}")
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_summary_digests_range "
+        "ON summary_digests (book_id, level, start_chapter, end_chapter)"
+    ))
+
+
+def _generation_jobs_index(conn: Connection):
+    """Поиск активной задачи книги (JobQueue.get_active_job) — по индексу, а не полным просмотром"""
+    _create_index(conn, "ix_generation_jobs_book_status", "generation_jobs", ("book_id", "status"))
+
+
+# (версия, название, функция) — только добавлять в конец, уже выпущенные не менять
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "outline_indexes", _outline_indexes),
+    (2, "chapter_bodies", _chapter_bodies),
+    (3, "chapter_stream_marker", _chapter_stream_marker),
+    (4, "summary_digest_unique", _summary_digest_unique),
+    (5, "generation_jobs_index", _generation_jobs_index),
+]
+
+
+def applied_versions(conn: Connection) -> set:
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations "
+        "(version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at DATETIME NOT NULL)"
+    ))
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+@contextmanager
+def _write_lock(engine: Engine):
+    """
+    Транзакция, которая сразу берёт блокировку записи SQLite: всё, что прочитано внутри, не изменит
+    другой процесс до commit. Ожидание блокировки ограничено busy_timeout движка.
+    """
+    with engine.connect() as conn:
+        if conn.dialect.name == "sqlite":
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """Применяет недостающие миграции по порядку, каждую в своей транзакции. Возвращает применённые версии"""
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        with _write_lock(engine) as conn:
+            # Пока ждали блокировку, миграцию мог применить другой процесс
+            if version in applied_versions(conn):
+                continue
+            logger.info(f"🔧 Миграция {version}: {name}")
+            migrate(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": name, "t": datetime.utcnow()}
+            )
+        applied.append(version)
+    return applied
@@ -1,5 +1,5 @@
 # infrastructure/database/models.py
-from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, DateTime, Float, Index, LargeBinary
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 
@@ -29,6 +29,9 @@ class Book(Base):
     chapters = relationship("Chapter", back_populates="book", cascade="all, delete-orphan")
     plot_lines = relationship("PlotLine", back_populates="book", cascade="all, delete-orphan")
 
+    # Индексы заданы явными именами: на существующие БД их переносит infrastructure/database/migrations.py
+    __table_args__ = (Index("ix_books_user_id", "user_id"),)
+
 
 class PlotLine(Base):
     __tablename__ = 'plot_lines'
@@ -39,6 +42,8 @@ class PlotLine(Base):
     book = relationship("Book", back_populates="plot_lines")
     events = relationship("PlotEvent", back_populates="plot_line", cascade="all, delete-orphan")
 
+    __table_args__ = (Index("uq_plot_lines_book_name", "book_id", "name", unique=True),)
+
 
 class PlotEvent(Base):
     __tablename__ = 'plot_events'
@@ -50,6 +55,11 @@ class PlotEvent(Base):
     plot_line = relationship("PlotLine", back_populates="events")
     chapter = relationship("Chapter", back_populates="plot_events")
 
+    __table_args__ = (
+        Index("uq_plot_events_chapter_line", "chapter_id", "plot_line_id", unique=True),
+        Index("ix_plot_events_plot_line_id", "plot_line_id"),
+    )
+
 
 class Chapter(Base):
     __tablename__ = 'chapters'
@@ -58,9 +68,129 @@ class Chapter(Base):
     number = Column(Integer, nullable=False)
     title = Column(String(200))
     generate_flag = Column(Boolean, default=False)
-    content = Column(Text)
+    # Текст главы — в chapter_bodies (сжатый, по хэшу), здесь только ссылка и длина: см. infrastructure/chapter_store.py
+    body_hash = Column(String(64), nullable=True)  # sha256 текста = ключ ChapterBody
+    body_bytes = Column(Integer, nullable=True)  # длина несжатого текста в UTF-8
     context_summary = Column(Text)
     generated_at = Column(DateTime, nullable=True)
+    stream_started_at = Column(DateTime, nullable=True)  # глава пишется потоком в вебе (OutlineManager.claim_chapter_stream)
 
     book = relationship("Book", back_populates="chapters")
-    plot_events = relationship("PlotEvent", back_populates="chapter")
\ No newline at end of file
+    plot_events = relationship("PlotEvent", back_populates="chapter")
+
+    __table_args__ = (
+        Index("uq_chapters_book_number", "book_id", "number", unique=True),
+        Index("ix_chapters_body_hash", "body_hash"),
+    )
+
+
+class ChapterBody(Base):
+    """Сжатый текст главы, адресуемый по содержимому: одинаковые тексты хранятся один раз"""
+    __tablename__ = 'chapter_bodies'
+    hash = Column(String(64), primary_key=True)  # sha256 несжатого текста
+    codec = Column(String(10), nullable=False)  # zlib, zstd
+    data = Column(LargeBinary, nullable=False)
+    byte_length = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class GenerationJob(Base):
+    """Фоновая задача генерации глав (выполняется отдельным воркером)"""
+    __tablename__ = 'generation_jobs'
+    __table_args__ = (Index("ix_generation_jobs_book_status", "book_id", "status"),)
+    id = Column(Integer, primary_key=True)
+    book_id = Column(Integer, ForeignKey('books.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'))
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, done, failed
+    total_chapters = Column(Integer, default=0)
+    done_chapters = Column(Integer, default=0)
+    current_chapter = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    worker = Column(String(100), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class GenerationRun(Base):
+    """
+    Запуск генерации глав книги с состоянием по каждой главе (infrastructure/generation_runs.py):
+    упавший или прерванный запуск продолжается с первой незаконченной главы.
+    """
+    __tablename__ = 'generation_runs'
+    id = Column(Integer, primary_key=True)
+    book_id = Column(Integer, ForeignKey('books.id'), nullable=False, index=True)
+    job_id = Column(Integer, ForeignKey('generation_jobs.id'), nullable=True)
+    status = Column(String(20), nullable=False, default="running")  # running, done, failed, superseded
+    total_chapters = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    chapters = relationship(
+        "GenerationRunChapter", back_populates="run", cascade="all, delete-orphan",
+        order_by="GenerationRunChapter.chapter_number"
+    )
+
+
+class GenerationRunChapter(Base):
+    """Состояние одной главы в запуске генерации"""
+    __tablename__ = 'generation_run_chapters'
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('generation_runs.id'), nullable=False, index=True)
+    chapter_number = Column(Integer, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, done, failed, skipped
+    attempts = Column(Integer, default=0)
+    duration_seconds = Column(Float, default=0.0)  # суммарно по всем попыткам
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    run = relationship("GenerationRun", back_populates="chapters")
+
+
+class LLMUsage(Base):
+    """Расход токенов одного вызова LLM — для подсчёта стоимости книги"""
+    __tablename__ = 'llm_usage'
+    id = Column(Integer, primary_key=True)
+    book_id = Column(Integer, ForeignKey('books.id'), nullable=True)
+    chapter_number = Column(Integer, nullable=True)
+    operation = Column(String(50), nullable=False)  # outline, chapter, ...
+    provider = Column(String(50))
+    model = Column(String(100))
+    input_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    estimated = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class SummaryDigest(Base):
+    """
+    Сжатое резюме диапазона глав (infrastructure/summary_compaction.py):
+    level="arc" — одна арка, level="book" — книга с 1-й главы до end_chapter.
+    source_hash — хэш исходных резюме: если главы перегенерировали, дайджест пересчитывается.
+    """
+    __tablename__ = 'summary_digests'
+    __table_args__ = (
+        Index("uq_summary_digests_range", "book_id", "level", "start_chapter", "end_chapter", unique=True),
+    )
+    id = Column(Integer, primary_key=True)
+    book_id = Column(Integer, ForeignKey('books.id'), nullable=False)
+    level = Column(String(10), nullable=False)
+    start_chapter = Column(Integer, nullable=False)
+    end_chapter = Column(Integer, nullable=False)
+    source_hash = Column(String(64), nullable=False)
+    text = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ChapterPassage(Base):
+    """Фрагмент написанной главы (резюме или абзацы) для поиска контекста (infrastructure/context_index.py)"""
+    __tablename__ = 'chapter_passages'
+    id = Column(Integer, primary_key=True)
+    book_id = Column(Integer, ForeignKey('books.id'), nullable=False, index=True)
+    chapter_number = Column(Integer, nullable=False)
+    kind = Column(String(10), nullable=False)  # summary, paragraph
+    position = Column(Integer, nullable=False, default=0)
+    text = Column(Text, nullable=False)
@@ -1,9 +1,11 @@
 # infrastructure/database/setup.py
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from .models import Base, User
+from .migrations import run_migrations
+from .sqlite_profile import create_db_engine
 from config.settings import settings
 from werkzeug.security import generate_password_hash
+from infrastructure.metrics import instrument_engine
 from logger import logger
 
 # Глобальные переменные
@@ -15,7 +17,8 @@ def init_db(db_url: str = settings.DATABASE_URL):
     global engine, Session
 
     logger.debug("🔧 1. Запуск init_db")
-    engine = create_engine(db_url, echo=False, connect_args={"check_same_thread": False})
+    engine = create_db_engine(db_url)  # WAL, busy_timeout и пул — см. sqlite_profile.py
+    instrument_engine(engine)  # метрики длительности SQL-запросов
     logger.debug("✅ 2. Движок создан")
 
     Session = sessionmaker(bind=engine)
@@ -23,6 +26,7 @@ def init_db(db_url: str = settings.DATABASE_URL):
 
     Base.metadata.create_all(engine)
     logger.debug("✅ 4. Таблицы созданы")
+    run_migrations(engine)  # индексы и изменения схемы для уже существующих БД
 
     session = Session()
     try:
@@ -0,0 +1,101 @@
+# infrastructure/database/sqlite_profile.py
+"""
+Профиль SQLite для нескольких процессов gunicorn: WAL (читатели не ждут писателя),
+busy_timeout, synchronous=NORMAL, mmap, подходящий пул и повтор записи, упёршейся в блокировку.
+"""
+import asyncio
+import functools
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from config.settings import settings
+from domain.retry import backoff_delay
+from infrastructure.metrics import record_db_lock_retry
+from logger import logger
+
+_LOCK_MESSAGES = ("database is locked", "database is busy", "database table is locked")
+
+
+def is_sqlite(db_url: str) -> bool:
+    return db_url.startswith("sqlite")
+
+
+def is_memory(db_url: str) -> bool:
+    return db_url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in db_url
+
+
+def create_db_engine(db_url: str, tuned: bool = None) -> Engine:
+    """
+    Движок приложения. tuned=False — прежние настройки (только check_same_thread),
+    по умолчанию SQLITE_TUNING_ENABLED. Для не-SQLite URL профиль не применяется.
+    """
+    if tuned is None:
+        tuned = settings.SQLITE_TUNING_ENABLED
+    if not is_sqlite(db_url):
+        return create_engine(db_url, echo=False)
+    if not tuned:
+        return create_engine(db_url, echo=False, connect_args={"check_same_thread": False})
+
+    connect_args = {"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000}
+    if is_memory(db_url):
+        # Одна общая in-memory БД на все потоки (SingletonThreadPool дал бы каждому потоку свою)
+        engine = create_engine(db_url, echo=False, connect_args=connect_args, poolclass=StaticPool)
+    else:
+        engine = create_engine(
+            db_url, echo=False, connect_args=connect_args, poolclass=QueuePool,
+            pool_size=settings.SQLITE_POOL_SIZE, max_overflow=settings.SQLITE_POOL_SIZE * 2
+        )
+        event.listen(engine, "connect", _apply_pragmas)
+    return engine
+
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    finally:
+        cursor.close()
+
+
+def is_lock_error(error: Exception) -> bool:
+    return isinstance(error, OperationalError) and any(message in str(error) for message in _LOCK_MESSAGES)
+
+
+def retry_on_lock(method):
+    """
+    Декоратор для методов, которые сами открывают и коммитят транзакцию через self.session:
+    если SQLite ответил «database is locked» (busy_timeout истёк, конфликт снимка WAL),
+    транзакция откатывается и метод выполняется заново — до SQLITE_LOCK_RETRIES раз.
+    Нельзя вешать на методы без собственного commit: откат потеряет изменения вызывающего.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        for attempt in range(settings.SQLITE_LOCK_RETRIES + 1):
+            try:
+                return method(self, *args, **kwargs)
+            except OperationalError as e:
+                if not is_lock_error(e) or attempt == settings.SQLITE_LOCK_RETRIES:
+                    raise
+                self.session.rollback()
+                record_db_lock_retry(method.__qualname__)
+                logger.warning(f"🔒 БД занята в {method.__qualname__}, повтор {attempt + 1}")
+                _pause_before_retry(attempt)
+    return wrapper
+
+
+def _pause_before_retry(attempt: int):
+    """
+    Пауза перед повтором записи. В потоке с работающим event loop (конвейерная генерация глав)
+    не спим: time.sleep остановил бы все корутины, а SQLite и так выждал busy_timeout.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        time.sleep(backoff_delay(attempt, base=0.05, cap=1.0))
@@ -0,0 +1,313 @@
+# infrastructure/fake_llm.py
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from typing import Iterator, Optional
+
+from config.settings import settings
+from infrastructure.llm_client import LLMClient
+from infrastructure.token_usage import record_usage
+from infrastructure.prompt_cache import PromptCacheScope, active_scope, record_prompt_cache, split_prefix
+from logger import logger
+
+_WORDS = (
+    "ветер город дорога свет тень море старый тихий долгий путь дом окно ночь утро голос "
+    "память письмо друг враг тайна ключ башня река мост огонь снег лес поле сердце взгляд "
+    "шаг время история книга карта звезда сон правда ложь надежда страх"
+).split()
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class FakeRateLimitError(Exception):
+    """Имитация 429 от провайдера — с Retry-After, как у настоящих SDK"""
+    status_code = 429
+
+    def __init__(self, retry_after: float = 1.0):
+        super().__init__("429 Resource has been exhausted (fake)")
+
+        class _Response:
+            headers = {"retry-after": str(retry_after)}
+
+        self.response = _Response()
+
+
+class FakeLLMClient(LLMClient):
+    """
+    Детерминированный провайдер без сети — для нагрузочных тестов и разработки без ключей.
+    Отвечает валидным JSON сюжета ({"storylines", "chapters"}) или главы ({"text", "summary"}),
+    имитирует задержку, поток токенов, 429 и битые ответы. Может воспроизводить записанные
+    ответы настоящего провайдера (см. RecordingLLMClient).
+    """
+    provider = "fake"
+
+    def __init__(
+        self,
+        language: str,
+        seed: int = None,
+        latency_ms: float = None,
+        latency_sigma: float = None,
+        chapter_words: int = None,
+        outline_chapters: int = None,
+        rate_limit_rate: float = None,
+        malformed_rate: float = None,
+        replay_path: str = None
+    ):
+        super().__init__(language)
+        self.model_name = settings.FAKE_LLM_MODEL
+        self.seed = settings.FAKE_LLM_SEED if seed is None else seed
+        self.latency_ms = settings.FAKE_LLM_LATENCY_MS if latency_ms is None else latency_ms
+        self.latency_sigma = settings.FAKE_LLM_LATENCY_SIGMA if latency_sigma is None else latency_sigma
+        self.chapter_words = chapter_words or settings.FAKE_LLM_CHAPTER_WORDS
+        self.outline_chapters = outline_chapters or settings.FAKE_LLM_OUTLINE_CHAPTERS
+        self.rate_limit_rate = settings.FAKE_LLM_RATE_LIMIT_RATE if rate_limit_rate is None else rate_limit_rate
+        self.malformed_rate = settings.FAKE_LLM_MALFORMED_RATE if malformed_rate is None else malformed_rate
+        self.replay = load_recording(replay_path or settings.FAKE_LLM_REPLAY_PATH)
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._prefix_cache = PromptCacheScope("fake")  # симуляция автоматического кэша (как у OpenAI)
+
+    # --- генерация ответа ---
+
+    def _rng(self, prompt: str, purpose: str) -> random.Random:
+        """Один и тот же промпт (и номер вызова для ошибок) — один и тот же ответ"""
+        digest = hashlib.sha256(f"{self.seed}:{purpose}:{prompt}".encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def _next_call(self) -> int:
+        with self._lock:
+            self.calls += 1
+            return self.calls
+
+    def _sentence(self, rng: random.Random, words: int) -> str:
+        text = " ".join(rng.choice(_WORDS) for _ in range(words))
+        return text[0].upper() + text[1:] + "."
+
+    def _outline(self, rng: random.Random) -> dict:
+        storylines = [f"Линия {i}" for i in range(1, 6)]
+        chapters = [
+            {
+                "chapter": number,
+                "title": f"Глава {number}: {rng.choice(_WORDS).capitalize()}",
+                "events": {line: self._sentence(rng, 8) for line in storylines},
+            }
+            for number in range(1, self.outline_chapters + 1)
+        ]
+        return {"storylines": storylines, "chapters": chapters}
+
+    def _acts(self, rng: random.Random, prompt: str) -> dict:
+        storylines = [f"Линия {i}" for i in range(1, 6)]
+        match = re.search(r"ровно на (\d+) актов", prompt)
+        acts = [
+            {
+                "title": f"Акт {number}: {rng.choice(_WORDS).capitalize()}",
+                "summary": self._sentence(rng, 12),
+                "arcs": {line: self._sentence(rng, 8) for line in storylines},
+            }
+            for number in range(1, int(match.group(1)) + 1 if match else 4)
+        ]
+        return {"storylines": storylines, "acts": acts}
+
+    def _act_chapters(self, rng: random.Random, prompt: str) -> dict:
+        """Главы акта: линии — из ключей, перечисленных в промпте, нумерация — с первой главы акта"""
+        lines = re.search(r"Ключи events — ровно эти сюжетные линии: (\[.*?\])", prompt)
+        counts = re.search(r"Глав в этом акте: (\d+) \(главы (\d+)", prompt)
+        storylines = json.loads(lines.group(1)) if lines else [f"Линия {i}" for i in range(1, 6)]
+        count, first = (int(counts.group(1)), int(counts.group(2))) if counts else (self.outline_chapters, 1)
+        chapters = [
+            {
+                "chapter": number,
+                "title": f"Глава {number}: {rng.choice(_WORDS).capitalize()}",
+                "events": {line: self._sentence(rng, 8) for line in storylines},
+            }
+            for number in range(first, first + count)
+        ]
+        return {"chapters": chapters}
+
+    def _chapter(self, rng: random.Random) -> dict:
+        sentences = []
+        remaining = self.chapter_words
+        while remaining > 0:
+            length = min(remaining, rng.randint(6, 16))
+            sentences.append(self._sentence(rng, length))
+            remaining -= length
+        paragraphs = [" ".join(sentences[i:i + 5]) for i in range(0, len(sentences), 5)]
+        return {
+            "text": "\n\n".join(paragraphs),
+            "summary": " ".join(self._sentence(rng, 10) for _ in range(3)),
+        }
+
+    def build_response(self, prompt: str) -> str:
+        """Ответ без задержек и ошибок — по записи или по типу промпта"""
+        recorded = self.replay.get(prompt_hash(prompt))
+        if recorded is not None:
+            return recorded
+
+        rng = self._rng(prompt, "response")
+        if '"acts"' in prompt:
+            payload = self._acts(rng, prompt)
+        elif '"storylines"' in prompt:
+            payload = self._outline(rng)
+        elif '"chapters"' in prompt:
+            payload = self._act_chapters(rng, prompt)
+        elif '"text"' in prompt and '"summary"' in prompt:
+            payload = self._chapter(rng)
+        elif '"summaries"' in prompt:
+            numbers = sorted({int(n) for n in re.findall(r"Глава (\d+):", prompt)})
+            payload = {"summaries": {str(n): " ".join(self._sentence(rng, 10) for _ in range(3)) for n in numbers}}
+        elif '"summary"' in prompt:
+            payload = {"summary": " ".join(self._sentence(rng, 10) for _ in range(3))}
+        else:
+            return " ".join(self._sentence(rng, 10) for _ in range(5))
+        return json.dumps(payload, ensure_ascii=False)
+
+    def _maybe_fail(self, prompt: str, call_number: int):
+        rng = self._rng(prompt, f"fault:{call_number}")
+        if rng.random() < self.rate_limit_rate:
+            raise FakeRateLimitError(retry_after=1.0)
+
+    def _maybe_corrupt(self, prompt: str, call_number: int, response: str) -> str:
+        rng = self._rng(prompt, f"corrupt:{call_number}")
+        if rng.random() < self.malformed_rate:
+            logger.debug("FakeLLM: возвращаем обрезанный ответ")
+            return response[: max(1, len(response) // 2)]
+        return response
+
+    def _latency(self, prompt: str, call_number: int, cached_tokens: int = None) -> float:
+        """
+        Логнормальная задержка: медиана latency_ms, хвост задаётся latency_sigma.
+        Попадание в кэш префикса экономит его долю «prefill» — считаем, что это половина задержки.
+        """
+        if not self.latency_ms:
+            return 0.0
+        rng = self._rng(prompt, f"latency:{call_number}")
+        latency = rng.lognormvariate(math.log(self.latency_ms / 1000.0), self.latency_sigma)
+        if cached_tokens:
+            latency *= 1 - 0.5 * min(1.0, cached_tokens / max(1, self.count_tokens(prompt)))
+        return latency
+
+    def _simulate_prefix_cache(self, prompt: str) -> Optional[int]:
+        """None — кэшируемого префикса нет; иначе токены префикса, «взятые из кэша» (0 — промах)"""
+        split = split_prefix(prompt, self.count_tokens)
+        if split is None:
+            return None
+        prefix = split[0]
+        hit = (active_scope() or self._prefix_cache).simulate(self.provider, self.model_name, prefix)
+        return self.count_tokens(prefix) if hit else 0
+
+    def _record(self, prompt: str, response: str, cached_tokens: int = None, started: float = None):
+        prompt_tokens = self.count_tokens(prompt)
+        record_usage(self.provider, self.model_name, prompt_tokens, self.count_tokens(response), estimated=True)
+        if cached_tokens is not None:
+            record_prompt_cache(self.provider, prompt_tokens, cached_tokens, time.perf_counter() - started)
+
+    # --- интерфейс LLMClient ---
+
+    def generate_text(self, prompt: str, json_schema: Optional[dict] = None) -> str:
+        call_number = self._next_call()
+        cached_tokens = self._simulate_prefix_cache(prompt)
+        started = time.perf_counter()
+        time.sleep(self._latency(prompt, call_number, cached_tokens))
+        self._maybe_fail(prompt, call_number)
+        response = self._maybe_corrupt(prompt, call_number, self.build_response(prompt))
+        self._record(prompt, response, cached_tokens, started)
+        return response
+
+    async def agenerate_text(self, prompt: str, json_schema: Optional[dict] = None) -> str:
+        call_number = self._next_call()
+        cached_tokens = self._simulate_prefix_cache(prompt)
+        started = time.perf_counter()
+        await asyncio.sleep(self._latency(prompt, call_number, cached_tokens))
+        self._maybe_fail(prompt, call_number)
+        response = self._maybe_corrupt(prompt, call_number, self.build_response(prompt))
+        self._record(prompt, response, cached_tokens, started)
+        return response
+
+    def generate_text_stream(
+        self, prompt: str, json_schema: Optional[dict] = None, chunk_chars: int = 40
+    ) -> Iterator[str]:
+        """Первый кусок — через 10% задержки, остальное равномерно (как у настоящего потока)"""
+        call_number = self._next_call()
+        cached_tokens = self._simulate_prefix_cache(prompt)
+        started = time.perf_counter()
+        latency = self._latency(prompt, call_number, cached_tokens)
+        self._maybe_fail(prompt, call_number)
+        response = self._maybe_corrupt(prompt, call_number, self.build_response(prompt))
+
+        chunks = [response[i:i + chunk_chars] for i in range(0, len(response), chunk_chars)] or [""]
+        time.sleep(latency * 0.1)
+        per_chunk = latency * 0.9 / len(chunks)
+        for chunk in chunks:
+            yield chunk
+            time.sleep(per_chunk)
+        self._record(prompt, response, cached_tokens, started)
+
+
+def load_recording(path: Optional[str]) -> dict:
+    """Читает JSONL-запись RecordingLLMClient: prompt_hash → ответ"""
+    if not path or not os.path.exists(path):
+        return {}
+    recording = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                recording[entry["prompt_hash"]] = entry["response"]
+    logger.info(f"FakeLLM: загружено {len(recording)} записанных ответов из {path}")
+    return recording
+
+
+class RecordingLLMClient(LLMClient):
+    """Пишет пары «промпт → ответ» настоящего провайдера в JSONL для последующего воспроизведения в FakeLLMClient"""
+    def __init__(self, inner: LLMClient, path: str):
+        super().__init__(inner.language)
+        self.inner = inner
+        self.path = path
+        self.provider = inner.provider
+        self.model_name = inner.model_name
+        self.temperature = inner.temperature
+        self.system_instruction = inner.system_instruction
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _write(self, prompt: str, response: str, latency: float):
+        entry = {
+            "prompt_hash": prompt_hash(prompt),
+            "provider": self.provider,
+            "model": self.model_name,
+            "latency_ms": round(latency * 1000),
+            "prompt": prompt,
+            "response": response,
+        }
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def generate_text(self, prompt: str, **kwargs) -> str:
+        started = time.perf_counter()
+        response = self.inner.generate_text(prompt, **kwargs)
+        self._write(prompt, response, time.perf_counter() - started)
+        return response
+
+    async def agenerate_text(self, prompt: str, **kwargs) -> str:
+        started = time.perf_counter()
+        response = await self.inner.agenerate_text(prompt, **kwargs)
+        self._write(prompt, response, time.perf_counter() - started)
+        return response
+
+    def generate_text_stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        started = time.perf_counter()
+        parts = []
+        for chunk in self.inner.generate_text_stream(prompt, **kwargs):
+            parts.append(chunk)
+            yield chunk
+        self._write(prompt, "".join(parts), time.perf_counter() - started)
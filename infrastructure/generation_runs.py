@@ -0,0 +1,143 @@
+# infrastructure/generation_runs.py
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session as DBSession
+
+from infrastructure.database.models import GenerationRun, GenerationRunChapter
+from infrastructure.database.sqlite_profile import retry_on_lock
+from logger import logger
+
+UNFINISHED_STATUSES = ("running", "failed")
+CLOSED_CHAPTER_STATUSES = ("done", "skipped")
+
+
+class GenerationRuns:
+    """
+    Журнал запусков генерации глав: по каждой главе — статус, число попыток, длительность и ошибка.
+    Каждое изменение сразу коммитится, поэтому после падения или перезапуска воркера запуск
+    продолжается с первой незаконченной главы, а уже сохранённые главы не генерируются повторно.
+    """
+    def __init__(self, db_session: DBSession):
+        self.session = db_session
+
+    @retry_on_lock
+    def start(self, book_id: int, chapter_numbers: List[int], job_id: int = None) -> GenerationRun:
+        """Новый запуск; незавершённые запуски книги больше не продолжаются (superseded)"""
+        self.session.execute(
+            update(GenerationRun)
+            .where(GenerationRun.book_id == book_id, GenerationRun.status.in_(UNFINISHED_STATUSES))
+            .values(status="superseded", updated_at=datetime.utcnow())
+        )
+        run = GenerationRun(book_id=book_id, job_id=job_id, status="running", total_chapters=len(chapter_numbers))
+        run.chapters = [GenerationRunChapter(chapter_number=number) for number in chapter_numbers]
+        self.session.add(run)
+        self.session.commit()
+        logger.info(f"Запуск генерации {run.id} для книги {book_id=}: главы {chapter_numbers}")
+        return run
+
+    def get(self, run_id: int) -> Optional[GenerationRun]:
+        return self.session.query(GenerationRun).filter(GenerationRun.id == run_id).first()
+
+    def get_resumable(self, book_id: int, job_id: int = None) -> Optional[GenerationRun]:
+        """Последний незавершённый (упавший или прерванный) запуск книги; job_id — только запуск этой задачи"""
+        query = self.session.query(GenerationRun).filter(
+            GenerationRun.book_id == book_id, GenerationRun.status.in_(UNFINISHED_STATUSES)
+        )
+        if job_id is not None:
+            query = query.filter(GenerationRun.job_id == job_id)
+        return query.order_by(GenerationRun.id.desc()).first()
+
+    def attach_job(self, run_id: int, job_id: int):
+        """Привязывает запуск к задаче очереди — воркер продолжит именно его"""
+        self._update_run(run_id, job_id=job_id)
+
+    def unfinished_chapters(self, run_id: int) -> List[int]:
+        return [
+            number for (number,) in self.session.query(GenerationRunChapter.chapter_number)
+            .filter(GenerationRunChapter.run_id == run_id, GenerationRunChapter.status.notin_(CLOSED_CHAPTER_STATUSES))
+            .order_by(GenerationRunChapter.chapter_number)
+        ]
+
+    def finished_count(self, run_id: int) -> int:
+        """Главы запуска, которые уже не нужно генерировать"""
+        return (
+            self.session.query(GenerationRunChapter)
+            .filter(GenerationRunChapter.run_id == run_id, GenerationRunChapter.status.in_(CLOSED_CHAPTER_STATUSES))
+            .count()
+        )
+
+    @retry_on_lock
+    def chapter_started(self, run_id: int, chapter_number: int):
+        chapter = self._chapter(run_id, chapter_number)
+        chapter.status = "running"
+        chapter.attempts = (chapter.attempts or 0) + 1
+        chapter.started_at = datetime.utcnow()
+        chapter.error = None
+        self.session.commit()
+
+    def chapter_done(self, run_id: int, chapter_number: int):
+        self._close_chapter(run_id, chapter_number, status="done")
+
+    def chapter_failed(self, run_id: int, chapter_number: int, error: str):
+        self._close_chapter(run_id, chapter_number, status="failed", error=error)
+
+    def chapter_skipped(self, run_id: int, chapter_number: int, reason: str):
+        self._close_chapter(run_id, chapter_number, status="skipped", error=reason)
+
+    @contextmanager
+    def track_chapter(self, run_id: int, chapter_number: int):
+        """Отмечает главу running → done, а при исключении — failed (с откатом незакоммиченных изменений)"""
+        self.chapter_started(run_id, chapter_number)
+        try:
+            yield
+        except Exception as e:
+            self.session.rollback()
+            self.chapter_failed(run_id, chapter_number, str(e))
+            raise
+        self.chapter_done(run_id, chapter_number)
+
+    def finish(self, run_id: int):
+        self._update_run(run_id, status="done", error=None, finished_at=datetime.utcnow())
+        logger.info(f"Запуск генерации {run_id} завершён")
+
+    def fail(self, run_id: int, error: str):
+        self._update_run(run_id, status="failed", error=error, finished_at=datetime.utcnow())
+        logger.warning(f"Запуск генерации {run_id} прерван: {error}")
+
+    def resume(self, run_id: int):
+        self._update_run(run_id, status="running", error=None, finished_at=None)
+
+    def _chapter(self, run_id: int, chapter_number: int) -> GenerationRunChapter:
+        chapter = (
+            self.session.query(GenerationRunChapter)
+            .filter(GenerationRunChapter.run_id == run_id, GenerationRunChapter.chapter_number == chapter_number)
+            .first()
+        )
+        if not chapter:
+            raise ValueError(f"Глава {chapter_number} не входит в запуск генерации {run_id}")
+        return chapter
+
+    @retry_on_lock
+    def _close_chapter(self, run_id: int, chapter_number: int, status: str, error: str = None):
+        chapter = self._chapter(run_id, chapter_number)
+        now = datetime.utcnow()
+        if chapter.started_at:
+            chapter.duration_seconds = (chapter.duration_seconds or 0.0) + (now - chapter.started_at).total_seconds()
+        chapter.status = status
+        chapter.error = error
+        chapter.finished_at = now
+        self._touch(run_id, now)
+        self.session.commit()
+
+    def _touch(self, run_id: int, now: datetime):
+        self.session.execute(update(GenerationRun).where(GenerationRun.id == run_id).values(updated_at=now))
+
+    @retry_on_lock
+    def _update_run(self, run_id: int, **values):
+        self.session.execute(
+            update(GenerationRun).where(GenerationRun.id == run_id).values(updated_at=datetime.utcnow(), **values)
+        )
+        self.session.commit()
@@ -0,0 +1,135 @@
+# infrastructure/job_queue.py
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session as DBSession
+
+from infrastructure.database.models import GenerationJob
+from infrastructure.database.sqlite_profile import retry_on_lock
+from logger import logger
+
+ACTIVE_STATUSES = ("pending", "running")
+
+
+class JobQueue:
+    """
+    Очередь задач генерации глав, хранящаяся в основной БД.
+    Веб-слой только ставит задачи, выполняет их отдельный процесс (cli/job_worker.py).
+    """
+    def __init__(self, db_session: DBSession):
+        self.session = db_session
+
+    @retry_on_lock
+    def enqueue(self, book_id: int, user_id: int) -> GenerationJob:
+        """
+        Ставит генерацию книги в очередь.
+        Если для книги уже есть активная задача — возвращает её (защита от двойного клика).
+        """
+        job = self.get_active_job(book_id)
+        if job:
+            logger.info(f"Задача {job.id} для книги {book_id=} уже в очереди ({job.status})")
+            return job
+
+        job = GenerationJob(book_id=book_id, user_id=user_id, status="pending")
+        self.session.add(job)
+        self.session.commit()
+        logger.info(f"Задача {job.id} поставлена в очередь для книги {book_id=}")
+        return job
+
+    def get(self, job_id: int, user_id: int = None) -> Optional[GenerationJob]:
+        query = self.session.query(GenerationJob).filter(GenerationJob.id == job_id)
+        if user_id is not None:
+            query = query.filter(GenerationJob.user_id == user_id)
+        return query.first()
+
+    def get_active_job(self, book_id: int) -> Optional[GenerationJob]:
+        return (
+            self.session.query(GenerationJob)
+            .filter(GenerationJob.book_id == book_id, GenerationJob.status.in_(ACTIVE_STATUSES))
+            .order_by(GenerationJob.id)
+            .first()
+        )
+
+    @retry_on_lock
+    def claim_next(self, worker_name: str) -> Optional[GenerationJob]:
+        """
+        Атомарно забирает самую старую задачу в статусе pending.
+        UPDATE ... WHERE status='pending' гарантирует, что задачу заберёт только один воркер.
+        """
+        candidate = (
+            self.session.query(GenerationJob.id)
+            .filter(GenerationJob.status == "pending")
+            .order_by(GenerationJob.id)
+            .first()
+        )
+        if not candidate:
+            return None
+
+        now = datetime.utcnow()
+        result = self.session.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id == candidate.id, GenerationJob.status == "pending")
+            .values(status="running", worker=worker_name, started_at=now, heartbeat_at=now)
+        )
+        self.session.commit()
+        if result.rowcount != 1:
+            return None  # задачу забрал другой воркер
+
+        return self.get(candidate.id)
+
+    @retry_on_lock
+    def update_progress(self, job_id: int, done: int, total: int, current_chapter: int = None):
+        self.session.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id == job_id)
+            .values(
+                done_chapters=done,
+                total_chapters=total,
+                current_chapter=current_chapter,
+                heartbeat_at=datetime.utcnow()
+            )
+        )
+        self.session.commit()
+
+    @retry_on_lock
+    def heartbeat(self, job_id: int):
+        """Отмечает, что воркер жив, не трогая прогресс (долгая глава с повторами не должна выглядеть зависшей)"""
+        self.session.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id == job_id, GenerationJob.status == "running")
+            .values(heartbeat_at=datetime.utcnow())
+        )
+        self.session.commit()
+
+    def finish(self, job_id: int):
+        self._close(job_id, status="done")
+
+    def fail(self, job_id: int, error: str):
+        self._close(job_id, status="failed", error=error)
+
+    @retry_on_lock
+    def requeue_stale(self, stale_after_seconds: int) -> int:
+        """
+        Возвращает в очередь задачи, чей воркер перестал подавать признаки жизни
+        (например, контейнер перезапустили посреди генерации).
+        """
+        deadline = datetime.utcnow() - timedelta(seconds=stale_after_seconds)
+        result = self.session.execute(
+            update(GenerationJob)
+            .where(GenerationJob.status == "running", GenerationJob.heartbeat_at < deadline)
+            .values(status="pending", worker=None)
+        )
+        self.session.commit()
+        if result.rowcount:
+            logger.warning(f"Возвращено в очередь зависших задач: {result.rowcount}")
+        return result.rowcount
+
+    @retry_on_lock
+    def _close(self, job_id: int, status: str, error: str = None):
+        self.session.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id == job_id)
+            .values(status=status, error=error, finished_at=datetime.utcnow(), current_chapter=None)
+        )
+        self.session.commit()
@@ -0,0 +1,219 @@
+# infrastructure/llm_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from typing import Iterator, Optional
+
+from domain.cache_policy import fresh_response_required
+from infrastructure.llm_client import LLMClient
+from logger import logger
+
+
+def make_cache_key(provider: str, model: str, temperature: float, system_instruction: str, prompt: str) -> str:
+    """Ключ кэша: хэш от всего, что влияет на ответ модели"""
+    payload = json.dumps(
+        [provider, model, temperature, system_instruction, prompt],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SQLiteResponseCache:
+    """
+    Хранилище ответов LLM в отдельном SQLite-файле.
+    Вытеснение: по TTL при чтении и по размеру (LRU по last_access) при записи.
+    Файл можно делить между воркерами gunicorn — каждое обращение открывает своё соединение.
+    """
+    def __init__(self, path: str, max_entries: int = 5000, ttl_seconds: int = None, max_bytes: int = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        """Транзакция на отдельном соединении; `with sqlite3.connect()` сам соединение не закрывает"""
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            with conn:
+                yield conn
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            response, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE llm_responses SET last_access = ? WHERE key = ?", (now, key))
+            return response
+
+    def set(self, key: str, response: str):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now: float):
+        if self.ttl_seconds:
+            conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl_seconds,))
+
+        if self.max_entries:
+            conn.execute(
+                "DELETE FROM llm_responses WHERE key IN ("
+                "  SELECT key FROM llm_responses ORDER BY last_access DESC LIMIT -1 OFFSET ?"
+                ")",
+                (self.max_entries,)
+            )
+
+        if self.max_bytes:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_responses").fetchone()[0]
+            while total > self.max_bytes:
+                row = conn.execute(
+                    "SELECT key, size FROM llm_responses ORDER BY last_access LIMIT 1"
+                ).fetchone()
+                if not row:
+                    break
+                conn.execute("DELETE FROM llm_responses WHERE key = ?", (row[0],))
+                total -= row[1]
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_responses")
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+
+
+def _schema_kwargs(json_schema: Optional[dict]) -> dict:
+    # Без схемы вызываем inner как раньше — так вызов совместим с любым клиентом
+    return {"json_schema": json_schema} if json_schema is not None else {}
+
+
+class CachingLLMClient(LLMClient):
+    """
+    Декоратор над любым LLMClient: одинаковый промпт (с той же моделью, температурой
+    и системной инструкцией) не отправляется провайдеру повторно.
+    """
+    stats_name = "cache"
+
+    def __init__(self, inner: LLMClient, cache: SQLiteResponseCache):
+        super().__init__(inner.language)
+        self.inner = inner
+        self.cache = cache
+        self.provider = inner.provider
+        self.model_name = inner.model_name
+        self.temperature = inner.temperature
+        self.system_instruction = inner.system_instruction
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def cache_key(self, prompt: str, json_schema: Optional[dict] = None) -> str:
+        if json_schema is not None:
+            # Структурированный ответ кэшируется отдельно от свободного текста на тот же промпт
+            prompt = f"{prompt}\n#json_schema={json.dumps(json_schema, sort_keys=True, ensure_ascii=False)}"
+        return make_cache_key(
+            self.provider, self.model_name, self.temperature, self.system_instruction, prompt
+        )
+
+    def generate_text(self, prompt: str, use_cache: bool = True, json_schema: Optional[dict] = None) -> str:
+        """
+        use_cache=False (или блок domain.cache_policy.fresh_response) — принудительно сходить
+        к провайдеру; ответ всё равно попадёт в кэш и заменит прежний
+        """
+        key = self.cache_key(prompt, json_schema)
+
+        if use_cache and not fresh_response_required():
+            cached = self.cache.get(key)
+            if cached is not None:
+                with self._lock:
+                    self.hits += 1
+                logger.debug(f"LLM cache hit ({self.provider}/{self.model_name}) key={key[:12]}")
+                return cached
+
+        with self._lock:
+            self.misses += 1
+        response = self.inner.generate_text(prompt, **_schema_kwargs(json_schema))
+        if response:
+            self.cache.set(key, response)
+        return response
+
+    async def agenerate_text(self, prompt: str, use_cache: bool = True, json_schema: Optional[dict] = None) -> str:
+        key = self.cache_key(prompt, json_schema)
+
+        if use_cache and not fresh_response_required():
+            cached = self.cache.get(key)
+            if cached is not None:
+                with self._lock:
+                    self.hits += 1
+                return cached
+
+        with self._lock:
+            self.misses += 1
+        response = await self.inner.agenerate_text(prompt, **_schema_kwargs(json_schema))
+        if response:
+            self.cache.set(key, response)
+        return response
+
+    def generate_text_stream(
+        self, prompt: str, use_cache: bool = True, json_schema: Optional[dict] = None
+    ) -> Iterator[str]:
+        """При попадании в кэш отдаёт ответ одним куском, иначе — поток провайдера с сохранением в конце"""
+        key = self.cache_key(prompt, json_schema)
+
+        if use_cache and not fresh_response_required():
+            cached = self.cache.get(key)
+            if cached is not None:
+                with self._lock:
+                    self.hits += 1
+                yield cached
+                return
+
+        with self._lock:
+            self.misses += 1
+        parts = []
+        for chunk in self.inner.generate_text_stream(prompt, **_schema_kwargs(json_schema)):
+            parts.append(chunk)
+            yield chunk
+
+        response = "".join(parts)
+        if response:
+            self.cache.set(key, response)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.cache),
+        }
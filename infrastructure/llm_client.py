@@ -1,30 +1,106 @@
+import asyncio
+import threading
+import time
+import weakref
 from abc import ABC, abstractmethod
 from config.settings import settings
 
 from logger import logger
-from typing import Optional
+from typing import Iterator, Optional
+from domain.tokenizer import count_tokens
+from infrastructure.token_usage import record_usage
+from infrastructure.prompt_cache import active_scope, prefix_key, record_prompt_cache, split_prefix
 
 
 class LLMClient(ABC):
     """Абстрактный интерфейс для LLM клиентов"""
+    provider: str = ""
+    model_name: str = ""
+    temperature: float = 0.7
+    system_instruction: str = ""
+
     def __init__(self, language: str):
         self.language = language
     
     @abstractmethod
-    def generate_text(self, prompt: str) -> str:
-        """Генерирует текст на основе промпта"""
+    def generate_text(self, prompt: str, json_schema: Optional[dict] = None) -> str:
+        """
+        Генерирует текст на основе промпта.
+        json_schema — структурированный ответ средствами провайдера: JSON-схема объекта
+        (с "properties") или {"type": "object"} — любой JSON-объект.
+        """
         pass
 
+    def generate_text_stream(self, prompt: str, json_schema: Optional[dict] = None) -> Iterator[str]:
+        """
+        Генерирует текст кусками по мере готовности.
+        По умолчанию — один кусок с полным ответом (для клиентов без потокового API).
+        """
+        yield self.generate_text(prompt, json_schema=json_schema)
+
+    async def agenerate_text(self, prompt: str, json_schema: Optional[dict] = None) -> str:
+        """
+        Асинхронная версия generate_text.
+        По умолчанию выполняет синхронный вызов в пуле потоков; провайдеры переопределяют её нативным async SDK.
+        """
+        return await asyncio.to_thread(self.generate_text, prompt, json_schema=json_schema)
+
+    def count_tokens(self, text: str) -> int:
+        """Локальный подсчёт токенов для модели этого клиента (без сети)"""
+        return count_tokens(text, provider=self.provider, model=self.model_name)
+
+    def _check_prompt_size(self, prompt: str) -> int:
+        token_count = self.count_tokens(prompt)
+        if token_count > settings.LONG_PROMPT_WARNING_TOKENS:
+            logger.warning(f"Long {self.provider} prompt: {token_count} tokens")
+        return token_count
+
+
+# Поля JSON-схемы, которые понимает response_schema Gemini (подмножество OpenAPI)
+_GEMINI_SCHEMA_KEYS = {"type", "properties", "required", "items", "description", "enum", "nullable", "format"}
+
+
+def _gemini_schema(schema: dict) -> dict:
+    """JSON-схема → схема Gemini: убираем additionalProperties, title и прочее, что SDK отвергает"""
+    result = {}
+    for key, value in schema.items():
+        if key not in _GEMINI_SCHEMA_KEYS:
+            continue
+        if key == "properties":
+            value = {name: _gemini_schema(prop) for name, prop in value.items()}
+        elif key == "items":
+            value = _gemini_schema(value)
+        result[key] = value
+    return result
+
+
+def _openai_response_format(json_schema: Optional[dict]) -> dict:
+    """Аргумент response_format для OpenAI: строгая схема, JSON-режим или ничего"""
+    if json_schema is None:
+        return {}
+    if json_schema.get("properties"):
+        return {"response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": json_schema.get("title", "response"), "schema": json_schema, "strict": True}
+        }}
+    return {"response_format": {"type": "json_object"}}
+
 
 class GeminiClient(LLMClient):
     """Реализация для Google Gemini"""
+    provider = "gemini"
+    _configured_api_key = None  # genai.configure — глобальная настройка процесса, делаем её один раз
+
     def __init__(self, language: str):
         super().__init__(language)
         import google.generativeai as genai
         self.genai = genai
-        self.genai.configure(api_key=settings.GEMINI_API_KEY)
+        if GeminiClient._configured_api_key != settings.GEMINI_API_KEY:
+            self.genai.configure(api_key=settings.GEMINI_API_KEY)
+            GeminiClient._configured_api_key = settings.GEMINI_API_KEY
         logger.debug(f'Using language: {language}')
-        system_instruction = (
+        self.model_name = settings.GEMINI_MODEL
+        self.system_instruction = (
             # f"You are a professional writer creating content in {self.language}, use only {self.language} in answer. "
             # "Respond with well-structured, engaging narratives."
 
@@ -32,61 +108,349 @@ class GeminiClient(LLMClient):
         )
         
         self.model = genai.GenerativeModel(
-            model_name=settings.GEMINI_MODEL,
-            system_instruction=system_instruction
+            model_name=self.model_name,
+            system_instruction=self.system_instruction
         )
-    
-    def generate_text(self, prompt: str) -> str:
-        token_count = len(prompt.split())
-        if token_count > 10000:
-            logger.warning(f"Long Gemini prompt: {token_count} tokens")
-        
+
+    def _generation_config(self, json_schema: Optional[dict] = None):
+        if json_schema is None:
+            return self.genai.GenerationConfig(temperature=self.temperature)
+        extra = {"response_mime_type": "application/json"}
+        if json_schema.get("properties"):
+            extra["response_schema"] = _gemini_schema(json_schema)
+        return self.genai.GenerationConfig(temperature=self.temperature, **extra)
+
+    def _record_usage(self, response, prompt_tokens: int, text: str, cache_started: float = None):
+        """
+        usage_metadata из ответа Gemini, а если его нет — локальная оценка.
+        cache_started — у промпта кэшируемый префикс: пишем метрики кэша (cached_content_token_count).
+        """
+        usage = getattr(response, "usage_metadata", None)
+        input_tokens = getattr(usage, "prompt_token_count", None)
+        output_tokens = getattr(usage, "candidates_token_count", None)
+        if input_tokens:
+            record_usage(self.provider, self.model_name, input_tokens, output_tokens or 0)
+        else:
+            record_usage(self.provider, self.model_name, prompt_tokens, self.count_tokens(text), estimated=True)
+        if cache_started is not None:
+            cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+            record_prompt_cache(
+                self.provider, input_tokens or prompt_tokens, cached_tokens, time.perf_counter() - cache_started
+            )
+
+    def _prompt_model(self, prompt: str) -> tuple:
+        """
+        (модель, промпт, кэшируемый ли префикс). Внутри prompt_cache_scope общий префикс книги
+        уходит в cached content, и модели отправляется только остаток промпта.
+        """
+        split = split_prefix(prompt, self.count_tokens)
+        if split is None:
+            return self.model, prompt, False
+        scope = active_scope()
+        if scope is None:
+            return self.model, prompt, True  # без явного кэша — неявное кэширование Gemini
+        prefix, rest = split
+        cached = scope.get_or_create(
+            self.provider, self.model_name, prefix,
+            create=lambda: self._create_cached_content(prefix),
+            release=lambda handle: handle.delete()
+        )
+        if cached is None:
+            return self.model, prompt, True
+        return self.genai.GenerativeModel.from_cached_content(cached_content=cached), rest, True
+
+    def _create_cached_content(self, prefix: str):
+        from datetime import timedelta
+        from google.generativeai import caching
+        return caching.CachedContent.create(
+            model=self.model_name,
+            system_instruction=self.system_instruction,
+            contents=[prefix],
+            ttl=timedelta(seconds=settings.PROMPT_CACHE_TTL_SECONDS)
+        )
+
+    def generate_text(self, prompt: str, json_schema: Optional[dict] = None) -> str:
+        prompt_tokens = self._check_prompt_size(prompt)
+        model, prompt, cacheable = self._prompt_model(prompt)
+        started = time.perf_counter()
+
         # logger.debug(f'{prompt=}')
-        response = self.model.generate_content(
+        response = model.generate_content(
             prompt,
-            generation_config=self.genai.GenerationConfig(temperature=0.7)
+            generation_config=self._generation_config(json_schema),
+            request_options={"timeout": settings.LLM_REQUEST_TIMEOUT}
         )
+        self._record_usage(response, prompt_tokens, response.text, started if cacheable else None)
         return response.text
 
+    async def agenerate_text(self, prompt: str, json_schema: Optional[dict] = None) -> str:
+        """
+        Синхронный вызов SDK в потоке: grpc-aio клиент generate_content_async SDK кэширует на процесс,
+        а его канал привязан к первому event loop — каждый следующий asyncio.run (воркер, generate_outline)
+        получил бы клиент из закрытого loop. to_thread переносит контекст (track_usage, cache_prefix),
+        длительность ограничена таймаутом запроса SDK.
+        """
+        return await asyncio.to_thread(self.generate_text, prompt, json_schema)
+
+    def generate_text_stream(self, prompt: str, json_schema: Optional[dict] = None) -> Iterator[str]:
+        prompt_tokens = self._check_prompt_size(prompt)
+        model, prompt, cacheable = self._prompt_model(prompt)
+        started = time.perf_counter()
+        response = model.generate_content(
+            prompt,
+            generation_config=self._generation_config(json_schema),
+            request_options={"timeout": settings.LLM_REQUEST_TIMEOUT},
+            stream=True
+        )
+        parts = []
+        last_chunk = None
+        for chunk in response:
+            last_chunk = chunk
+            # Последний кусок может не содержать частей (только finish_reason)
+            if chunk.parts:
+                parts.append(chunk.text)
+                yield chunk.text
+        # usage_metadata приходит в последнем куске потока
+        self._record_usage(last_chunk, prompt_tokens, "".join(parts), started if cacheable else None)
+
+def _http_limits():
+    """Пул keep-alive соединений к API провайдера (LLM_HTTP_MAX_CONNECTIONS, LLM_HTTP_KEEPALIVE_SECONDS)"""
+    import httpx
+    return httpx.Limits(
+        max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+        keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_SECONDS
+    )
+
+
+async def _close_with_loop(client):
+    """
+    Держит async-клиент до завершения его event loop: asyncio.run перед закрытием loop завершает
+    незакрытые async-генераторы (loop.shutdown_asyncgens) — тогда клиент и закрывает свои соединения.
+    """
+    try:
+        yield
+    finally:
+        try:
+            await client.close()
+        except Exception as e:
+            logger.debug(f"Не удалось закрыть async-клиент: {e}")
+
+
 class OpenAIClient(LLMClient):
     """Реализация для OpenAI ChatGPT"""
+    provider = "openai"
+
     def __init__(self, language: str):
         super().__init__(language)
+        import httpx
         from openai import OpenAI
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        # Пул keep-alive соединений: клиент живёт в реестре, TLS-рукопожатие не повторяется на каждый запрос
+        # Таймаут запроса — дедлайн GuardedLLMClient; повторы SDK выключены, чтобы его не умножать
+        # (429 и 5xx повторяет RateLimitedLLMClient, остальное — переключение провайдера)
+        self.client = OpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            timeout=settings.LLM_REQUEST_TIMEOUT,
+            max_retries=0,
+            http_client=httpx.Client(limits=_http_limits())
+        )
+        self.model_name = settings.OPENAI_MODEL
+        self.system_instruction = f"You are a professional writer creating content in {self.language}."
+        self._async_clients = weakref.WeakKeyDictionary()  # event loop → (AsyncOpenAI, его закрывающий генератор)
+        self._async_lock = threading.Lock()
+
+    async def _async_client(self):
+        """
+        AsyncOpenAI создаётся лениво — только если клиент используют из asyncio, с тем же пулом
+        keep-alive соединений, что и синхронный. Соединения привязаны к event loop, а каждый asyncio.run
+        создаёт новый — поэтому клиент свой на каждый loop. Закрывается он в своём же loop при его
+        завершении (_close_with_loop): после закрытия loop соединения уже не закрыть.
+        """
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            entry = self._async_clients.get(loop)
+            if entry is None:
+                import httpx
+                from openai import AsyncOpenAI
+                client = AsyncOpenAI(
+                    api_key=settings.OPENAI_API_KEY,
+                    timeout=settings.LLM_REQUEST_TIMEOUT,
+                    max_retries=0,
+                    http_client=httpx.AsyncClient(limits=_http_limits())
+                )
+                entry = self._async_clients[loop] = (client, _close_with_loop(client))
+                started = False
+            else:
+                started = True
+        if not started:
+            await entry[1].__anext__()
+        return entry[0]
     
-    def generate_text(self, prompt: str) -> str:
-        token_count = len(prompt.split())
-        if token_count > 10000:
-            logger.warning(f"Long OpenAI prompt: {token_count} tokens")
-        
+    def _record_usage(self, usage, prompt_tokens: int, text: str, cache_started: float = None):
+        if usage is not None and getattr(usage, "prompt_tokens", None):
+            record_usage(self.provider, self.model_name, usage.prompt_tokens, usage.completion_tokens or 0)
+        else:
+            record_usage(self.provider, self.model_name, prompt_tokens, self.count_tokens(text), estimated=True)
+        if cache_started is not None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            record_prompt_cache(
+                self.provider,
+                getattr(usage, "prompt_tokens", None) or prompt_tokens,
+                getattr(details, "cached_tokens", None) or 0,
+                time.perf_counter() - cache_started
+            )
+
+    def _cache_kwargs(self, prompt: str) -> dict:
+        """
+        OpenAI кэширует общий префикс промптов автоматически; prompt_cache_key направляет
+        запросы одной книги на одни и те же серверы, чтобы префикс чаще попадал в кэш.
+        """
+        split = split_prefix(prompt, self.count_tokens)
+        if split is None:
+            return {}
+        return {"extra_body": {"prompt_cache_key": prefix_key(split[0])}}
+
+    def generate_text(self, prompt: str, json_schema: Optional[dict] = None) -> str:
+        prompt_tokens = self._check_prompt_size(prompt)
+        cache_kwargs = self._cache_kwargs(prompt)
+        started = time.perf_counter()
+
+        response = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=self._messages(prompt),
+            temperature=self.temperature,
+            max_tokens=settings.OPENAI_MAX_OUTPUT_TOKENS,
+            **_openai_response_format(json_schema),
+            **cache_kwargs
+        )
+        text = response.choices[0].message.content
+        self._record_usage(response.usage, prompt_tokens, text, started if cache_kwargs else None)
+        return text
+
+    async def agenerate_text(self, prompt: str, json_schema: Optional[dict] = None) -> str:
+        prompt_tokens = self._check_prompt_size(prompt)
+        cache_kwargs = self._cache_kwargs(prompt)
+        started = time.perf_counter()
+        response = await (await self._async_client()).chat.completions.create(
+            model=self.model_name,
+            messages=self._messages(prompt),
+            temperature=self.temperature,
+            max_tokens=settings.OPENAI_MAX_OUTPUT_TOKENS,
+            **_openai_response_format(json_schema),
+            **cache_kwargs
+        )
+        text = response.choices[0].message.content
+        self._record_usage(response.usage, prompt_tokens, text, started if cache_kwargs else None)
+        return text
+
+    def generate_text_stream(self, prompt: str, json_schema: Optional[dict] = None) -> Iterator[str]:
+        prompt_tokens = self._check_prompt_size(prompt)
+        cache_kwargs = self._cache_kwargs(prompt)
+        started = time.perf_counter()
+        stream = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=self._messages(prompt),
+            temperature=self.temperature,
+            max_tokens=settings.OPENAI_MAX_OUTPUT_TOKENS,
+            **_openai_response_format(json_schema),
+            **cache_kwargs,
+            stream=True,
+            stream_options={"include_usage": True}  # последний кусок содержит usage
+        )
+        parts = []
+        usage = None
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+        self._record_usage(usage, prompt_tokens, "".join(parts), started if cache_kwargs else None)
+
+    def _messages(self, prompt: str) -> list:
         system_message = {
             "role": "system",
-            "content": f"You are a professional writer creating content in {self.language}."
+            "content": self.system_instruction
         }
         
         user_message = {
             "role": "user",
             "content": prompt
         }
-        
-        response = self.client.chat.completions.create(
-            model=settings.OPENAI_MODEL,
-            messages=[system_message, user_message],
-            temperature=0.7,
-            max_tokens=4000
-        )
-        return response.choices[0].message.content
+        return [system_message, user_message]
 
 class LLMClientFactory:
     """Фабрика для создания LLM клиентов"""
     @staticmethod
-    def create_client(language: str, provider='gemini') -> LLMClient:
-        # provider = settings.LLM_PROVIDER.lower()
-        
+    def create_client(language: str, provider: Optional[str] = None, use_cache: Optional[bool] = None) -> LLMClient:
+        provider = (provider or settings.LLM_PROVIDER).lower()
+        client = LLMClientFactory._create_provider_chain(language, provider)
+
+        # Резервный провайдер и hedging — над цепочками обоих провайдеров
+        if settings.LLM_RESILIENCE_ENABLED:
+            from infrastructure.resilience import ResilientLLMClient
+            fallback = None
+            fallback_provider = settings.LLM_FALLBACK_PROVIDER.lower()
+            if fallback_provider and fallback_provider != provider:
+                try:
+                    fallback = LLMClientFactory._create_provider_chain(language, fallback_provider)
+                except Exception as e:
+                    logger.warning(f"Резервный провайдер {fallback_provider} недоступен: {e}")
+            client = ResilientLLMClient(client, fallback)
+
+        if use_cache is None:
+            use_cache = settings.LLM_CACHE_ENABLED
+        if use_cache:
+            from infrastructure.llm_cache import CachingLLMClient, SQLiteResponseCache
+            cache = SQLiteResponseCache(
+                path=settings.LLM_CACHE_PATH,
+                max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.LLM_CACHE_TTL_SECONDS
+            )
+            client = CachingLLMClient(client, cache)
+
+        return client
+
+    @staticmethod
+    def _create_provider_chain(language: str, provider: str) -> LLMClient:
+        """Клиент провайдера с метриками и лимитером"""
         if provider == "gemini":
-            return GeminiClient(language)
+            client = GeminiClient(language)
         elif provider == "openai":
-            return OpenAIClient(language)
+            client = OpenAIClient(language)
+        elif provider == "fake":
+            from infrastructure.fake_llm import FakeLLMClient
+            client = FakeLLMClient(language)
         else:
-            raise ValueError(f"Unsupported LLM provider: {provider}")
\ No newline at end of file
+            raise ValueError(f"Unsupported LLM provider: {provider}")
+
+        # Запись реальных ответов для воспроизведения в fake-провайдере
+        if settings.LLM_RECORD_PATH and provider != "fake":
+            from infrastructure.fake_llm import RecordingLLMClient
+            client = RecordingLLMClient(client, settings.LLM_RECORD_PATH)
+
+        # Метрики — на каждый реальный запрос к провайдеру (включая повторы)
+        from infrastructure.metrics import InstrumentedLLMClient
+        client = InstrumentedLLMClient(client)
+
+        # Дедлайн и выключатель — на сам запрос к провайдеру, под лимитером: ожидание квоты
+        # и паузы между повторами после 429 не должны считаться медленным или упавшим провайдером
+        if settings.LLM_RESILIENCE_ENABLED:
+            from infrastructure.resilience import GuardedLLMClient
+            client = GuardedLLMClient(client)
+
+        # Лимитер — ближе всего к провайдеру: попадания в кэш квоту не расходуют
+        if settings.RATE_LIMIT_ENABLED:
+            from infrastructure.rate_limiter import RateLimitedLLMClient, get_rate_limiter
+            client = RateLimitedLLMClient(client, get_rate_limiter())
+
+        return client
+
+    @staticmethod
+    def get_client(language: str, provider: Optional[str] = None) -> LLMClient:
+        """
+        Возвращает «тёплый» клиент из реестра процесса (см. infrastructure/llm_registry.py).
+        Используется веб-слоем и CLI вместо create_client, чтобы не пересоздавать клиент на каждый запрос.
+        """
+        from infrastructure.llm_registry import registry
+        return registry.get(language, provider or settings.LLM_PROVIDER.lower())
\ No newline at end of file
@@ -0,0 +1,154 @@
+# infrastructure/llm_registry.py
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Iterator
+
+from infrastructure.llm_client import LLMClient, LLMClientFactory
+from logger import logger
+
+
+class TrackedLLMClient(LLMClient):
+    """Обёртка, которая считает вызовы, ошибки и задержку клиента из реестра"""
+    def __init__(self, inner: LLMClient):
+        super().__init__(inner.language)
+        self.inner = inner
+        self.provider = inner.provider
+        self.model_name = inner.model_name
+        self.temperature = inner.temperature
+        self.system_instruction = inner.system_instruction
+        self.created_at = datetime.utcnow()
+        self.calls = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_latency = None
+        self.last_error = None
+        self.last_call_ok = None
+        self._lock = threading.Lock()
+
+    def _record(self, started: float, error: Exception = None):
+        latency = time.perf_counter() - started
+        with self._lock:
+            self.calls += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.last_latency = latency
+            self.last_call_ok = error is None
+            if error is not None:
+                self.errors += 1
+                self.last_error = f"{type(error).__name__}: {error}"
+
+    def generate_text(self, prompt: str, **kwargs) -> str:
+        started = time.perf_counter()
+        try:
+            result = self.inner.generate_text(prompt, **kwargs)
+        except Exception as e:
+            self._record(started, e)
+            raise
+        self._record(started)
+        return result
+
+    async def agenerate_text(self, prompt: str, **kwargs) -> str:
+        started = time.perf_counter()
+        try:
+            result = await self.inner.agenerate_text(prompt, **kwargs)
+        except Exception as e:
+            self._record(started, e)
+            raise
+        self._record(started)
+        return result
+
+    def generate_text_stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        started = time.perf_counter()
+        try:
+            yield from self.inner.generate_text_stream(prompt, **kwargs)
+        except Exception as e:
+            self._record(started, e)
+            raise
+        self._record(started)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {
+                "provider": self.provider,
+                "model": self.model_name,
+                "language": self.language,
+                "created_at": self.created_at.isoformat(),
+                "calls": self.calls,
+                "errors": self.errors,
+                "avg_latency_ms": round(1000 * self.total_latency / self.calls, 1) if self.calls else None,
+                "max_latency_ms": round(1000 * self.max_latency, 1) if self.calls else None,
+                "last_latency_ms": round(1000 * self.last_latency, 1) if self.last_latency is not None else None,
+                "last_error": self.last_error,
+                "healthy": self.last_call_ok is not False,
+            }
+        # Статистика обёрток (кэш, лимитер и т.п.) — по цепочке .inner
+        layer = self.inner
+        while isinstance(layer, LLMClient):
+            layer_stats = getattr(layer, "stats", None)
+            stats_name = getattr(layer, "stats_name", None)
+            if callable(layer_stats) and isinstance(stats_name, str):
+                stats[stats_name] = layer_stats()
+            layer = getattr(layer, "inner", None)
+        return stats
+
+
+class LLMClientRegistry:
+    """
+    Реестр «тёплых» LLM-клиентов процесса: ключ — (провайдер, модель, язык).
+    Клиент создаётся один раз на воркер gunicorn и переиспользуется всеми запросами и потоками.
+    """
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _model_for(provider: str) -> str:
+        from config.settings import settings
+        return {
+            "gemini": settings.GEMINI_MODEL,
+            "openai": settings.OPENAI_MODEL,
+            "fake": settings.FAKE_LLM_MODEL,
+        }.get(provider, "")
+
+    def get(self, language: str, provider: str) -> TrackedLLMClient:
+        key = (provider, self._model_for(provider), language)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        with self._lock:
+            # Повторная проверка: клиент мог создать соседний поток, пока мы ждали блокировку
+            client = self._clients.get(key)
+            if client is None:
+                started = time.perf_counter()
+                client = TrackedLLMClient(LLMClientFactory.create_client(language, provider=provider))
+                self._clients[key] = client
+                logger.info(
+                    f"LLM-клиент {key} создан за {1000 * (time.perf_counter() - started):.0f} мс "
+                    f"(pid={os.getpid()})"
+                )
+        return client
+
+    def stats(self) -> list:
+        with self._lock:
+            clients = list(self._clients.values())
+        return [client.stats() for client in clients]
+
+    def clear(self):
+        with self._lock:
+            self._clients = {}
+
+    def _reset_after_fork(self):
+        # Блокировка могла быть захвачена другим потоком родителя в момент fork — создаём новую
+        self._lock = threading.Lock()
+        self._clients = {}
+
+
+registry = LLMClientRegistry()
+
+# После fork (gunicorn --preload) соединения родителя использовать нельзя — начинаем с пустого реестра
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=registry._reset_after_fork)
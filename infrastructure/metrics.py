@@ -0,0 +1,267 @@
+# infrastructure/metrics.py
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+# Каталог multiprocess-режима должен существовать до первой записи метрики. Под gunicorn его
+# готовит on_starting (gunicorn.conf.py); процесс, запущенный без gunicorn, иначе упал бы
+# с FileNotFoundError на первом же SQL-запросе.
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from domain.generation_hooks import set_generation_observer
+from infrastructure.llm_client import LLMClient
+
+# Длинная генерация глав — корзины до нескольких минут
+LLM_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+LLM_REQUEST_SECONDS = Histogram(
+    "booksmith_llm_request_seconds",
+    "Длительность одного запроса к LLM-провайдеру",
+    ["provider", "model", "operation"],
+    buckets=LLM_BUCKETS,
+)
+LLM_REQUESTS_TOTAL = Counter(
+    "booksmith_llm_requests_total",
+    "Запросы к LLM-провайдеру по результату",
+    ["provider", "model", "operation", "status"],
+)
+LLM_RETRIES_TOTAL = Counter(
+    "booksmith_llm_retries_total",
+    "Повторы запросов к LLM",
+    ["provider", "reason"],
+)
+LLM_FAILOVERS_TOTAL = Counter(
+    "booksmith_llm_failovers_total",
+    "Переключения на резервный провайдер и дублирующие (hedged) запросы",
+    ["from_provider", "to_provider", "reason"],
+)
+LLM_TOKENS_TOTAL = Counter(
+    "booksmith_llm_tokens_total",
+    "Токены, израсходованные на запросы к LLM",
+    ["provider", "model", "direction"],
+)
+LLM_PROMPT_CACHE_REQUESTS_TOTAL = Counter(
+    "booksmith_llm_prompt_cache_requests_total",
+    "Запросы с кэшируемым префиксом промпта по результату (hit, miss)",
+    ["provider", "result"],
+)
+LLM_PROMPT_CACHE_TOKENS_TOTAL = Counter(
+    "booksmith_llm_prompt_cache_tokens_total",
+    "Входные токены запросов с кэшируемым префиксом: cached — из кэша провайдера, uncached — оплачены полностью",
+    ["provider", "kind"],
+)
+LLM_PROMPT_CACHE_SECONDS = Histogram(
+    "booksmith_llm_prompt_cache_request_seconds",
+    "Длительность запросов с кэшируемым префиксом — сравнение попаданий и промахов",
+    ["provider", "result"],
+    buckets=LLM_BUCKETS,
+)
+GENERATION_SECONDS = Histogram(
+    "booksmith_generation_seconds",
+    "Длительность операций BookGenerator (с учётом повторов и разбора ответа)",
+    ["operation", "status"],
+    buckets=LLM_BUCKETS,
+)
+DB_QUERY_SECONDS = Histogram(
+    "booksmith_db_query_seconds",
+    "Длительность SQL-запросов",
+    ["statement"],
+    buckets=DB_BUCKETS,
+)
+DB_LOCK_RETRIES_TOTAL = Counter(
+    "booksmith_db_lock_retries_total",
+    "Повторы транзакций, упёршихся в блокировку SQLite",
+    ["operation"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "booksmith_http_request_seconds",
+    "Длительность HTTP-запросов к веб-приложению",
+    ["method", "endpoint", "status"],
+)
+
+_current_operation: ContextVar[str] = ContextVar("llm_operation", default="other")
+
+
+@contextmanager
+def llm_operation(name: str):
+    """Помечает все вызовы LLM внутри блока меткой operation (outline, chapter, ...)"""
+    token = _current_operation.set(name)
+    try:
+        yield
+    finally:
+        _current_operation.reset(token)
+
+
+@contextmanager
+def observe_generation(operation: str):
+    """Время операции BookGenerator целиком + метка operation для вложенных вызовов LLM"""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        with llm_operation(operation):
+            yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        GENERATION_SECONDS.labels(operation, status).observe(time.perf_counter() - started)
+
+
+def record_retry(provider: str, reason: str):
+    LLM_RETRIES_TOTAL.labels(provider, reason).inc()
+
+
+class GenerationMetrics:
+    """Наблюдатель BookGenerator (domain/generation_hooks.py): время операций и повторы — в Prometheus"""
+    observe_generation = staticmethod(observe_generation)
+    record_retry = staticmethod(record_retry)
+
+
+set_generation_observer(GenerationMetrics())
+
+
+def record_db_lock_retry(operation: str):
+    DB_LOCK_RETRIES_TOTAL.labels(operation).inc()
+
+
+def record_failover(from_provider: str, to_provider: str, reason: str):
+    LLM_FAILOVERS_TOTAL.labels(from_provider, to_provider, reason).inc()
+
+
+def record_tokens(provider: str, model: str, input_tokens: int, output_tokens: int):
+    if input_tokens:
+        LLM_TOKENS_TOTAL.labels(provider, model, "input").inc(input_tokens)
+    if output_tokens:
+        LLM_TOKENS_TOTAL.labels(provider, model, "output").inc(output_tokens)
+
+
+def observe_prompt_cache(provider: str, prompt_tokens: int, cached_tokens: int, seconds: float):
+    result = "hit" if cached_tokens else "miss"
+    LLM_PROMPT_CACHE_REQUESTS_TOTAL.labels(provider, result).inc()
+    LLM_PROMPT_CACHE_SECONDS.labels(provider, result).observe(seconds)
+    if cached_tokens:
+        LLM_PROMPT_CACHE_TOKENS_TOTAL.labels(provider, "cached").inc(cached_tokens)
+    if prompt_tokens > cached_tokens:
+        LLM_PROMPT_CACHE_TOKENS_TOTAL.labels(provider, "uncached").inc(prompt_tokens - cached_tokens)
+
+
+class InstrumentedLLMClient(LLMClient):
+    """Декоратор над клиентом провайдера: гистограмма задержки и счётчик результатов каждого запроса"""
+    def __init__(self, inner: LLMClient):
+        super().__init__(inner.language)
+        self.inner = inner
+        self.provider = inner.provider
+        self.model_name = inner.model_name
+        self.temperature = inner.temperature
+        self.system_instruction = inner.system_instruction
+
+    def _observe(self, started: float, status: str):
+        operation = _current_operation.get()
+        LLM_REQUEST_SECONDS.labels(self.provider, self.model_name, operation).observe(
+            time.perf_counter() - started
+        )
+        LLM_REQUESTS_TOTAL.labels(self.provider, self.model_name, operation, status).inc()
+
+    def generate_text(self, prompt: str, **kwargs) -> str:
+        started = time.perf_counter()
+        try:
+            result = self.inner.generate_text(prompt, **kwargs)
+        except Exception:
+            self._observe(started, "error")
+            raise
+        self._observe(started, "ok")
+        return result
+
+    async def agenerate_text(self, prompt: str, **kwargs) -> str:
+        started = time.perf_counter()
+        try:
+            result = await self.inner.agenerate_text(prompt, **kwargs)
+        except Exception:
+            self._observe(started, "error")
+            raise
+        self._observe(started, "ok")
+        return result
+
+    def generate_text_stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        started = time.perf_counter()
+        try:
+            yield from self.inner.generate_text_stream(prompt, **kwargs)
+        except Exception:
+            self._observe(started, "error")
+            raise
+        self._observe(started, "ok")
+
+
+def instrument_engine(engine):
+    """
+    Вешает на движок SQLAlchemy замер длительности каждого SQL-запроса. Начало хранится по контексту
+    выполнения: after_cursor_execute для упавшего запроса не приходит — его отметку снимает handle_error.
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            conn.info.setdefault("query_started", {})[context] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("query_started", {}).pop(context, None)
+        if started is None:
+            return
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_SECONDS.labels(verb).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and exception_context.execution_context is not None:
+            conn.info.get("query_started", {}).pop(exception_context.execution_context, None)
+
+
+def instrument_flask(app):
+    """Метрики HTTP-запросов и эндпоинт /metrics"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = getattr(g, "request_started", None)
+        if started is not None and request.endpoint != "metrics":
+            endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+            HTTP_REQUEST_SECONDS.labels(request.method, endpoint, str(response.status_code)).observe(
+                time.perf_counter() - started
+            )
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(render_metrics(), mimetype=CONTENT_TYPE_LATEST)
+
+
+def render_metrics() -> bytes:
+    """
+    В gunicorn у каждого воркера свои счётчики: при PROMETHEUS_MULTIPROC_DIR
+    prometheus_client пишет их в общие файлы, а здесь мы собираем их вместе.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
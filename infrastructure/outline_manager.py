@@ -1,14 +1,27 @@
 # infrastructure/outline_manager.py
 from sqlalchemy.orm import Session as DBSession
-from infrastructure.database.models import Book, Chapter, PlotLine, PlotEvent
-from typing import List, Dict
+from infrastructure.database.models import (
+    Book, Chapter, PlotLine, PlotEvent, GenerationJob, GenerationRun, GenerationRunChapter, LLMUsage, SummaryDigest,
+    ChapterPassage
+)
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional
 from logger import logger
-from sqlalchemy import delete
+from config.settings import settings
+from infrastructure.context_index import split_passages
+from infrastructure.chapter_store import ChapterBodyStore
+from domain.invalidation import stale_after, stale_chapters
+from domain.outline_merge import match_chapters, match_storylines, normalize_events
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from infrastructure.database.sqlite_profile import retry_on_lock
 
 class OutlineManager:
     def __init__(self, db_session: DBSession):
         self.session = db_session
+        self.bodies = ChapterBodyStore(db_session)
 
+    @retry_on_lock
     def save_outline(
         self,
         book_title: str,
@@ -16,12 +29,50 @@ class OutlineManager:
         storylines: list,
         chapters: list,
         user_id: int,
-        book_id: int = None  # ✅ Добавь book_id
+        book_id: int = None,  # ✅ Добавь book_id
+        bulk: bool = None
     ):
         """
         Сохраняет книгу, сюжетные линии и события глав в БД.
         Если book_id передан — обновляет существующую книгу.
+        bulk=True (по умолчанию OUTLINE_BULK_INSERT) — пакетные Core-вставки без ORM-объектов
+        (см. _insert_outline_rows), False — прежний построчный путь через unit of work.
         """
+        self._save_outline(book_title, premise, storylines, chapters, user_id, book_id, bulk)
+
+    @retry_on_lock
+    def replace_outline(self, book_id: int, user_id: int, premise: str, storylines: list, chapters: list):
+        """
+        Перегенерация «с нуля»: удаляет сюжет, главы с текстами и индекс поиска книги и сохраняет
+        новый сюжет — одной транзакцией, поэтому повтор после блокировки БД повторяет и удаление.
+        """
+        book = self.session.query(Book).filter(Book.id == book_id, Book.user_id == user_id).first()
+        if not book:
+            raise ValueError("Книга не найдена или доступ запрещён")
+
+        self.session.execute(delete(PlotEvent).where(PlotEvent.chapter.has(book_id=book_id)))
+        self.session.execute(delete(PlotLine).where(PlotLine.book_id == book_id))
+        body_hashes = self.session.execute(select(Chapter.body_hash).where(Chapter.book_id == book_id)).scalars().all()
+        self.session.execute(delete(Chapter).where(Chapter.book_id == book_id))
+        self.bodies.prune(body_hashes)
+        self.session.execute(delete(ChapterPassage).where(ChapterPassage.book_id == book_id))
+        self.session.flush()
+
+        self._save_outline(book.title, premise, storylines, chapters, user_id, book_id)
+
+    def _save_outline(
+        self,
+        book_title: str,
+        premise: str,
+        storylines: list,
+        chapters: list,
+        user_id: int,
+        book_id: int = None,
+        bulk: bool = None
+    ):
+        """Тело save_outline: коммитит всё, что уже сделано в текущей транзакции сессии"""
+        if bulk is None:
+            bulk = settings.OUTLINE_BULK_INSERT
         # Проверяем, существует ли уже книга
         if book_id:
             book = self.session.query(Book).filter(Book.id == book_id, Book.user_id == user_id).first()
@@ -49,9 +100,15 @@ class OutlineManager:
 
         self.session.flush()  # Получаем book.id
 
+        if bulk:
+            self._insert_outline_rows(book.id, storylines, chapters)
+            self.session.commit()
+            logger.info(f"✅ Книга '{book.title}' и сюжет сохранены в БД (пакетно)")
+            return
+
         # Создаём сюжетные линии
         line_objects = []
-        for name in storylines:
+        for name in dict.fromkeys(storylines):  # название линии уникально в книге
             line = PlotLine(name=name, book_id=book.id)
             self.session.add(line)
             line_objects.append(line)
@@ -89,64 +146,244 @@ class OutlineManager:
         self.session.commit()
         logger.info(f"✅ Книга '{book.title}' и сюжет сохранены в БД")
 
-    def load_outline(self, book_id: int):
+    def _reserve_ids(self, model, count: int) -> List[int]:
         """
-        Загружает книгу и сюжет в формате, похожем на Excel.
-        Возвращает структуру с Content для отображения кнопки "Читать".
+        Диапазон id для пакетной вставки одним запросом. Вызывается под блокировкой записи SQLite
+        (её берёт _insert_outline_rows), поэтому параллельный писатель не займёт эти id.
+        """
+        start = self.session.execute(select(func.coalesce(func.max(model.id), 0))).scalar() + 1
+        return list(range(start, start + count))
+
+    def _insert_outline_rows(self, book_id: int, storylines: list, chapters: list):
+        """
+        Линии, главы и события книги тремя executemany-INSERT вместо flush на каждую главу:
+        id линий и глав назначаются заранее (_reserve_ids), ORM-объекты не создаются.
+        Без коммита — транзакцией управляет вызывающий.
+        """
+        # Flush книги не всегда пишет (у существующей книги название и описание могли не измениться),
+        # поэтому блокировку записи берём явно — холостым UPDATE — до чтения max(id)
+        self.session.execute(update(Book).where(Book.id == book_id).values(id=Book.id))
+        names = list(dict.fromkeys(storylines))
+        line_ids = dict(zip(names, self._reserve_ids(PlotLine, len(names))))
+        chapter_ids = self._reserve_ids(Chapter, len(chapters))
+        if line_ids:
+            self.session.execute(
+                insert(PlotLine.__table__),
+                [{"id": line_id, "name": name, "book_id": book_id} for name, line_id in line_ids.items()]
+            )
+        if chapter_ids:
+            self.session.execute(
+                insert(Chapter.__table__),
+                [
+                    {
+                        "id": chapter_id,
+                        "book_id": book_id,
+                        "number": ch["chapter"],
+                        "title": ch.get("title", f"Глава {ch['chapter']}"),
+                        "generate_flag": True
+                    }
+                    for chapter_id, ch in zip(chapter_ids, chapters)
+                ]
+            )
+
+        events = [
+            {"chapter_id": chapter_id, "plot_line_id": line_ids[storyline_name], "description": str(event_desc).strip()}
+            for chapter_id, ch in zip(chapter_ids, chapters)
+            for storyline_name, event_desc in (ch.get("events") or {}).items()
+            if storyline_name in line_ids and event_desc is not None and str(event_desc).strip()
+        ]
+        if events:
+            self.session.execute(insert(PlotEvent.__table__), events)
+
+    @retry_on_lock
+    def merge_outline(
+        self,
+        book_id: int,
+        premise: str,
+        storylines: list,
+        chapters: list,
+        propagation: str = None
+    ) -> dict:
+        """
+        Накладывает новый сюжет на существующую книгу без удаления написанного (domain/outline_merge.py):
+        главы и линии сопоставляются по номеру и похожести названий; у глав с прежними событиями
+        сохраняются текст и резюме, изменённые главы обновляются и помечаются на перегенерацию
+        (вместе с зависимыми — см. update_plot_event), новые — добавляются, пропавшие — удаляются.
+        Всё в одной транзакции. Возвращает {"kept", "changed", "added", "removed", "stale"}.
         """
         book = self.session.query(Book).filter(Book.id == book_id).first()
         if not book:
-            return None
+            raise ValueError(f"Книга {book_id} не найдена")
 
-        chapters = (
-            self.session.query(Chapter)
-            .filter(Chapter.book_id == book_id)
-            .order_by(Chapter.number)
-            .all()
-        )
+        try:
+            book.premise = premise
 
-        lines = (
-            self.session.query(PlotLine)
-            .filter(PlotLine.book_id == book_id)
-            .all()
-        )
-        line_names = [line.name for line in lines]
-        line_map = {line.id: line.name for line in lines}
+            # Сюжетные линии: совпавшие (в т.ч. переименованные) сохраняют свои события
+            old_lines = self.session.query(PlotLine).filter(PlotLine.book_id == book_id).all()
+            storylines = list(dict.fromkeys(storylines))
+            line_pairs = match_storylines(storylines, [line.name for line in old_lines])
+            line_map = {}
+            for i, name in enumerate(storylines):
+                if i in line_pairs:
+                    line = old_lines[line_pairs[i]]
+                    line.name = name
+                else:
+                    line = PlotLine(name=name, book_id=book_id)
+                    self.session.add(line)
+                line_map[name] = line
+            removed_line_ids = [
+                line.id for j, line in enumerate(old_lines) if j not in set(line_pairs.values())
+            ]
+            if removed_line_ids:
+                self.session.execute(delete(PlotEvent).where(PlotEvent.plot_line_id.in_(removed_line_ids)))
+                self.session.execute(delete(PlotLine).where(PlotLine.id.in_(removed_line_ids)))
+            self.session.flush()
 
-        events = (
-            self.session.query(PlotEvent)
-            .join(PlotLine)
-            .filter(PlotLine.book_id == book_id)
-            .all()
-        )
+            old_chapters = (
+                self.session.query(Chapter).filter(Chapter.book_id == book_id).order_by(Chapter.number).all()
+            )
+            old_events = {}
+            for event in (
+                self.session.query(PlotEvent).join(Chapter).filter(Chapter.book_id == book_id).all()
+            ):
+                old_events.setdefault(event.chapter_id, {})[event.plot_line_id] = event
 
-        event_map = {}
-        for ev in events:
-            ch_id = ev.chapter_id
-            if ch_id not in event_map:
-                event_map[ch_id] = {}
-            event_map[ch_id][line_map[ev.plot_line_id]] = ev.description
+            new_keys = [(int(ch["chapter"]), ch.get("title", f"Глава {ch['chapter']}")) for ch in chapters]
+            chapter_pairs = match_chapters(new_keys, [(ch.number, ch.title) for ch in old_chapters])
 
-        data = []
-        for ch in chapters:
-            row = {
-                "Chapter": ch.number,
-                "Title": ch.title,
-                "Generate": ch.generate_flag,
-                "Summary": ch.context_summary or "",  # краткое резюме для LLM
-                "Content": ch.content or ""          # полный текст — для кнопки "Читать"
-            }
-            # Добавляем сюжетные линии
-            for line_name in line_names:
-                row[line_name] = event_map.get(ch.id, {}).get(line_name, "")
-            data.append(row)
+            # Позиции в новой нумерации, с которых сдвинулся контекст: новые главы и главы,
+            # идущие сразу за удалёнными
+            new_numbers = {j: new_keys[i][0] for i, j in chapter_pairs.items()}
+            shifted_positions = [new_keys[i][0] for i in range(len(chapters)) if i not in chapter_pairs]
+            for j in range(len(old_chapters)):
+                following = [number for k, number in new_numbers.items() if k > j]
+                if j not in new_numbers and following:
+                    shifted_positions.append(min(following))
+
+            # Номер главы уникален в книге: пропавшие главы удаляем сразу, а совпавшие временно
+            # уводим на отрицательные номера, чтобы сдвиг нумерации не сталкивался сам с собой
+            matched = set(chapter_pairs.values())
+            removed_ids = [chapter.id for j, chapter in enumerate(old_chapters) if j not in matched]
+            if removed_ids:
+                removed_bodies = [chapter.body_hash for j, chapter in enumerate(old_chapters) if j not in matched]
+                self.session.execute(delete(PlotEvent).where(PlotEvent.chapter_id.in_(removed_ids)))
+                self.session.execute(delete(Chapter).where(Chapter.id.in_(removed_ids)))
+                self.bodies.prune(removed_bodies)
+            for j in matched:
+                old_chapters[j].number = -old_chapters[j].id
+            self.session.flush()
+
+            stats = {"kept": 0, "changed": 0, "added": 0, "removed": len(removed_ids), "stale": []}
+            changed_numbers = []
+            for i, ch in enumerate(chapters):
+                number, title = new_keys[i]
+                desired = {
+                    line_map[name].id: description
+                    for name, description in normalize_events(ch.get("events")).items()
+                    if name in line_map
+                }
+                if i in chapter_pairs:
+                    chapter = old_chapters[chapter_pairs[i]]
+                    chapter.number = number
+                    chapter.title = title
+                    current = old_events.get(chapter.id, {})
+                    if {line_id: ev.description for line_id, ev in current.items()} == desired:
+                        stats["kept"] += 1
+                        continue
+                    stats["changed"] += 1
+                    changed_numbers.append(number)
+                    for line_id, event in current.items():
+                        if line_id not in desired:
+                            self.session.delete(event)
+                        else:
+                            event.description = desired[line_id]
+                    for line_id, description in desired.items():
+                        if line_id not in current:
+                            self.session.add(PlotEvent(chapter_id=chapter.id, plot_line_id=line_id, description=description))
+                else:
+                    stats["added"] += 1
+                    chapter = Chapter(book_id=book_id, number=number, title=title, generate_flag=True)
+                    self.session.add(chapter)
+                    self.session.flush()
+                    for line_id, description in desired.items():
+                        self.session.add(PlotEvent(chapter_id=chapter.id, plot_line_id=line_id, description=description))
+
+            self.session.flush()
+
+            stale = set()
+            for number in changed_numbers:
+                stale.update(self._mark_stale(book_id, number, propagation))
+            # Вставка или удаление главы меняет контекст всех следующих — считаем от первой такой позиции
+            if shifted_positions:
+                stale.update(self._mark_stale(book_id, min(shifted_positions), propagation, shifted=True))
+            stats["stale"] = sorted(stale)
+
+            # Номера глав могли сдвинуться — индекс поиска контекста пересоберётся при следующем обращении
+            self.session.execute(delete(ChapterPassage).where(ChapterPassage.book_id == book_id))
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+
+        logger.info(f"✅ Сюжет книги {book_id} обновлён слиянием: {stats}")
+        return stats
+
+    def load_outline(self, book_id: int):
+        """
+        Загружает книгу и сюжет в формате, похожем на Excel.
+        Текст глав не читается: вместо Content — HasContent/ContentLength (байт, из body_bytes)
+        для кнопки "Читать", так что память и время не растут с объёмом написанного.
+        Два запроса: книга с линиями и главы с событиями одним JOIN.
+        """
+        header = self.session.execute(
+            select(Book.title, Book.premise, PlotLine.id, PlotLine.name)
+            .outerjoin(PlotLine, PlotLine.book_id == Book.id)
+            .where(Book.id == book_id)
+            .order_by(PlotLine.id)
+        ).all()
+        if not header:
+            return None
+
+        title, premise = header[0].title, header[0].premise
+        line_map = {row.id: row.name for row in header if row.id is not None}
+        line_names = list(line_map.values())
+
+        content_length = func.coalesce(Chapter.body_bytes, 0)
+        rows = self.session.execute(
+            select(
+                Chapter.id, Chapter.number, Chapter.title, Chapter.generate_flag, Chapter.context_summary,
+                content_length.label("content_length"),
+                PlotEvent.plot_line_id, PlotEvent.description
+            )
+            .outerjoin(PlotEvent, PlotEvent.chapter_id == Chapter.id)
+            .where(Chapter.book_id == book_id)
+            .order_by(Chapter.number, Chapter.id)
+        ).all()
+
+        data, by_id = [], {}
+        for r in rows:
+            row = by_id.get(r.id)
+            if row is None:
+                row = by_id[r.id] = {
+                    "Chapter": r.number,
+                    "Title": r.title,
+                    "Generate": r.generate_flag,
+                    "Summary": r.context_summary or "",  # краткое резюме для LLM
+                    "HasContent": r.content_length > 0,  # есть текст — кнопка "Читать"
+                    "ContentLength": r.content_length,
+                    **{line_name: "" for line_name in line_names}  # сюжетные линии
+                }
+                data.append(row)
+            if r.plot_line_id in line_map:
+                row[line_map[r.plot_line_id]] = r.description
 
         return {
-            "book": {"title": book.title, "premise": book.premise},
+            "book": {"title": title, "premise": premise},
             "storylines": line_names,
             "chapters": data
         }
 
+    @retry_on_lock
     def update_chapter_summary(self, book_id: int, chapter_number: int, summary: str, content: str = None):
         """
         Обновляет главу: снимает флаг generate, добавляет summary и (опционально) текст.
@@ -163,9 +400,127 @@ class OutlineManager:
         chapter.generate_flag = False
         chapter.context_summary = summary
         if content:
-            chapter.content = content
+            self._set_content(chapter, content)
+        if settings.RETRIEVAL_ENABLED:
+            text = content or self.bodies.get(chapter.body_hash)
+            self._index_chapter(book_id, chapter_number, chapter.context_summary, text)
+        self.session.commit()
+
+    @retry_on_lock
+    def save_chapter_content(self, book_id: int, chapter_number: int, content: str):
+        """
+        Сохраняет текст главы, пока резюме ещё не готово (потоковая генерация): флаг generate
+        и резюме не меняются — глава считается написанной только после update_chapter_summary.
+        """
+        chapter = (
+            self.session.query(Chapter)
+            .join(Book)
+            .filter(Book.id == book_id, Chapter.number == chapter_number)
+            .first()
+        )
+        if not chapter:
+            raise ValueError(f"Глава {chapter_number} в книге {book_id} не найдена")
+        self._set_content(chapter, content)
+        self.session.commit()
+
+    def _set_content(self, chapter: Chapter, content: str):
+        """Кладёт текст в хранилище и переводит главу на него; прежний текст удаляется, если больше не нужен"""
+        previous = chapter.body_hash
+        chapter.body_hash, chapter.body_bytes = self.bodies.put(content) if content else (None, None)
+        if previous and previous != chapter.body_hash:
+            self.session.flush()
+            self.bodies.prune([previous])
+
+    def get_chapter_content(self, book_id: int, chapter_number: int) -> Optional[str]:
+        """Текст главы (распаковывается только здесь — страница главы, экспорт); None — не написана"""
+        key = self.session.execute(
+            select(Chapter.body_hash).where(Chapter.book_id == book_id, Chapter.number == chapter_number)
+        ).scalar()
+        return self.bodies.get(key)
+
+    def _index_chapter(self, book_id: int, chapter_number: int, summary: str, content: str):
+        """Заменяет фрагменты главы в индексе поиска контекста (без commit)"""
+        self.session.execute(
+            delete(ChapterPassage).where(
+                ChapterPassage.book_id == book_id, ChapterPassage.chapter_number == chapter_number
+            )
+        )
+        if summary:
+            self.session.add(ChapterPassage(
+                book_id=book_id, chapter_number=chapter_number, kind="summary", position=0, text=summary
+            ))
+        for position, text in enumerate(split_passages(content or "")):
+            self.session.add(ChapterPassage(
+                book_id=book_id, chapter_number=chapter_number, kind="paragraph", position=position, text=text
+            ))
+
+    @retry_on_lock
+    def index_missing_passages(self, book_id: int) -> int:
+        """
+        Индексирует написанные главы, которых нет в chapter_passages (например, созданные до включения поиска)
+        """
+        indexed = {
+            number for (number,) in self.session.query(ChapterPassage.chapter_number)
+            .filter(ChapterPassage.book_id == book_id)
+            .distinct()
+        }
+        missing = (
+            self.session.query(Chapter)
+            .filter(Chapter.book_id == book_id, Chapter.context_summary.isnot(None))
+            .all()
+        )
+        missing = [ch for ch in missing if ch.number not in indexed]
+        texts = self.bodies.get_many(ch.body_hash for ch in missing)
+        for ch in missing:
+            self._index_chapter(book_id, ch.number, ch.context_summary, texts.get(ch.body_hash))
+        if missing:
+            self.session.commit()
+            logger.info(f"Проиндексировано глав для поиска контекста: {len(missing)} (книга {book_id})")
+        return len(missing)
+
+    def get_chapter_passages(self, book_id: int, before_chapter: int) -> list:
+        """
+        Фрагменты глав книги с номером меньше before_chapter
+        """
+        return (
+            self.session.query(ChapterPassage)
+            .filter(ChapterPassage.book_id == book_id, ChapterPassage.chapter_number < before_chapter)
+            .order_by(ChapterPassage.chapter_number, ChapterPassage.position)
+            .all()
+        )
+
+    @retry_on_lock
+    def claim_chapter_stream(self, book_id: int, chapter_number: int) -> bool:
+        """
+        Занимает главу для потоковой генерации в вебе одним условным UPDATE (атомарно между
+        процессами). False — главу уже пишет другой поток; отметка старше CHAPTER_STREAM_LOCK_SECONDS
+        считается брошенной (процесс упал, не сняв её).
+        """
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=settings.CHAPTER_STREAM_LOCK_SECONDS)
+        claimed = self.session.execute(
+            update(Chapter)
+            .where(
+                Chapter.book_id == book_id,
+                Chapter.number == chapter_number,
+                or_(Chapter.stream_started_at.is_(None), Chapter.stream_started_at < stale)
+            )
+            .values(stream_started_at=now)
+        ).rowcount
         self.session.commit()
+        return claimed == 1
 
+    @retry_on_lock
+    def release_chapter_stream(self, book_id: int, chapter_number: int):
+        """Снимает отметку claim_chapter_stream"""
+        self.session.execute(
+            update(Chapter)
+            .where(Chapter.book_id == book_id, Chapter.number == chapter_number)
+            .values(stream_started_at=None)
+        )
+        self.session.commit()
+
+    @retry_on_lock
     def toggle_chapter_generate(self, book_id: int, chapter_number: int, enabled: bool):
         """
         Включает/выключает флаг generate_flag для главы
@@ -180,9 +535,20 @@ class OutlineManager:
             chapter.generate_flag = enabled
             self.session.commit()
             
-    def update_plot_event(self, book_id: int, chapter_number: int, storyline_name: str, new_description: str):
+    @retry_on_lock
+    def update_plot_event(
+        self,
+        book_id: int,
+        chapter_number: int,
+        storyline_name: str,
+        new_description: str,
+        propagation: str = None
+    ) -> List[int]:
         """
-        Обновляет описание события по книге, главе и названию линии
+        Обновляет описание события по книге, главе и названию линии.
+        Если описание изменилось, написанные главы, которые от него зависят, помечаются
+        на перегенерацию (generate_flag) — см. domain/invalidation.py; propagation — политика
+        распространения, по умолчанию STALE_PROPAGATION. Возвращает номера помеченных глав.
         """
         # Находим главу
         chapter = (
@@ -211,9 +577,11 @@ class OutlineManager:
         )
 
         if event:
+            changed = event.description != new_description
             event.description = new_description
         else:
             # Если события не было — создаём
+            changed = bool(new_description)
             event = PlotEvent(
                 chapter_id=chapter.id,
                 plot_line_id=plot_line.id,
@@ -221,8 +589,36 @@ class OutlineManager:
             )
             self.session.add(event)
 
+        stale = self._mark_stale(book_id, chapter_number, propagation) if changed else []
         self.session.commit()
+        return stale
+
+    def _mark_stale(self, book_id: int, chapter_number: int, propagation: str = None, shifted: bool = False) -> List[int]:
+        """
+        Ставит generate_flag устаревшим написанным главам (без commit).
+        shifted=True — на месте chapter_number глава вставлена или удалена: устаревают следующие главы.
+        """
+        written = dict(
+            self.session.query(Chapter.number, Chapter.id)
+            .filter(Chapter.book_id == book_id, Chapter.body_hash.isnot(None))
+            .all()
+        )
+        find_stale = stale_after if shifted else stale_chapters
+        stale = find_stale(
+            chapter_number,
+            written,
+            policy=propagation or settings.STALE_PROPAGATION,
+            window=settings.STALE_PROPAGATION_WINDOW
+        )
+        if stale:
+            self.session.execute(
+                update(Chapter).where(Chapter.id.in_([written[number] for number in stale])).values(generate_flag=True)
+            )
+            action = "вставки или удаления" if shifted else "правки"
+            logger.info(f"Книга {book_id}: после {action} главы {chapter_number} на перегенерацию помечены {stale}")
+        return stale
     
+    @retry_on_lock
     def delete_book(self, book_id: int, user_id: int):
         """
         Полностью удаляет книгу и всё, что с ней связано
@@ -234,6 +630,78 @@ class OutlineManager:
         # Удаляем всё, что связано с книгой
         self.session.execute(delete(PlotEvent).where(PlotEvent.chapter.has(book_id=book_id)))
         self.session.execute(delete(PlotLine).where(PlotLine.book_id == book_id))
+        body_hashes = self.session.execute(
+            select(Chapter.body_hash).where(Chapter.book_id == book_id)
+        ).scalars().all()
         self.session.execute(delete(Chapter).where(Chapter.book_id == book_id))
+        self.bodies.prune(body_hashes)
+        run_ids = self.session.query(GenerationRun.id).filter(GenerationRun.book_id == book_id)
+        self.session.execute(delete(GenerationRunChapter).where(GenerationRunChapter.run_id.in_(run_ids.scalar_subquery())))
+        self.session.execute(delete(GenerationRun).where(GenerationRun.book_id == book_id))
+        self.session.execute(delete(GenerationJob).where(GenerationJob.book_id == book_id))
+        self.session.execute(delete(LLMUsage).where(LLMUsage.book_id == book_id))
+        self.session.execute(delete(SummaryDigest).where(SummaryDigest.book_id == book_id))
+        self.session.execute(delete(ChapterPassage).where(ChapterPassage.book_id == book_id))
         self.session.execute(delete(Book).where(Book.id == book_id))
-        self.session.commit()
\ No newline at end of file
+        self.session.commit()
+
+    @retry_on_lock
+    def record_llm_usage(self, book_id: int, records: list, operation: str, chapter_number: int = None):
+        """
+        Сохраняет расход токенов (список UsageRecord из track_usage) по книге.
+        """
+        if not records:
+            return
+        for record in records:
+            self.session.add(LLMUsage(
+                book_id=book_id,
+                chapter_number=chapter_number,
+                operation=operation,
+                provider=record.provider,
+                model=record.model,
+                input_tokens=record.input_tokens,
+                output_tokens=record.output_tokens,
+                estimated=record.estimated
+            ))
+        self.session.commit()
+
+    def get_book_usage(self, book_id: int) -> dict:
+        """
+        Суммарный расход токенов по книге
+        """
+        calls, input_tokens, output_tokens = (
+            self.session.query(
+                func.count(LLMUsage.id),
+                func.coalesce(func.sum(LLMUsage.input_tokens), 0),
+                func.coalesce(func.sum(LLMUsage.output_tokens), 0)
+            )
+            .filter(LLMUsage.book_id == book_id)
+            .one()
+        )
+        return {"calls": calls, "input_tokens": input_tokens, "output_tokens": output_tokens}
+
+    def get_summary_digests(self, book_id: int) -> dict:
+        """
+        Сохранённые дайджесты резюме книги: (level, start_chapter, end_chapter) → SummaryDigest
+        """
+        digests = self.session.query(SummaryDigest).filter(SummaryDigest.book_id == book_id).all()
+        return {(d.level, d.start_chapter, d.end_chapter): d for d in digests}
+
+    @retry_on_lock
+    def save_summary_digest(
+        self, book_id: int, level: str, start_chapter: int, end_chapter: int, source_hash: str, text: str
+    ):
+        """
+        Создаёт или обновляет дайджест диапазона глав одним upsert по uq_summary_digests_range:
+        два процесса, посчитавшие один дайджест, не создадут две строки
+        """
+        key = {"book_id": book_id, "level": level, "start_chapter": start_chapter, "end_chapter": end_chapter}
+        self.session.execute(
+            sqlite_insert(SummaryDigest)
+            .values(**key, source_hash=source_hash, text=text, created_at=datetime.utcnow())
+            .on_conflict_do_update(
+                index_elements=list(key), set_={"source_hash": source_hash, "text": text}
+            )
+        )
+        self.session.commit()
+        return self.session.query(SummaryDigest).filter_by(**key).populate_existing().one()
@@ -0,0 +1,109 @@
+# infrastructure/prompt_cache.py
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from config.settings import settings
+from domain.prompt_prefix import current_prefix
+from logger import logger
+
+_current_scope: ContextVar[Optional["PromptCacheScope"]] = ContextVar("prompt_cache_scope", default=None)
+
+
+def prefix_key(prefix: str) -> str:
+    return hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:32]
+
+
+def split_prefix(prompt: str, count_tokens: Callable[[str], int]) -> Optional[tuple]:
+    """
+    (префикс, остаток промпта), если промпт начинается с помеченного префикса
+    и тот достаточно длинный для кэша провайдера; иначе None.
+    """
+    prefix = current_prefix()
+    if not prefix or not prompt.startswith(prefix):
+        return None
+    if count_tokens(prefix) < settings.PROMPT_CACHE_MIN_TOKENS:
+        return None
+    return prefix, prompt[len(prefix):]
+
+
+class PromptCacheScope:
+    """
+    Время жизни кэшей префиксов — один запуск генерации: хэндлы провайдеров (Gemini cached content)
+    создаются при первой главе и удаляются при выходе из prompt_cache_scope. TTL у провайдера —
+    страховка на случай падения процесса. Для fake-провайдера здесь же живёт симуляция попаданий.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._handles = {}  # (provider, model, prefix_key) → (handle, release)
+        self._seen = {}  # симуляция: (provider, model, prefix_key) → время последнего использования
+        self._lock = threading.Lock()
+
+    def get_or_create(self, provider: str, model: str, prefix: str, create: Callable, release: Callable):
+        """Хэндл кэша префикса; None — провайдер отказался его создавать (повторно не пробуем)"""
+        key = (provider, model, prefix_key(prefix))
+        with self._lock:
+            if key in self._handles:
+                return self._handles[key][0]
+            try:
+                handle = create()
+                logger.info(f"Кэш префикса {provider}/{model} создан для «{self.name}»")
+            except Exception as e:
+                logger.warning(f"Кэш префикса {provider}/{model} недоступен: {e}")
+                handle = None
+            self._handles[key] = (handle, release)
+            return handle
+
+    def simulate(self, provider: str, model: str, prefix: str) -> bool:
+        """Локальная имитация кэша: True, если этот префикс уже был в пределах TTL"""
+        key = (provider, model, prefix_key(prefix))
+        now = time.monotonic()
+        with self._lock:
+            last = self._seen.get(key)
+            self._seen[key] = now
+        return last is not None and now - last < settings.PROMPT_CACHE_TTL_SECONDS
+
+    def close(self):
+        with self._lock:
+            handles, self._handles = list(self._handles.values()), {}
+        for handle, release in handles:
+            if handle is None:
+                continue
+            try:
+                release(handle)
+            except Exception as e:
+                logger.warning(f"Не удалось удалить кэш префикса: {e}")
+
+
+def active_scope() -> Optional[PromptCacheScope]:
+    return _current_scope.get()
+
+
+@contextmanager
+def prompt_cache_scope(name: str):
+    """
+    Область жизни кэшей префиксов (обычно — запуск генерации глав книги).
+    Вне области провайдеры не создают платных кэшей: OpenAI кэширует префиксы сам, Gemini — нет.
+    """
+    if _current_scope.get() is not None:
+        yield _current_scope.get()  # вложенная область использует внешнюю
+        return
+    scope = PromptCacheScope(name)
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+        scope.close()
+
+
+def record_prompt_cache(provider: str, prompt_tokens: int, cached_tokens: int, seconds: float):
+    """Метрики кэша префиксов: попадание/промах, сэкономленные входные токены, задержка по результату"""
+    from infrastructure.metrics import observe_prompt_cache  # локальный импорт: metrics импортирует llm_client
+
+    observe_prompt_cache(provider, prompt_tokens, cached_tokens, seconds)
+    if cached_tokens:
+        logger.debug(f"Кэш префикса {provider}: {cached_tokens} из {prompt_tokens} входных токенов")
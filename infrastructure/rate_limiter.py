@@ -0,0 +1,253 @@
+# infrastructure/rate_limiter.py
+import asyncio
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from typing import Iterator, Optional
+
+from config.settings import settings
+from domain.retry import backoff_delay
+from domain.tokenizer import estimate_tokens
+from infrastructure.llm_client import LLMClient
+from infrastructure.metrics import record_retry
+from logger import logger
+
+RETRYABLE_STATUS_CODES = (429, 500, 503)
+
+
+def error_status_code(error: Exception) -> Optional[int]:
+    """HTTP-код ошибки провайдера: openai.APIStatusError.status_code или google.api_core .code"""
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+        # google.api_core отдаёт http.HTTPStatus / grpc коды — берём числовое значение
+        if value is not None and isinstance(getattr(value, "value", None), int):
+            return value.value
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    return error_status_code(error) in RETRYABLE_STATUS_CODES
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Достаёт Retry-After из заголовков ответа (OpenAI) или retry_delay из текста ошибки (Gemini)"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+
+    match = re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)", str(error))
+    if match:
+        return float(match.group(1))
+    return None
+
+
+def estimate_request_tokens(prompt: str, provider: str = "gemini") -> int:
+    """Оценка токенов запроса с учётом ожидаемого ответа — для бюджета TPM"""
+    return estimate_tokens(prompt, provider) + settings.RATE_LIMIT_EXPECTED_OUTPUT_TOKENS
+
+
+class SQLiteRateLimiter:
+    """
+    Token bucket, общий для всех процессов (воркеры gunicorn, фоновый воркер, CLI).
+    Состояние корзин хранится в SQLite-файле на общем томе; BEGIN IMMEDIATE сериализует доступ.
+    Две корзины: запросы в минуту (RPM) и токены в минуту (TPM).
+    """
+    def __init__(self, path: str, requests_per_minute: int, tokens_per_minute: int, name: str = "llm"):
+        self.path = path
+        self.name = name
+        self.limits = {
+            "requests": float(requests_per_minute),
+            "tokens": float(tokens_per_minute),
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    name TEXT PRIMARY KEY,
+                    level REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _bucket_name(self, kind: str) -> str:
+        return f"{self.name}:{kind}"
+
+    def _refilled_levels(self, conn, now: float) -> dict:
+        levels = {}
+        for kind, capacity in self.limits.items():
+            row = conn.execute(
+                "SELECT level, updated_at FROM rate_buckets WHERE name = ?", (self._bucket_name(kind),)
+            ).fetchone()
+            if row is None:
+                levels[kind] = capacity
+            else:
+                level, updated_at = row
+                rate = capacity / 60.0
+                levels[kind] = min(capacity, level + (now - updated_at) * rate)
+        return levels
+
+    def try_acquire(self, tokens: int) -> float:
+        """
+        Пытается списать 1 запрос и tokens токенов.
+        Возвращает 0, если списано, иначе — сколько секунд подождать до следующей попытки.
+        """
+        needed = {"requests": 1.0, "tokens": float(min(tokens, self.limits["tokens"]))}
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            levels = self._refilled_levels(conn, now)
+
+            wait = 0.0
+            for kind, amount in needed.items():
+                if levels[kind] < amount:
+                    rate = self.limits[kind] / 60.0
+                    wait = max(wait, (amount - levels[kind]) / rate)
+
+            if wait == 0.0:
+                for kind, amount in needed.items():
+                    conn.execute(
+                        "INSERT OR REPLACE INTO rate_buckets (name, level, updated_at) VALUES (?, ?, ?)",
+                        (self._bucket_name(kind), levels[kind] - amount, now)
+                    )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def acquire(self, tokens: int, max_wait: float = None):
+        """Блокирует поток, пока квота не позволит выполнить запрос"""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0.0:
+                if waited:
+                    logger.debug(f"Rate limiter: ждали квоту {waited:.1f} с")
+                return
+            if max_wait is not None and waited + wait > max_wait:
+                raise TimeoutError(f"Квота LLM не освободилась за {max_wait} с")
+            # Небольшой джиттер, чтобы процессы не просыпались одновременно
+            sleep_for = wait + random.uniform(0, 0.1)
+            time.sleep(sleep_for)
+            waited += sleep_for
+
+    async def aacquire(self, tokens: int):
+        while True:
+            wait = await asyncio.to_thread(self.try_acquire, tokens)
+            if wait == 0.0:
+                return
+            await asyncio.sleep(wait + random.uniform(0, 0.1))
+
+    def usage(self) -> dict:
+        """Текущее использование квоты: сколько запросов и токенов доступно прямо сейчас"""
+        with self._connect() as conn:
+            levels = self._refilled_levels(conn, time.time())
+        return {
+            kind: {
+                "limit_per_minute": capacity,
+                "available": round(levels[kind], 1),
+                "used": round(capacity - levels[kind], 1),
+            }
+            for kind, capacity in self.limits.items()
+        }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> SQLiteRateLimiter:
+    """Общий для процесса лимитер (состояние всё равно в файле — общее для всех процессов)"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = SQLiteRateLimiter(
+                path=settings.RATE_LIMIT_DB_PATH,
+                requests_per_minute=settings.RATE_LIMIT_RPM,
+                tokens_per_minute=settings.RATE_LIMIT_TPM
+            )
+        return _limiter
+
+
+class RateLimitedLLMClient(LLMClient):
+    """
+    Декоратор: перед каждым вызовом берёт квоту из общего лимитера,
+    на 429/503 повторяет запрос с экспоненциальной задержкой и учётом Retry-After.
+    """
+    stats_name = "rate_limit"
+
+    def __init__(self, inner: LLMClient, limiter: SQLiteRateLimiter, max_retries: int = None):
+        super().__init__(inner.language)
+        self.inner = inner
+        self.limiter = limiter
+        self.max_retries = settings.RATE_LIMIT_MAX_RETRIES if max_retries is None else max_retries
+        self.provider = inner.provider
+        self.model_name = inner.model_name
+        self.temperature = inner.temperature
+        self.system_instruction = inner.system_instruction
+
+    def _retry_delay(self, attempt: int, error: Exception) -> Optional[float]:
+        if not is_retryable(error) or attempt >= self.max_retries:
+            return None
+        delay = backoff_delay(attempt, retry_after=retry_after_seconds(error))
+        record_retry(self.provider, str(error_status_code(error)))
+        logger.warning(
+            f"{self.provider}: ошибка {error_status_code(error)}, повтор через {delay:.1f} с "
+            f"(попытка {attempt + 1}/{self.max_retries})"
+        )
+        return delay
+
+    def generate_text(self, prompt: str, **kwargs) -> str:
+        attempt = 0
+        while True:
+            self.limiter.acquire(estimate_request_tokens(prompt, self.provider))
+            try:
+                return self.inner.generate_text(prompt, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    async def agenerate_text(self, prompt: str, **kwargs) -> str:
+        attempt = 0
+        while True:
+            await self.limiter.aacquire(estimate_request_tokens(prompt, self.provider))
+            try:
+                return await self.inner.agenerate_text(prompt, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def generate_text_stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        # Поток нельзя безопасно повторить после первых кусков — только берём квоту
+        self.limiter.acquire(estimate_request_tokens(prompt, self.provider))
+        yield from self.inner.generate_text_stream(prompt, **kwargs)
+
+    def stats(self) -> dict:
+        return self.limiter.usage()
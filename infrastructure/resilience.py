@@ -0,0 +1,493 @@
+# infrastructure/resilience.py
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from typing import Iterator, List, Optional
+
+from config.settings import settings
+from infrastructure.llm_client import LLMClient
+from infrastructure.metrics import record_failover
+from infrastructure.rate_limiter import error_status_code
+from logger import logger
+
+
+class DeadlineExceeded(TimeoutError):
+    """Провайдер не ответил за отведённое время"""
+
+
+class CircuitOpenError(RuntimeError):
+    """Выключатели всех доступных провайдеров разомкнуты"""
+
+
+# Классы ошибок SDK по имени (в MRO), чтобы не импортировать openai/google/httpx ради isinstance
+_TIMEOUT_ERRORS = {"TimeoutError", "APITimeoutError", "DeadlineExceeded", "TimeoutException"}
+_CONNECTION_ERRORS = {"ConnectionError", "APIConnectionError", "TransportError", "ServiceUnavailable"}
+
+
+def _error_names(error: Exception) -> set:
+    return {cls.__name__ for cls in type(error).__mro__}
+
+
+def is_timeout_error(error: Exception) -> bool:
+    """Таймаут запроса: наш DeadlineExceeded, openai.APITimeoutError, google DeadlineExceeded, httpx"""
+    return bool(_error_names(error) & _TIMEOUT_ERRORS)
+
+
+def is_provider_failure(error: Exception) -> bool:
+    """
+    Ошибка, которая говорит о состоянии провайдера: таймаут, обрыв соединения или 5xx.
+    Только на них размыкается выключатель и запрос уходит резервному провайдеру; 4xx (кроме них
+    и 429, с которым разбирается лимитер) — ошибка самого запроса, у другого провайдера она повторится.
+    """
+    if isinstance(error, CircuitOpenError) or is_timeout_error(error):
+        return True
+    if _error_names(error) & _CONNECTION_ERRORS:
+        return True
+    status = error_status_code(error)
+    return status is not None and status >= 500
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель провайдера:
+    closed → (N ошибок подряд) → open → (reset_timeout) → half_open — пропускаем один пробный запрос.
+    Успех пробного запроса замыкает цепь, ошибка — снова размыкает.
+    """
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def available(self) -> bool:
+        """Можно ли отправить провайдеру запрос — без захвата пробного (для выбора маршрута)"""
+        with self._lock:
+            if self.state == "open":
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            return not (self.state == "half_open" and self._probe_in_flight)
+
+    def release(self):
+        """Запрос завершился без вердикта о провайдере (429, отмена) — пробный слот освобождается"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"🔌 Провайдер {self.name}: выключатель снова замкнут")
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(
+                        f"🔌 Провайдер {self.name}: выключатель разомкнут после {self.failures} ошибок подряд"
+                    )
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных запросов — для расчёта порога hedging (p95)"""
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+_executors = {}
+
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    """Один выключатель на провайдера в процессе — общий для всех языков и клиентов"""
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                provider, settings.CIRCUIT_BREAKER_FAILURES, settings.CIRCUIT_BREAKER_RESET_SECONDS
+            )
+            _breakers[provider] = breaker
+        return breaker
+
+
+def _get_executor(kind: str) -> concurrent.futures.ThreadPoolExecutor:
+    """
+    Потоки синхронных запросов: hedge — цепочки для дубля. Сами вызовы провайдера в поток не уходят:
+    их дедлайн — таймаут HTTP-клиента SDK, и брошенных по дедлайну потоков не остаётся.
+    """
+    with _breakers_lock:
+        executor = _executors.get(kind)
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix=f"llm-{kind}")
+            _executors[kind] = executor
+        return executor
+
+
+def _reset_after_fork():
+    global _breakers_lock
+    _breakers_lock = threading.Lock()
+    _breakers.clear()
+    _executors.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class GuardedLLMClient(LLMClient):
+    """
+    Дедлайн и выключатель вокруг одного запроса к провайдеру. Стоит под лимитером
+    (см. LLMClientFactory._create_provider_chain): ожидание квоты и паузы между повторами после 429
+    в дедлайн не входят, а сам 429 выключатель не размыкает — провайдер жив, он просит подождать.
+    Дедлайн синхронного вызова — таймаут запроса SDK (LLM_REQUEST_TIMEOUT: httpx у OpenAI,
+    request_options у Gemini): вызов идёт в текущем потоке, его таймаут здесь становится DeadlineExceeded.
+    Асинхронный вызов дополнительно ограничен timeout через asyncio.wait_for.
+    """
+    stats_name = "deadline"
+
+    def __init__(self, inner: LLMClient, timeout: float = None):
+        super().__init__(inner.language)
+        self.inner = inner
+        self.provider = inner.provider
+        self.model_name = inner.model_name
+        self.temperature = inner.temperature
+        self.system_instruction = inner.system_instruction
+        self.timeout = settings.LLM_REQUEST_TIMEOUT if timeout is None else timeout
+        self.breaker = get_circuit_breaker(inner.provider)
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def _admit(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"LLM-провайдер {self.provider} временно недоступен")
+
+    def _record_error(self, error: Exception):
+        if is_provider_failure(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.release()  # 429 и ошибки самого запроса — провайдер жив
+
+    def _timeout_error(self) -> DeadlineExceeded:
+        with self._lock:
+            self.timeouts += 1
+        self.breaker.record_failure()
+        return DeadlineExceeded(f"LLM {self.provider} не ответил за {self.timeout:.0f} с")
+
+    def generate_text(self, prompt: str, **kwargs) -> str:
+        self._admit()
+        try:
+            result = self.inner.generate_text(prompt, **kwargs)
+        except Exception as e:
+            if is_timeout_error(e):
+                raise self._timeout_error() from e
+            self._record_error(e)
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def agenerate_text(self, prompt: str, **kwargs) -> str:
+        self._admit()
+        try:
+            result = await asyncio.wait_for(self.inner.agenerate_text(prompt, **kwargs), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._timeout_error() from None
+        except asyncio.CancelledError:
+            self.breaker.release()  # проигравший дубль hedging
+            raise
+        except Exception as e:
+            if is_timeout_error(e):
+                raise self._timeout_error() from e
+            self._record_error(e)
+            raise
+        self.breaker.record_success()
+        return result
+
+    def generate_text_stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Дедлайн потока — таймаут HTTP-клиента провайдера; здесь только выключатель"""
+        self._admit()
+        try:
+            yield from self.inner.generate_text_stream(prompt, **kwargs)
+        except GeneratorExit:
+            self.breaker.release()
+            raise
+        except Exception as e:
+            self._record_error(e)
+            raise
+        self.breaker.record_success()
+
+    def stats(self) -> dict:
+        return {"timeout_seconds": self.timeout, "timeouts": self.timeouts, **self.breaker.stats()}
+
+
+class _Route:
+    """Цепочка провайдера (лимитер → дедлайн → провайдер), его выключатель и статистика задержек"""
+    def __init__(self, client: LLMClient, min_samples: int):
+        self.client = client
+        self.name = client.provider
+        self.breaker = get_circuit_breaker(client.provider)
+        self.latency = LatencyTracker(min_samples=min_samples)
+
+    def record(self, started: float):
+        self.latency.add(time.perf_counter() - started)
+
+
+class ResilientLLMClient(LLMClient):
+    """
+    Переключение на резервный провайдер, когда основной разомкнут или падает по таймауту (в том числе
+    по дедлайну GuardedLLMClient внутри его цепочки), обрыву соединения или с 5xx (is_provider_failure). С hedge=True после p95 задержки основного провайдера
+    отправляется дублирующий запрос — берём тот ответ, что придёт первым.
+    """
+    stats_name = "resilience"
+
+    def __init__(
+        self,
+        primary: LLMClient,
+        fallback: LLMClient = None,
+        hedge: bool = None,
+        hedge_min_samples: int = None
+    ):
+        super().__init__(primary.language)
+        self.inner = primary
+        self.provider = primary.provider
+        self.model_name = primary.model_name
+        self.temperature = primary.temperature
+        self.system_instruction = primary.system_instruction
+        self.hedge = settings.LLM_HEDGE_ENABLED if hedge is None else hedge
+        min_samples = settings.LLM_HEDGE_MIN_SAMPLES if hedge_min_samples is None else hedge_min_samples
+        self.routes: List[_Route] = [_Route(primary, min_samples)]
+        if fallback is not None:
+            self.routes.append(_Route(fallback, min_samples))
+        self.failovers = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _next_route(self, used: list) -> Optional[_Route]:
+        # Пробный запрос полуоткрытого выключателя захватывает GuardedLLMClient — здесь только проверка
+        for route in self.routes:
+            if route not in used and route.breaker.available():
+                return route
+        return None
+
+    def _start_route(self, used: list, previous: Optional[_Route], reason: str) -> Optional[_Route]:
+        route = self._next_route(used)
+        if route is None:
+            return None
+        if route is not self.routes[0] or previous is not None:
+            from_name = previous.name if previous else self.routes[0].name
+            record_failover(from_name, route.name, reason)
+            self._count("failovers")
+            logger.warning(f"LLM: переключаемся {from_name} → {route.name} ({reason})")
+        used.append(route)
+        return route
+
+    def _hedge_delay(self, route: _Route) -> Optional[float]:
+        if not self.hedge:
+            return None
+        return route.latency.percentile(0.95)
+
+    def _hedge_route(self, used: list) -> _Route:
+        """Дубль — на резервный провайдер, если он доступен, иначе повторно на тот же"""
+        route = self._next_route(used) or used[0]
+        if route not in used:
+            used.append(route)
+        record_failover(used[0].name, route.name, "hedge")
+        self._count("hedges")
+        return route
+
+    # --- синхронный вызов ---
+
+    def _submit(self, route: _Route, prompt: str, kwargs: dict) -> concurrent.futures.Future:
+        def call():
+            started = time.perf_counter()
+            result = route.client.generate_text(prompt, **kwargs)
+            route.record(started)
+            return result
+
+        # Контекст (track_usage, llm_operation) переносим в поток вызова
+        context = contextvars.copy_context()
+        return _get_executor("hedge").submit(context.run, call)
+
+    def generate_text(self, prompt: str, **kwargs) -> str:
+        used = []
+        route = self._start_route(used, None, "circuit_open")
+        if route is None:
+            raise CircuitOpenError("Все LLM-провайдеры временно недоступны")
+
+        hedge_delay = self._hedge_delay(route)
+        if hedge_delay is None:
+            # Без дубля поток не нужен — сразу вызываем цепочку, при ошибке переключаемся
+            while True:
+                started = time.perf_counter()
+                try:
+                    result = route.client.generate_text(prompt, **kwargs)
+                except Exception as e:
+                    logger.warning(f"LLM {route.name}: {type(e).__name__}: {e}")
+                    route = self._start_route(used, route, "error") if is_provider_failure(e) else None
+                    if route is None:
+                        raise
+                    continue
+                route.record(started)
+                return result
+
+        started = time.monotonic()
+        pending = {self._submit(route, prompt, kwargs): route}
+        last_error = None
+        while pending:
+            timeout = None if hedge_delay is None else max(0.0, started + hedge_delay - time.monotonic())
+            done, _ = concurrent.futures.wait(pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                route = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"LLM {route.name}: {type(e).__name__}: {e}")
+                    if not pending and is_provider_failure(e):
+                        route = self._start_route(used, route, "error")
+                        if route is not None:
+                            pending[self._submit(route, prompt, kwargs)] = route
+            if not done:
+                hedge_delay = None
+                route = self._hedge_route(used)
+                pending[self._submit(route, prompt, kwargs)] = route
+
+        raise last_error
+
+    # --- асинхронный вызов ---
+
+    async def _acall(self, route: _Route, prompt: str, kwargs: dict) -> str:
+        started = time.perf_counter()
+        result = await route.client.agenerate_text(prompt, **kwargs)
+        route.record(started)
+        return result
+
+    async def agenerate_text(self, prompt: str, **kwargs) -> str:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        used = []
+        route = self._start_route(used, None, "circuit_open")
+        if route is None:
+            raise CircuitOpenError("Все LLM-провайдеры временно недоступны")
+
+        pending = {asyncio.ensure_future(self._acall(route, prompt, kwargs)): route}
+        hedge_delay = self._hedge_delay(route)
+        last_error = None
+
+        try:
+            while pending:
+                timeout = None if hedge_delay is None else max(0.0, started + hedge_delay - loop.time())
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    route = pending.pop(task)
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        last_error = e
+                        logger.warning(f"LLM {route.name}: {type(e).__name__}: {e}")
+                        if not pending and is_provider_failure(e):
+                            route = self._start_route(used, route, "error")
+                            if route is not None:
+                                pending[asyncio.ensure_future(self._acall(route, prompt, kwargs))] = route
+                if not done:
+                    hedge_delay = None
+                    route = self._hedge_route(used)
+                    pending[asyncio.ensure_future(self._acall(route, prompt, kwargs))] = route
+
+            raise last_error
+        finally:
+            # Проигравший дубль отменяем
+            for task in pending:
+                task.cancel()
+
+    # --- поток ---
+
+    def generate_text_stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """
+        Поток нельзя продублировать или склеить из двух провайдеров: переключаемся,
+        только если провайдер упал до первого куска. Выключатель ведёт GuardedLLMClient в цепочке.
+        """
+        used = []
+        previous = None
+        last_error = None
+        while True:
+            route = self._start_route(used, previous, "error" if previous else "circuit_open")
+            if route is None:
+                if last_error is not None:
+                    raise last_error
+                raise CircuitOpenError("Все LLM-провайдеры временно недоступны")
+
+            yielded = False
+            try:
+                for chunk in route.client.generate_text_stream(prompt, **kwargs):
+                    yielded = True
+                    yield chunk
+            except Exception as e:
+                if yielded or not is_provider_failure(e):
+                    raise
+                logger.warning(f"LLM {route.name}: {type(e).__name__}: {e}")
+                last_error = e
+                previous = route
+                continue
+            return
+
+    def stats(self) -> dict:
+        return {
+            "failovers": self.failovers,
+            "hedges": self.hedges,
+            "providers": [
+                {
+                    "provider": route.name,
+                    **route.breaker.stats(),
+                    "p95_ms": round(1000 * p95, 1) if (p95 := route.latency.percentile(0.95)) else None,
+                }
+                for route in self.routes
+            ],
+        }
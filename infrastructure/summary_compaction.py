@@ -0,0 +1,165 @@
+# infrastructure/summary_compaction.py
+import asyncio
+import hashlib
+from typing import Generator, List, Tuple
+
+from config.settings import settings
+from logger import logger
+
+
+def _source_hash(parts: list) -> str:
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class SummaryCompactor:
+    """
+    Компактный контекст предыдущих глав для длинных книг:
+
+        [книга до главы X] + [дайджесты последних арок] + [главы незакрытой арки] + [последние главы дословно]
+
+    Главы делятся на арки по arc_size (1–8, 9–16, ...). Арка, целиком ушедшая за окно последних глав,
+    сворачивается в дайджест; когда дайджестов больше max_arcs, самые старые накатываются в книжный
+    дайджест (предыдущий книжный + очередная арка). Дайджесты хранятся в БД (summary_digests) и
+    пересчитываются, только если изменились исходные резюме — поэтому каждый считается один раз,
+    а размер контекста главы не растёт с длиной книги.
+    """
+    def __init__(
+        self,
+        generator,
+        manager,
+        book_id: int,
+        recent: int = None,
+        arc_size: int = None,
+        max_arcs: int = None
+    ):
+        self.generator = generator
+        self.manager = manager
+        self.book_id = book_id
+        self.recent = settings.SUMMARY_RECENT_CHAPTERS if recent is None else recent
+        self.arc_size = arc_size or settings.SUMMARY_ARC_SIZE
+        self.max_arcs = settings.SUMMARY_MAX_ARCS if max_arcs is None else max_arcs
+        self._digests = None
+        self._inflight = {}  # (level, start, end, source_hash) → asyncio.Task запроса дайджеста
+
+    @property
+    def digests(self) -> dict:
+        if self._digests is None:
+            self._digests = self.manager.get_summary_digests(self.book_id)
+        return self._digests
+
+    def _stored(self, level: str, start: int, end: int, parts: list):
+        """(source_hash, текст из БД или None, если исходные резюме изменились)"""
+        source_hash = _source_hash(parts)
+        stored = self.digests.get((level, start, end))
+        if stored is not None and stored.source_hash == source_hash:
+            return source_hash, stored.text
+        logger.info(f"Дайджест {level} глав {start}–{end} для книги {self.book_id}")
+        return source_hash, None
+
+    def _save(self, level: str, start: int, end: int, source_hash: str, text: str) -> str:
+        self.digests[(level, start, end)] = self.manager.save_summary_digest(
+            self.book_id, level, start, end, source_hash, text
+        )
+        return text
+
+    def _digest(self, level: str, start: int, end: int, parts: list) -> str:
+        """Дайджест из БД, если исходные резюме не менялись, иначе — новый запрос к LLM"""
+        source_hash, text = self._stored(level, start, end, parts)
+        if text is not None:
+            return text
+        return self._save(level, start, end, source_hash, self.generator.summarize_digest(parts, start, end))
+
+    async def _adigest(self, level: str, start: int, end: int, parts: list) -> str:
+        """
+        Асинхронная версия _digest — не блокирует цикл событий запросом к LLM. Главы конвейера делят
+        один компактор, поэтому одинаковый дайджест запрашивается одной задачей, остальные её ждут.
+        """
+        source_hash, text = self._stored(level, start, end, parts)
+        if text is not None:
+            return text
+        key = (level, start, end, source_hash)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._arequest_digest(level, start, end, source_hash, parts))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: отмена одной главы не отменяет запрос, которого ждут другие
+        return await asyncio.shield(task)
+
+    async def _arequest_digest(self, level: str, start: int, end: int, source_hash: str, parts: list) -> str:
+        text = await self.generator.asummarize_digest(parts, start, end)
+        return self._save(level, start, end, source_hash, text)
+
+    def compact(self, previous: List[Tuple[int, str]]) -> List[str]:
+        """
+        previous — [(номер главы, резюме)] по возрастанию номера.
+        Возвращает строки для BookGenerator.build_chapter_prompt(previous_summaries=...).
+        """
+        steps = self._steps(previous)
+        try:
+            request = next(steps)
+            while True:
+                request = steps.send(self._digest(*request))
+        except StopIteration as done:
+            return done.value
+
+    async def acompact(self, previous: List[Tuple[int, str]]) -> List[str]:
+        """
+        Асинхронная версия compact для конвейерной генерации. Если дайджест получить не удалось,
+        возвращает резюме дословно — глава пишется с длинным контекстом, а не падает.
+        """
+        steps = self._steps(previous)
+        try:
+            request = next(steps)
+            while True:
+                request = steps.send(await self._adigest(*request))
+        except StopIteration as done:
+            return done.value
+        except Exception as e:
+            logger.warning(f"Сжатие контекста книги {self.book_id} не удалось, резюме идут без сжатия: {e}")
+            return [f"Глава {number}: {summary}" for number, summary in previous]
+
+    def _steps(self, previous: List[Tuple[int, str]]) -> Generator[tuple, str, List[str]]:
+        """
+        Раскладка контекста: отдаёт наружу запросы дайджестов (level, start, end, parts)
+        и получает их тексты через send() — так compact и acompact делят одну логику.
+        """
+        verbatim = [f"Глава {number}: {summary}" for number, summary in previous]
+        if len(previous) <= self.recent + self.arc_size:
+            return verbatim
+
+        recent = previous[-self.recent:] if self.recent else []
+        older = previous[:len(previous) - len(recent)]
+        first_recent = recent[0][0] if recent else older[-1][0] + 1
+
+        # Группируем старые главы по аркам; арка закрыта, если целиком лежит до окна последних глав
+        arcs = {}
+        for number, summary in older:
+            arcs.setdefault((number - 1) // self.arc_size, []).append((number, summary))
+
+        closed, open_tail = [], []
+        for index in sorted(arcs):
+            start, end = index * self.arc_size + 1, (index + 1) * self.arc_size
+            if end < first_recent:
+                parts = [f"Глава {number}: {summary}" for number, summary in arcs[index]]
+                closed.append((start, end, (yield ("arc", start, end, parts))))
+            else:
+                open_tail.extend(arcs[index])
+
+        context = []
+        rolled = closed[:max(0, len(closed) - self.max_arcs)]
+        if rolled:
+            # Книжный дайджест накатывается по одной арке: 1–8, затем 1–16 = (1–8) + (9–16), ...
+            book_text = rolled[0][2]
+            for start, end, arc_text in rolled[1:]:
+                book_text = yield (
+                    "book", 1, end,
+                    [f"Главы 1–{start - 1}: {book_text}", f"Главы {start}–{end}: {arc_text}"]
+                )
+            context.append(f"Главы 1–{rolled[-1][1]} (кратко): {book_text}")
+
+        for start, end, arc_text in closed[len(rolled):]:
+            context.append(f"Главы {start}–{end} (кратко): {arc_text}")
+        context.extend(f"Глава {number}: {summary}" for number, summary in open_tail)
+        context.extend(f"Глава {number}: {summary}" for number, summary in recent)
+        return context
@@ -0,0 +1,55 @@
+# infrastructure/token_usage.py
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from logger import logger
+
+
+class UsageRecord:
+    """Расход токенов одного вызова LLM"""
+    def __init__(self, provider: str, model: str, input_tokens: int, output_tokens: int, estimated: bool = False):
+        self.provider = provider
+        self.model = model
+        self.input_tokens = input_tokens or 0
+        self.output_tokens = output_tokens or 0
+        self.estimated = estimated  # True — провайдер не вернул usage, посчитано локально
+
+    def __repr__(self):
+        return (f"UsageRecord({self.provider}/{self.model}: in={self.input_tokens}, "
+                f"out={self.output_tokens}{', estimated' if self.estimated else ''})")
+
+
+_current_records: ContextVar[Optional[List[UsageRecord]]] = ContextVar("llm_usage_records", default=None)
+
+
+@contextmanager
+def track_usage():
+    """
+    Собирает расход токенов всех вызовов LLM внутри блока:
+
+        with track_usage() as usage:
+            generator.generate_chapter(...)
+        manager.record_llm_usage(book_id, usage, operation="chapter")
+
+    Работает и для asyncio-задач, созданных внутри блока (контекст копируется вместе со списком).
+    """
+    records: List[UsageRecord] = []
+    token = _current_records.set(records)
+    try:
+        yield records
+    finally:
+        _current_records.reset(token)
+
+
+def record_usage(provider: str, model: str, input_tokens: int, output_tokens: int, estimated: bool = False):
+    """Вызывается клиентами после каждого ответа провайдера"""
+    from infrastructure.metrics import record_tokens  # локальный импорт: metrics импортирует llm_client
+
+    record = UsageRecord(provider, model, input_tokens, output_tokens, estimated)
+    logger.debug(f"LLM usage: {record}")
+    record_tokens(provider, model, record.input_tokens, record.output_tokens)
+    records = _current_records.get()
+    if records is not None:
+        records.append(record)
+    return record
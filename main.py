@@ -11,6 +11,7 @@ def main():
     plot_parser = subparsers.add_parser("generate_outline", help="Generate book outline")
     plot_parser.add_argument("--description", required=True, help="Book description")
     plot_parser.add_argument("--language", default="Русский", help="Book language")
+    plot_parser.add_argument("--chapters", type=int, default=None, help="Number of chapters (long books are outlined by acts)")
     
     chapter_parser = subparsers.add_parser("generate_chapters", help="Generate book chapters")
     chapter_parser.add_argument("--language", default="Русский", help="Book language")
@@ -21,7 +22,7 @@ def main():
     args = parser.parse_args()
     
     if args.command == "generate_outline":
-        generate_outline(args.description, args.language)
+        generate_outline(args.description, args.language, chapter_count=args.chapters)
     elif args.command == "generate_chapters":
         generate_chapters(args.language)
     elif args.command == "compile_book":
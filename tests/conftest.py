@@ -15,4 +15,21 @@ def mock_env_vars():
         'CHAPTERS_DIR': 'test_chapters',
         'DEFAULT_LANGUAGE': 'English'
     }):
-        yield
\ No newline at end of file
+        yield
+
+
+@pytest.fixture
+def db_session():
+    """In-memory SQLite session with all tables created"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from infrastructure.database.models import Base
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
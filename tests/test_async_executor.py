@@ -0,0 +1,46 @@
+# tests/test_async_executor.py
+import asyncio
+import json
+from unittest.mock import Mock, AsyncMock
+
+from infrastructure.async_executor import run_bounded
+from domain.book_logic import BookGenerator
+
+
+class TestBoundedExecutor:
+    def test_preserves_order_and_limits_concurrency(self):
+        state = {"running": 0, "peak": 0}
+
+        async def work(i):
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+            await asyncio.sleep(0.01 * (5 - i))
+            state["running"] -= 1
+            return i * 10
+
+        results = run_bounded(work, range(5), max_concurrency=2)
+
+        assert results == [0, 10, 20, 30, 40]
+        assert state["peak"] == 2
+
+    def test_return_exceptions(self):
+        async def work(i):
+            if i == 1:
+                raise ValueError("boom")
+            return i
+
+        results = run_bounded(work, range(3), max_concurrency=3, return_exceptions=True)
+
+        assert results[0] == 0 and results[2] == 2
+        assert isinstance(results[1], ValueError)
+
+    def test_agenerate_chapter(self):
+        llm = Mock()
+        llm.agenerate_text = AsyncMock(return_value=json.dumps({"text": "T", "summary": "S"}))
+        generator = BookGenerator(llm)
+        chapter_data = {"chapter": 1, "title": "Test", "events": {"Plot": "Event"}}
+
+        result = asyncio.run(generator.agenerate_chapter(chapter_data, "Book", ["Plot"], []))
+
+        assert result == ("T", "S")
+        llm.agenerate_text.assert_awaited_once()
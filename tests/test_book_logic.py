@@ -2,7 +2,7 @@
 import pytest
 from unittest.mock import Mock, patch
 import json
-from domain.book_logic import BookGenerator
+from domain.book_logic import BookGenerator, CHAPTER_SCHEMA, SUMMARY_SCHEMA
 
 
 class TestBookGenerator:
@@ -61,4 +61,56 @@ class TestBookGenerator:
         )
         
         assert text == "Chapter content here"
-        assert summary == "Chapter summary"
\ No newline at end of file
+        assert summary == "Chapter summary"
+
+    def test_chapter_prompt_fits_token_budget(self, mock_llm):
+        generator = BookGenerator(mock_llm, input_token_budget=400)
+        chapter_data = {"chapter": 30, "title": "Финал", "events": {"Plot": "Герой побеждает"}}
+        summaries = [f"Глава {i}: " + "очень длинное резюме главы " * 10 for i in range(1, 30)]
+
+        prompt = generator.build_chapter_prompt(chapter_data, "Книга", ["Plot"], summaries)
+
+        assert generator.count_tokens(prompt) <= 400
+        assert "Глава 29:" in prompt
+        assert "Глава 1:" not in prompt
+        assert "ранних глав опущены" in prompt
+
+
+class TestStructuredOutput:
+    @pytest.fixture
+    def chapter(self):
+        return {"chapter": 2, "title": "Буря", "events": {"Море": "Корабль попадает в шторм"}}
+
+    def test_chapter_requested_with_schema(self, chapter):
+        llm = Mock()
+        llm.generate_text.return_value = '{"text": "Текст", "summary": "Резюме"}'
+
+        assert BookGenerator(llm).generate_chapter(chapter, "Книга", ["Море"], []) == ("Текст", "Резюме")
+        assert llm.generate_text.call_args.kwargs["json_schema"] is CHAPTER_SCHEMA
+
+    def test_missing_summary_is_repaired_without_regenerating_text(self, chapter):
+        llm = Mock()
+        llm.generate_text.side_effect = ['{"text": "Текст главы", "summary": ""}', '{"summary": "Дозапрошенное"}']
+
+        text, summary = BookGenerator(llm).generate_chapter(chapter, "Книга", ["Море"], [])
+
+        assert (text, summary) == ("Текст главы", "Дозапрошенное")
+        repair_prompt = llm.generate_text.call_args_list[1]
+        assert "Текст главы" in repair_prompt.args[0]
+        assert repair_prompt.kwargs["json_schema"] is SUMMARY_SCHEMA
+
+    def test_unparseable_chapter_is_retried(self, chapter):
+        llm = Mock()
+        llm.generate_text.side_effect = ['{"text": "обрыв', '{"text": "Текст", "summary": "Резюме"}']
+
+        with patch("domain.book_logic.backoff_delay", return_value=0):
+            assert BookGenerator(llm).generate_chapter(chapter, "Книга", ["Море"], []) == ("Текст", "Резюме")
+
+    def test_outline_storylines_repaired_from_events(self):
+        generator = BookGenerator(Mock())
+        storylines, chapters = generator.parse_outline_response(
+            '{"chapters": [{"events": {"Линия А": "x", "Линия Б": "y"}}]}'
+        )
+
+        assert storylines == ["Линия А", "Линия Б"]
+        assert chapters[0]["chapter"] == 1 and chapters[0]["title"] == "Глава 1"
@@ -0,0 +1,26 @@
+# tests/test_chapter_store.py
+from unittest.mock import patch
+
+from infrastructure.chapter_store import ChapterBodyStore, decode_body, encode_body
+from infrastructure.database.models import ChapterBody
+
+
+class TestChapterBodyStore:
+    def test_same_text_is_stored_once(self, db_session):
+        store = ChapterBodyStore(db_session)
+        text = "Глава о море. " * 200
+
+        first = store.put(text)
+        assert store.put(text) == first
+        assert db_session.query(ChapterBody).count() == 1
+        assert store.get(first[0]) == text
+        assert first[1] == len(text.encode("utf-8"))
+        assert len(db_session.query(ChapterBody.data).scalar()) < first[1] // 10
+
+        assert store.prune() == 1  # ни одна глава не ссылается
+        assert store.get(first[0]) is None
+
+    def test_zstd_falls_back_to_zlib_without_package(self):
+        with patch("infrastructure.chapter_store._zstd", return_value=None):
+            codec, data, _ = encode_body("Текст", codec="zstd")
+        assert codec == "zlib" and decode_body(codec, data) == "Текст"
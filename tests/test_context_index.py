@@ -0,0 +1,60 @@
+# tests/test_context_index.py
+import pytest
+
+from infrastructure.context_index import BM25Index, ChapterRetriever, build_query, split_passages, terms
+from infrastructure.database.models import Book, Chapter
+from infrastructure.outline_manager import OutlineManager
+
+
+class TestPassageSearch:
+    def test_split_passages_respects_max_chars(self):
+        text = "\n\n".join(["Короткий абзац."] * 3 + ["Длинное предложение. " * 30])
+        passages = split_passages(text, max_chars=200)
+
+        assert passages[0].count("Короткий абзац.") == 3
+        assert all(len(p) <= 200 for p in passages)
+
+    def test_bm25_ranks_matching_documents_first(self):
+        index = BM25Index([
+            "Мария нашла старую карту в библиотеке",
+            "Шторм разрушил порт и корабли",
+            "Капитан чинил корабль после шторма",
+        ])
+        results = index.search(build_query({"title": "Буря", "events": {"Море": "Корабли попадают в шторм"}}))
+
+        assert {i for i, _ in results} == {1, 2}
+        assert terms("Кораблями") == terms("корабли")
+
+
+class TestChapterRetriever:
+    @pytest.fixture
+    def manager(self, db_session):
+        db_session.add(Book(id=1, title="Test", premise="Premise", user_id=1))
+        for number in range(1, 4):
+            db_session.add(Chapter(book_id=1, number=number, title=f"Глава {number}", generate_flag=True))
+        db_session.commit()
+        manager = OutlineManager(db_session)
+        manager.update_chapter_summary(1, 1, "Мария находит карту сокровищ.", "Мария открыла сундук.\n\nВ сундуке лежала карта.")
+        manager.update_chapter_summary(1, 2, "Город готовится к празднику.", "На площади развешивали фонари.")
+        return manager
+
+    def test_update_chapter_summary_indexes_passages(self, manager):
+        passages = manager.get_chapter_passages(1, before_chapter=3)
+        assert [(p.chapter_number, p.kind) for p in passages] == [
+            (1, "summary"), (1, "paragraph"), (2, "summary"), (2, "paragraph")
+        ]
+
+    def test_retrieves_relevant_passages_within_budget(self, manager):
+        chapter = {"chapter": 3, "title": "Поиск", "events": {"Клад": "Мария идёт по карте к сокровищам"}}
+        retriever = ChapterRetriever(manager, 1, top_k=2, token_budget=1000)
+
+        passages = retriever.retrieve(chapter)
+        assert passages == [
+            "Глава 1 (резюме): Мария находит карту сокровищ.",
+            "Глава 1: Мария открыла сундук.\nВ сундуке лежала карта.",
+        ]
+
+        # Резюме, которые уже есть в промпте дословно, не повторяются
+        excluded = retriever.retrieve(chapter, exclude=["Глава 1: Мария находит карту сокровищ."])
+        assert all("(резюме)" not in p for p in excluded)
+        assert ChapterRetriever(manager, 1, token_budget=0).retrieve(chapter) == []
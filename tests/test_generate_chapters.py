@@ -0,0 +1,111 @@
+# tests/test_generate_chapters.py
+import pytest
+from unittest.mock import patch
+
+from cli.generate_chapters import generate_chapters_for_book
+from infrastructure.database import get_session, init_db
+from infrastructure.database.models import Chapter, GenerationRun
+from infrastructure.fake_llm import FakeLLMClient
+from infrastructure.generation_runs import GenerationRuns
+from infrastructure.outline_manager import OutlineManager
+
+
+class PromptLog(FakeLLMClient):
+    """Fake-провайдер, который запоминает промпты"""
+    def __init__(self):
+        super().__init__("Русский", chapter_words=40, latency_ms=0)
+        self.prompts = []
+
+    def generate_text(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return super().generate_text(prompt, **kwargs)
+
+    async def agenerate_text(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return await super().agenerate_text(prompt, **kwargs)
+
+
+def saved_chapters():
+    session = get_session()
+    try:
+        return {ch.number: ch for ch in session.query(Chapter).all()}
+    finally:
+        session.close()
+
+
+class TestGenerateChaptersForBook:
+    @pytest.fixture
+    def book_id(self, tmp_path):
+        init_db(f"sqlite:///{tmp_path / 'books.db'}")
+        session = get_session()
+        chapters = [
+            {"chapter": n, "title": f"Глава {n}", "events": {"Линия": f"Событие {n}"}}
+            for n in range(1, 5)
+        ]
+        OutlineManager(session).save_outline("Книга", "Описание", ["Линия"], chapters, user_id=1)
+        session.close()
+        return 1
+
+    @pytest.fixture
+    def llm(self):
+        client = PromptLog()
+        with patch("cli.generate_chapters.LLMClientFactory.get_client", return_value=client):
+            yield client
+
+    def test_serial_run_passes_new_summaries_forward(self, book_id, llm):
+        assert generate_chapters_for_book(book_id, user_id=1, pipelined=False)
+
+        chapters = saved_chapters()
+        assert all(ch.body_hash and not ch.generate_flag for ch in chapters.values())
+        # Промпт 4-й главы содержит резюме 1-й, написанной в этом же запуске
+        assert chapters[1].context_summary in llm.prompts[3]
+
+    def test_pipelined_run(self, book_id, llm):
+        progress = []
+        assert generate_chapters_for_book(
+            book_id, user_id=1, pipelined=True, progress_callback=lambda *args: progress.append(args)
+        )
+
+        chapters = saved_chapters()
+        assert all(ch.body_hash and ch.context_summary for ch in chapters.values())
+        assert '"summaries"' in llm.prompts[0]   # первая фаза — один запрос плановых резюме
+        assert len(llm.prompts) == 1 + 4
+        assert progress[-1][:2] == (4, 4)
+
+    def test_failed_run_resumes_from_first_unfinished_chapter(self, book_id, llm):
+        def fail_on_third(prompt, **kwargs):
+            if "Событие 3" in prompt:
+                raise RuntimeError("provider down")
+            return PromptLog.generate_text(llm, prompt, **kwargs)
+
+        with patch.object(llm, "generate_text", side_effect=fail_on_third), \
+                patch("domain.book_logic.backoff_delay", return_value=0):
+            assert not generate_chapters_for_book(book_id, user_id=1, pipelined=False)
+
+        session = get_session()
+        try:
+            run = GenerationRuns(session).get_resumable(book_id)
+            states = {ch.chapter_number: (ch.status, ch.attempts) for ch in run.chapters}
+            assert run.status == "failed"
+            assert states == {1: ("done", 1), 2: ("done", 1), 3: ("failed", 1), 4: ("pending", 0)}
+            assert "provider down" in run.chapters[2].error
+        finally:
+            session.close()
+
+        llm.prompts.clear()
+        progress = []
+        assert generate_chapters_for_book(
+            book_id, user_id=1, pipelined=False, resume=True, progress_callback=lambda *args: progress.append(args)
+        )
+
+        # Написанные главы не генерируются повторно, прогресс считается от всего запуска
+        assert len(llm.prompts) == 2
+        assert progress[0] == (2, 4, 3) and progress[-1] == (4, 4, None)
+        session = get_session()
+        try:
+            runs = GenerationRuns(session)
+            assert runs.get_resumable(book_id) is None
+            run = session.query(GenerationRun).one()
+            assert [ch.attempts for ch in run.chapters] == [1, 1, 2, 1]
+        finally:
+            session.close()
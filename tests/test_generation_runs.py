@@ -0,0 +1,54 @@
+# tests/test_generation_runs.py
+import pytest
+
+from cli.generate_chapters import start_or_resume_run
+from infrastructure.database.models import Book
+from infrastructure.generation_runs import GenerationRuns
+
+
+class TestGenerationRuns:
+    @pytest.fixture
+    def runs(self, db_session):
+        db_session.add(Book(id=1, title="Test", premise="Premise", user_id=1))
+        db_session.commit()
+        return GenerationRuns(db_session)
+
+    def test_track_chapter_records_attempts_and_errors(self, runs):
+        run = runs.start(book_id=1, chapter_numbers=[1, 2])
+
+        with runs.track_chapter(run.id, 1):
+            pass
+        with pytest.raises(RuntimeError):
+            with runs.track_chapter(run.id, 2):
+                raise RuntimeError("timeout")
+        runs.fail(run.id, "timeout")
+
+        chapters = {ch.chapter_number: ch for ch in runs.get(run.id).chapters}
+        assert (chapters[1].status, chapters[1].attempts) == ("done", 1)
+        assert (chapters[2].status, chapters[2].error) == ("failed", "timeout")
+        assert chapters[1].duration_seconds >= 0
+        assert runs.unfinished_chapters(run.id) == [2]
+        assert runs.get_resumable(book_id=1).id == run.id
+
+    def test_restarted_job_continues_its_run(self, runs):
+        rows = [
+            {"Chapter": 1, "Generate": True, "HasContent": False},
+            {"Chapter": 2, "Generate": True, "HasContent": False},
+            {"Chapter": 3, "Generate": True, "HasContent": False},
+        ]
+        run, to_generate = start_or_resume_run(runs, 1, rows, job_id=7)
+        assert [row["Chapter"] for row in to_generate] == [1, 2, 3]
+
+        # Воркер упал после сохранения главы 1, но до отметки в журнале
+        runs.chapter_started(run.id, 1)
+        rows[0].update(Generate=False, HasContent=True)
+
+        resumed, to_generate = start_or_resume_run(runs, 1, rows, job_id=7)
+        assert resumed.id == run.id
+        assert [row["Chapter"] for row in to_generate] == [2, 3]
+        assert runs.finished_count(run.id) == 1
+
+        # Новая задача без resume начинает новый запуск
+        fresh, _ = start_or_resume_run(runs, 1, rows, job_id=8)
+        assert fresh.id != run.id
+        assert runs.get(run.id).status == "superseded"
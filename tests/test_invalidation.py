@@ -0,0 +1,40 @@
+# tests/test_invalidation.py
+import pytest
+
+from domain.invalidation import stale_after, stale_chapters
+from infrastructure.database.models import Chapter
+from infrastructure.outline_manager import OutlineManager
+
+
+class TestStaleChapters:
+    def test_stale_chapters_policies(self):
+        written = [1, 2, 3, 5, 6]
+
+        assert stale_chapters(2, written, policy="none") == [2]
+        assert stale_chapters(2, written, policy="window", window=2) == [2, 3, 5]
+        assert stale_chapters(2, written, policy="all") == [2, 3, 5, 6]
+        # Ненаписанная глава ещё не попала в контекст других
+        assert stale_chapters(4, written, policy="all") == []
+        with pytest.raises(ValueError):
+            stale_chapters(2, written, policy="everything")
+
+    def test_stale_after_insert_or_removal(self):
+        written = [1, 2, 3, 5, 6]
+
+        assert stale_after(3, written, policy="none") == []
+        assert stale_after(3, written, policy="window", window=2) == [3, 5]
+        assert stale_after(4, written, policy="all") == [5, 6]
+
+    def test_update_plot_event_marks_dependent_chapters(self, db_session):
+        manager = OutlineManager(db_session)
+        chapters = [{"chapter": n, "title": f"Глава {n}", "events": {"Линия": f"Событие {n}"}} for n in range(1, 6)]
+        manager.save_outline("Книга", "Описание", ["Линия"], chapters, user_id=1)
+        book_id = 1
+        for n in range(1, 5):
+            manager.update_chapter_summary(book_id, n, summary=f"Резюме {n}", content=f"Текст {n}")
+
+        assert manager.update_plot_event(book_id, 3, "Линия", "Событие 3") == []  # текст не изменился
+        assert manager.update_plot_event(book_id, 2, "Линия", "Новое событие", propagation="window") == [2, 3, 4]
+
+        flags = {ch.number: ch.generate_flag for ch in db_session.query(Chapter)}
+        assert flags == {1: False, 2: True, 3: True, 4: True, 5: True}
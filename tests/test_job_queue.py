@@ -0,0 +1,61 @@
+# tests/test_job_queue.py
+import pytest
+from datetime import datetime, timedelta
+
+from infrastructure.database.models import Book, GenerationJob
+from infrastructure.job_queue import JobQueue
+
+
+class TestJobQueue:
+    @pytest.fixture
+    def queue(self, db_session):
+        db_session.add(Book(id=1, title="Test", premise="Premise", user_id=1))
+        db_session.commit()
+        return JobQueue(db_session)
+
+    def test_enqueue_deduplicates_active_job(self, queue):
+        first = queue.enqueue(book_id=1, user_id=1)
+        second = queue.enqueue(book_id=1, user_id=1)
+
+        assert first.id == second.id
+        assert first.status == "pending"
+
+    def test_claim_next_and_progress(self, queue):
+        job = queue.enqueue(book_id=1, user_id=1)
+
+        claimed = queue.claim_next("worker-1")
+        assert claimed.id == job.id
+        assert claimed.status == "running"
+        assert queue.claim_next("worker-2") is None
+
+        queue.update_progress(job.id, done=2, total=5, current_chapter=3)
+        queue.finish(job.id)
+
+        job = queue.get(job.id)
+        assert job.status == "done"
+        assert (job.done_chapters, job.total_chapters) == (2, 5)
+        assert queue.get_active_job(1) is None
+
+    def test_requeue_stale(self, queue, db_session):
+        job = queue.enqueue(book_id=1, user_id=1)
+        queue.claim_next("worker-1")
+        db_session.query(GenerationJob).update(
+            {"heartbeat_at": datetime.utcnow() - timedelta(hours=1)}
+        )
+        db_session.commit()
+
+        assert queue.requeue_stale(stale_after_seconds=60) == 1
+        assert queue.get(job.id).status == "pending"
+
+    def test_heartbeat_keeps_running_job_fresh(self, queue, db_session):
+        job = queue.enqueue(book_id=1, user_id=1)
+        queue.claim_next("worker-1")
+        db_session.query(GenerationJob).update(
+            {"heartbeat_at": datetime.utcnow() - timedelta(hours=1)}
+        )
+        db_session.commit()
+
+        queue.heartbeat(job.id)
+
+        assert queue.requeue_stale(stale_after_seconds=60) == 0
+        assert queue.get(job.id).status == "running"
@@ -0,0 +1,55 @@
+# tests/test_json_stream.py
+import json
+from unittest.mock import Mock
+
+from domain.json_stream import JSONFieldStream, extract_fields
+from domain.book_logic import BookGenerator
+
+
+def feed_by(text: str, size: int) -> tuple:
+    stream = JSONFieldStream()
+    deltas = []
+    for i in range(0, len(text), size):
+        deltas.append(stream.feed(text[i:i + size]).get("text", ""))
+    return stream, "".join(deltas)
+
+
+class TestJSONFieldStream:
+    def test_fields_decoded_across_chunk_boundaries(self):
+        payload = {"text": "Он сказал: \"Привет\"\n\tи ушёл 😀", "summary": "Коротко."}
+        raw = json.dumps(payload, ensure_ascii=True)
+
+        for size in (1, 3, 7):
+            stream, streamed = feed_by(raw, size)
+            assert stream.completed == payload
+            assert stream.finished
+            assert streamed.encode("utf-16", "surrogatepass").decode("utf-16") == payload["text"]
+
+    def test_stream_cut_mid_surrogate_pair(self):
+        # Пара \ud83d\ude00 (😀) разорвана: поле text закрылось после первой половины, summary начат со второй
+        stream, _ = feed_by('{"text": "Конец \\ud83d", "summary": "\\ude00 начало"}', 3)
+
+        assert stream.completed == {"text": "Конец \ufffd", "summary": "\ufffd начало"}
+        assert stream.completed["text"].encode("utf-8")
+
+    def test_text_completes_before_summary_arrives(self):
+        stream = JSONFieldStream()
+        stream.feed('```json\n{"text": "Глава целиком.", "sum')
+
+        assert stream.completed == {"text": "Глава целиком."}
+        assert not stream.finished
+
+    def test_skips_other_values_and_normalizes_once(self):
+        raw = '{"meta": {"a": ["}", 1]}, "n": 2, "text": "\ufb01\u200bнал", "summary": "ок"}'
+
+        assert extract_fields(raw) == {"text": "fiнал", "summary": "ок"}
+
+    def test_split_chapter_response_uses_streamed_fields(self):
+        generator = BookGenerator(Mock())
+
+        text, summary = generator.split_chapter_response("", 1, fields={"text": "Текст", "summary": "Резюме"})
+        assert (text, summary) == ("Текст", "Резюме")
+
+        # Обрыв после текста — резюме дозапрашивается отдельно
+        text, summary = generator.split_chapter_response('{"text": "Текст", "summary": "Рез', 1)
+        assert (text, summary) == ("Текст", None)
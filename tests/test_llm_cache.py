@@ -0,0 +1,100 @@
+# tests/test_llm_cache.py
+import pytest
+from unittest.mock import Mock
+
+from domain.cache_policy import fresh_response
+from infrastructure.llm_cache import CachingLLMClient, SQLiteResponseCache, make_cache_key
+
+
+def make_inner(response="Generated text"):
+    inner = Mock()
+    inner.language = "Русский"
+    inner.provider = "gemini"
+    inner.model_name = "test-model"
+    inner.temperature = 0.7
+    inner.system_instruction = "system"
+    inner.generate_text.return_value = response
+    return inner
+
+
+class TestCachingLLMClient:
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return SQLiteResponseCache(str(tmp_path / "cache.db"), max_entries=2)
+
+    def test_identical_prompt_hits_cache(self, cache):
+        inner = make_inner()
+        client = CachingLLMClient(inner, cache)
+
+        assert client.generate_text("prompt") == "Generated text"
+        assert client.generate_text("prompt") == "Generated text"
+
+        inner.generate_text.assert_called_once_with("prompt")
+        assert client.stats()["hits"] == 1
+        assert client.stats()["misses"] == 1
+
+    def test_bypass_flag(self, cache):
+        inner = make_inner()
+        client = CachingLLMClient(inner, cache)
+
+        client.generate_text("prompt")
+        client.generate_text("prompt", use_cache=False)
+
+        assert inner.generate_text.call_count == 2
+
+    def test_fresh_retry_replaces_cached_malformed_reply(self, cache):
+        inner = make_inner()
+        inner.generate_text.side_effect = ['{"text": "обрыв', '{"text": "Глава", "summary": "Резюме"}']
+        client = CachingLLMClient(inner, cache)
+
+        assert client.generate_text("prompt") == '{"text": "обрыв'
+        assert client.generate_text("prompt") == '{"text": "обрыв'  # кэш сам не знает, что ответ плохой
+        with fresh_response():
+            assert client.generate_text("prompt") == '{"text": "Глава", "summary": "Резюме"}'
+
+        assert client.generate_text("prompt") == '{"text": "Глава", "summary": "Резюме"}'
+        assert inner.generate_text.call_count == 2
+
+    def test_key_depends_on_model_parameters(self):
+        base = make_cache_key("gemini", "m", 0.7, "sys", "prompt")
+        assert base != make_cache_key("gemini", "m", 0.2, "sys", "prompt")
+        assert base != make_cache_key("openai", "m", 0.7, "sys", "prompt")
+        assert base != make_cache_key("gemini", "m", 0.7, "other", "prompt")
+
+    def test_size_and_ttl_eviction(self, cache, tmp_path):
+        for i in range(3):
+            cache.set(f"k{i}", f"v{i}")
+        assert len(cache) == 2
+        assert cache.get("k0") is None
+
+        expired = SQLiteResponseCache(str(tmp_path / "ttl.db"), ttl_seconds=-1)
+        expired.set("k", "v")
+        assert expired.get("k") is None
+
+    def test_stream_is_cached_after_completion(self, cache):
+        inner = make_inner()
+        inner.generate_text_stream.return_value = iter(["Gen", "erated"])
+        client = CachingLLMClient(inner, cache)
+
+        assert list(client.generate_text_stream("prompt")) == ["Gen", "erated"]
+        assert list(client.generate_text_stream("prompt")) == ["Generated"]
+        inner.generate_text_stream.assert_called_once()
+
+    def test_connections_are_closed(self, cache, monkeypatch):
+        import sqlite3
+        opened = []
+        connect = sqlite3.connect
+
+        def tracking_connect(*args, **kwargs):
+            conn = connect(*args, **kwargs)
+            opened.append(conn)
+            return conn
+
+        monkeypatch.setattr(sqlite3, "connect", tracking_connect)
+        cache.set("k", "v")
+        assert cache.get("k") == "v"
+
+        assert len(opened) == 2
+        for conn in opened:
+            with pytest.raises(sqlite3.ProgrammingError):
+                conn.execute("SELECT 1")
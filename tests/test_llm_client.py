@@ -28,4 +28,70 @@ class TestGeminiClient:
         result = client.generate_text("Test prompt")
         
         assert result == "Generated text"
-        mock_model.generate_content.assert_called_once()
\ No newline at end of file
+        mock_model.generate_content.assert_called_once()
+
+    def test_async_calls_work_across_event_loops(self):
+        import asyncio
+        import threading
+        from google.generativeai import protos, types as genai_types
+
+        response = protos.GenerateContentResponse(
+            candidates=[{"content": {"parts": [{"text": "ok"}], "role": "model"}, "finish_reason": 1}]
+        )
+        client = GeminiClient("Русский")
+        threads = []
+
+        def generate_content(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return genai_types.GenerateContentResponse.from_response(response)
+
+        with patch.object(client.model, "generate_content", side_effect=generate_content), \
+                patch.object(client.model, "generate_content_async", side_effect=AssertionError("grpc-aio клиент")):
+            # Каждый asyncio.run — новый event loop, как у воркера и generate_outline
+            assert asyncio.run(client.agenerate_text("prompt")) == "ok"
+            assert asyncio.run(client.agenerate_text("prompt")) == "ok"
+
+        # Синхронный вызов SDK — не в потоке event loop
+        assert len(threads) == 2 and threading.current_thread() not in threads
+
+
+class TestOpenAIClient:
+    def test_async_client_is_pooled_and_closed_in_its_loop(self, monkeypatch):
+        import asyncio
+        from types import SimpleNamespace
+        from config.settings import settings
+        from infrastructure.llm_client import OpenAIClient
+
+        created = []
+
+        class LoopBoundAsyncOpenAI:
+            """Как AsyncOpenAI: соединения живут в event loop, где клиент создан"""
+            def __init__(self, **kwargs):
+                self.kwargs = kwargs
+                self.loop = asyncio.get_running_loop()
+                self.closed_in_loop = None
+                self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+                created.append(self)
+
+            async def create(self, **kwargs):
+                assert asyncio.get_running_loop() is self.loop, "клиент из закрытого event loop"
+                message = SimpleNamespace(content="ok")
+                return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+            async def close(self):
+                self.closed_in_loop = asyncio.get_running_loop() is self.loop and not self.loop.is_closed()
+
+        monkeypatch.setattr(settings, "OPENAI_API_KEY", "test-key")
+        monkeypatch.setattr("openai.AsyncOpenAI", LoopBoundAsyncOpenAI)
+        client = OpenAIClient("Русский")
+
+        async def two_calls():
+            return [await client.agenerate_text("prompt"), await client.agenerate_text("prompt")]
+
+        assert asyncio.run(two_calls()) == ["ok", "ok"]
+        assert asyncio.run(client.agenerate_text("prompt")) == "ok"
+
+        assert len(created) == 2  # один клиент на event loop
+        assert all(async_client.closed_in_loop for async_client in created)
+        limits = created[0].kwargs["http_client"]._transport._pool._max_connections
+        assert limits == settings.LLM_HTTP_MAX_CONNECTIONS
@@ -0,0 +1,54 @@
+# tests/test_llm_registry.py
+import pytest
+import threading
+from unittest.mock import Mock, patch
+
+from infrastructure.llm_registry import LLMClientRegistry
+
+
+def make_client(*args, **kwargs):
+    client = Mock()
+    client.language = "Русский"
+    client.provider = kwargs.get("provider", "gemini")
+    client.model_name = "test-model"
+    client.temperature = 0.7
+    client.system_instruction = ""
+    client.generate_text.return_value = "text"
+    del client.stats
+    return client
+
+
+class TestLLMClientRegistry:
+    @patch("infrastructure.llm_registry.LLMClientFactory.create_client", side_effect=make_client)
+    def test_client_is_reused_across_threads(self, mock_create):
+        registry = LLMClientRegistry()
+        clients = []
+
+        threads = [
+            threading.Thread(target=lambda: clients.append(registry.get("Русский", "gemini")))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert mock_create.call_count == 1
+        assert all(c is clients[0] for c in clients)
+        assert registry.get("English", "gemini") is not clients[0]
+
+    @patch("infrastructure.llm_registry.LLMClientFactory.create_client", side_effect=make_client)
+    def test_stats_track_calls_and_errors(self, mock_create):
+        registry = LLMClientRegistry()
+        client = registry.get("Русский", "gemini")
+
+        client.generate_text("prompt")
+        client.inner.generate_text.side_effect = RuntimeError("quota")
+        with pytest.raises(RuntimeError):
+            client.generate_text("prompt")
+
+        stats = registry.stats()[0]
+        assert stats["calls"] == 2
+        assert stats["errors"] == 1
+        assert stats["healthy"] is False
+        assert "quota" in stats["last_error"]
@@ -0,0 +1,82 @@
+# tests/test_metrics.py
+import pytest
+from unittest.mock import Mock
+from prometheus_client import REGISTRY
+
+from infrastructure.metrics import InstrumentedLLMClient, observe_generation
+
+
+def sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestInstrumentedLLMClient:
+    def test_counts_requests_by_operation_and_status(self):
+        inner = Mock()
+        inner.language = "Русский"
+        inner.provider = "gemini"
+        inner.model_name = "metrics-test"
+        inner.generate_text.side_effect = ["ok", RuntimeError("boom")]
+        client = InstrumentedLLMClient(inner)
+        labels = {"provider": "gemini", "model": "metrics-test", "operation": "chapter"}
+
+        with observe_generation("chapter"):
+            client.generate_text("prompt")
+        with pytest.raises(RuntimeError):
+            with observe_generation("chapter"):
+                client.generate_text("prompt")
+
+        assert sample("booksmith_llm_requests_total", {**labels, "status": "ok"}) == 1
+        assert sample("booksmith_llm_requests_total", {**labels, "status": "error"}) == 1
+        assert sample("booksmith_llm_request_seconds_count", labels) == 2
+        assert sample("booksmith_generation_seconds_count", {"operation": "chapter", "status": "error"}) >= 1
+
+
+class TestMultiprocessDir:
+    def test_missing_dir_is_created_outside_gunicorn(self, tmp_path):
+        import os
+        import subprocess
+        import sys
+
+        metrics_dir = tmp_path / "prometheus"
+        env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(metrics_dir)}
+        code = "from infrastructure.metrics import record_retry; record_retry('fake', 'test')"
+        subprocess.run([sys.executable, "-c", code], env=env, check=True, cwd=os.getcwd())
+
+        assert any(metrics_dir.iterdir())
+
+
+class TestGenerationObserver:
+    def test_book_generator_reports_through_hooks(self):
+        from domain.book_logic import BookGenerator
+
+        llm = Mock()
+        llm.provider = "hooks-test"
+        llm.generate_text.return_value = '{"summary": "Резюме"}'
+        before = sample("booksmith_generation_seconds_count", {"operation": "summary_repair", "status": "ok"})
+
+        BookGenerator(llm).repair_summary({"chapter": 1, "title": "Глава", "events": {}}, "Текст")
+
+        assert sample("booksmith_llm_retries_total", {"provider": "hooks-test", "reason": "repair"}) == 1
+        assert sample("booksmith_generation_seconds_count", {"operation": "summary_repair", "status": "ok"}) == before + 1
+
+
+class TestEngineInstrumentation:
+    def test_failed_statements_do_not_leak_start_times(self):
+        from sqlalchemy import create_engine, text
+        from sqlalchemy.exc import OperationalError
+        from infrastructure.metrics import instrument_engine
+
+        engine = create_engine("sqlite://")
+        instrument_engine(engine)
+        before = sample("booksmith_db_query_seconds_count", {"statement": "SELECT"})
+
+        with engine.connect() as conn:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    conn.execute(text("SELECT * FROM missing_table"))
+            conn.execute(text("SELECT 1"))
+            assert conn.info["query_started"] == {}
+
+        assert sample("booksmith_db_query_seconds_count", {"statement": "SELECT"}) == before + 1
+        engine.dispose()
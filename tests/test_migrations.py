@@ -0,0 +1,184 @@
+# tests/test_migrations.py
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from sqlalchemy.orm import sessionmaker
+
+from infrastructure.database.migrations import MIGRATIONS, applied_versions, run_migrations
+from infrastructure.database.models import Base, Chapter, ChapterBody
+from infrastructure.outline_manager import OutlineManager
+
+NEW_INDEXES = [
+    "uq_chapters_book_number", "uq_plot_events_chapter_line", "uq_plot_lines_book_name",
+    "ix_plot_events_plot_line_id", "ix_books_user_id", "uq_summary_digests_range", "ix_generation_jobs_book_status",
+]
+
+
+def indexes(engine, table):
+    return {index["name"]: index["unique"] for index in inspect(engine).get_indexes(table)}
+
+
+class TestMigrations:
+    @pytest.fixture
+    def legacy_engine(self, tmp_path):
+        """БД, созданная до появления индексов: таблицы есть, индексов и журнала миграций нет"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            for name in NEW_INDEXES:
+                conn.execute(text(f"DROP INDEX {name}"))
+            conn.execute(text("DROP TABLE chapters"))
+            conn.execute(text(
+                "CREATE TABLE chapters (id INTEGER PRIMARY KEY, book_id INTEGER REFERENCES books (id), number INTEGER NOT NULL, "
+                "title VARCHAR(200), generate_flag BOOLEAN, content TEXT, context_summary TEXT, generated_at DATETIME)"
+            ))
+            conn.execute(text("INSERT INTO books (id, title, user_id) VALUES (1, 'Книга', 1)"))
+            conn.execute(text("INSERT INTO plot_lines (id, name, book_id) VALUES (1, 'Линия', 1)"))
+            conn.execute(text(
+                "INSERT INTO chapters (id, book_id, number, title, content) VALUES (1, 1, 1, 'Глава', 'Текст главы')"
+            ))
+            conn.execute(text(
+                "INSERT INTO plot_events (plot_line_id, chapter_id, description) VALUES (1, 1, 'старое'), (1, 1, 'новое')"
+            ))
+            conn.execute(text(
+                "INSERT INTO summary_digests (book_id, level, start_chapter, end_chapter, source_hash, text) "
+                "VALUES (1, 'arc', 1, 8, 'h1', 'старый'), (1, 'arc', 1, 8, 'h2', 'новый')"
+            ))
+        yield engine
+        engine.dispose()
+
+    def test_migrations_bring_legacy_db_to_current_schema(self, legacy_engine):
+        with patch("infrastructure.database.migrations.logger") as log:
+            assert run_migrations(legacy_engine) == [1, 2, 3, 4, 5]
+        assert run_migrations(legacy_engine) == []
+
+        # Удалённый повтор события не пропадает молча
+        warnings = " ".join(call.args[0] for call in log.warning.call_args_list)
+        assert "'старое'" in warnings and "повторов событий сюжета: 1" in warnings
+        assert "ix_generation_jobs_book_status" in indexes(legacy_engine, "generation_jobs")
+
+        assert indexes(legacy_engine, "chapters")["uq_chapters_book_number"]
+        assert indexes(legacy_engine, "plot_events")["uq_plot_events_chapter_line"]
+        assert indexes(legacy_engine, "summary_digests")["uq_summary_digests_range"]
+        with legacy_engine.connect() as conn:
+            assert conn.execute(text("SELECT description FROM plot_events")).scalars().all() == ["новое"]
+            assert conn.execute(text("SELECT text FROM summary_digests")).scalars().all() == ["новый"]
+            plan = " ".join(
+                str(row[-1]) for row in conn.execute(text(
+                    "EXPLAIN QUERY PLAN SELECT id FROM chapters WHERE book_id = 1 AND number = 1"
+                ))
+            )
+        assert "uq_chapters_book_number" in plan and "SCAN" not in plan
+
+    def test_duplicate_rows_get_a_plain_index(self, legacy_engine):
+        with legacy_engine.begin() as conn:
+            conn.execute(text("INSERT INTO chapters (book_id, number, title) VALUES (1, 1, 'Дубль')"))
+
+        run_migrations(legacy_engine)
+
+        assert "uq_chapters_book_number" not in indexes(legacy_engine, "chapters")
+        assert not indexes(legacy_engine, "chapters")["ix_chapters_book_number"]
+        assert indexes(legacy_engine, "plot_lines")["uq_plot_lines_book_name"]
+
+    def test_chapter_text_moves_to_compressed_bodies(self, legacy_engine):
+        run_migrations(legacy_engine)
+
+        assert "content" not in {column["name"] for column in inspect(legacy_engine).get_columns("chapters")}
+        session = sessionmaker(bind=legacy_engine)()
+        try:
+            manager = OutlineManager(session)
+            assert manager.get_chapter_content(1, 1) == "Текст главы"
+            assert session.query(Chapter.body_bytes).scalar() == len("Текст главы".encode("utf-8"))
+
+            # Перезапись главы удаляет прежний текст из хранилища
+            manager.save_chapter_content(1, 1, "Новый текст")
+            assert [body.byte_length for body in session.query(ChapterBody)] == [len("Новый текст".encode("utf-8"))]
+        finally:
+            session.close()
+
+    def test_old_sqlite_rebuilds_table_without_content(self, legacy_engine):
+        with patch("infrastructure.database.migrations.sqlite3.sqlite_version_info", (3, 31, 1)):
+            assert run_migrations(legacy_engine) == [1, 2, 3, 4, 5]
+
+        columns = {column["name"] for column in inspect(legacy_engine).get_columns("chapters")}
+        assert "content" not in columns and {"body_hash", "body_bytes", "stream_started_at"} <= columns
+        assert indexes(legacy_engine, "chapters") == {"uq_chapters_book_number": True, "ix_chapters_body_hash": False}
+        assert inspect(legacy_engine).get_foreign_keys("chapters")[0]["referred_table"] == "books"
+        with legacy_engine.begin() as conn:
+            conn.execute(text("INSERT INTO chapters (book_id, number, title) VALUES (1, 2, 'Новая')"))
+            assert conn.execute(text("SELECT id, title FROM chapters ORDER BY id")).all() == [(1, "Глава"), (2, "Новая")]
+        session = sessionmaker(bind=legacy_engine)()
+        try:
+            assert OutlineManager(session).get_chapter_content(1, 1) == "Текст главы"
+        finally:
+            session.close()
+
+    def test_migration_applied_while_waiting_for_lock_is_skipped(self, legacy_engine):
+        with legacy_engine.begin() as conn:
+            applied_versions(conn)
+
+        # Другой процесс держит блокировку записи и применяет миграцию 1
+        other = legacy_engine.connect()
+        other.exec_driver_sql("BEGIN IMMEDIATE")
+        result = []
+        runner = threading.Thread(target=lambda: result.extend(run_migrations(legacy_engine)))
+        runner.start()
+        time.sleep(0.2)
+        MIGRATIONS[0][2](other)
+        other.execute(text(
+            "INSERT INTO schema_migrations (version, name, applied_at) VALUES (1, 'outline_indexes', '2024-01-01')"
+        ))
+        other.commit()
+        other.close()
+        runner.join(timeout=10)
+
+        assert result == [2, 3, 4, 5]
+        with legacy_engine.connect() as conn:
+            assert conn.execute(text("SELECT version FROM schema_migrations ORDER BY version")).scalars().all() == [1, 2, 3, 4, 5]
+
+    def test_concurrent_runners_apply_each_migration_once(self, legacy_engine, tmp_path):
+        # Много текста — миграция 2 идёт заметное время, и второй процесс успевает в неё упереться
+        with legacy_engine.begin() as conn:
+            conn.execute(
+                text("INSERT INTO chapters (book_id, number, title, content) VALUES (1, :n, 'Глава', :content)"),
+                [{"n": n, "content": f"Текст главы {n}. " * 300} for n in range(2, 1500)]
+            )
+        code = (
+            "import json, sys\n"
+            "from sqlalchemy import create_engine\n"
+            "from infrastructure.database.migrations import run_migrations\n"
+            f"engine = create_engine('sqlite:///{tmp_path / 'legacy.db'}', connect_args={{'timeout': 60}})\n"
+            "print('ready', flush=True)\n"
+            "sys.stdin.readline()\n"
+            "print(json.dumps(run_migrations(engine)))\n"
+        )
+        runners = [
+            subprocess.Popen(
+                [sys.executable, "-c", code], cwd=os.getcwd(),
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+            )
+            for _ in range(2)
+        ]
+        for runner in runners:
+            assert runner.stdout.readline().strip() == "ready"
+        for runner in runners:
+            runner.stdin.write("go\n")
+            runner.stdin.flush()
+        outputs = [runner.communicate(timeout=120) for runner in runners]
+
+        assert [runner.returncode for runner in runners] == [0, 0], [stderr for _, stderr in outputs]
+        applied = [json.loads(stdout.strip().splitlines()[-1]) for stdout, _ in outputs]
+        assert sorted(sum(applied, [])) == [1, 2, 3, 4, 5]
+        assert "content" not in {column["name"] for column in inspect(legacy_engine).get_columns("chapters")}
+        with legacy_engine.connect() as conn:
+            assert conn.execute(text("SELECT count(*) FROM chapters WHERE body_hash IS NULL")).scalar() == 0
+            assert conn.execute(text("SELECT count(*) FROM chapter_bodies")).scalar() == 1499
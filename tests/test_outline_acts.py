@@ -0,0 +1,60 @@
+# tests/test_outline_acts.py
+import json
+
+import pytest
+from unittest.mock import patch
+
+from config.settings import settings
+from domain.book_logic import BookGenerator
+from domain.outline_acts import act_sizes, merge_acts, missing_arcs
+from infrastructure.fake_llm import FakeLLMClient
+
+
+class DropsLineOnce(FakeLLMClient):
+    """Первый ответ на второй акт теряет линию — акт должен быть запрошен повторно"""
+    def __init__(self):
+        super().__init__("Русский", latency_ms=0)
+        self.prompts = []
+
+    async def agenerate_text(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        response = await super().agenerate_text(prompt, **kwargs)
+        if "ТЕКУЩИЙ АКТ 2" in prompt and sum("ТЕКУЩИЙ АКТ 2" in p for p in self.prompts) == 1:
+            data = json.loads(response)
+            for chapter in data["chapters"]:
+                chapter["events"].pop("Линия 3")
+            response = json.dumps(data, ensure_ascii=False)
+        return response
+
+
+class TestOutlineByActs:
+    def test_act_helpers(self):
+        assert act_sizes(10, 3) == [4, 3, 3]
+        chapters = merge_acts([
+            [{"chapter": 1, "title": "А", "events": {"Линия": "x"}}],
+            [{"chapter": 1, "title": "", "events": {"Линия": "y"}}, {"chapter": 7, "title": "В", "events": {}}],
+        ])
+        assert [(ch["chapter"], ch["title"]) for ch in chapters] == [(1, "А"), (2, "Глава 2"), (3, "В")]
+        assert missing_arcs(["Линия", "Другая"], chapters) == ["Другая"]
+
+    @pytest.fixture
+    def acts_settings(self, monkeypatch):
+        monkeypatch.setattr(settings, "OUTLINE_SINGLE_CALL_MAX_CHAPTERS", 12)
+        monkeypatch.setattr(settings, "OUTLINE_CHAPTERS_PER_ACT", 10)
+
+    def test_long_book_is_outlined_by_acts(self, acts_settings):
+        llm = DropsLineOnce()
+        with patch("domain.book_logic.backoff_delay", return_value=0):
+            storylines, chapters = BookGenerator(llm).generate_outline("Эпос", chapter_count=35)
+
+        assert [ch["chapter"] for ch in chapters] == list(range(1, 36))
+        assert all(set(ch["events"]) == set(storylines) for ch in chapters)
+        # План актов + 4 акта + повтор акта, потерявшего линию
+        assert len(llm.prompts) == 1 + 4 + 1
+        assert "Глав в этом акте: 9 (главы 10–18" in llm.prompts[2]
+
+    def test_short_book_uses_single_call(self, acts_settings):
+        llm = DropsLineOnce()
+        BookGenerator(llm).generate_outline("Рассказ", chapter_count=8)
+        assert len(llm.prompts) == 0  # синхронный путь — один generate_text
+        assert llm.calls == 1
@@ -0,0 +1,68 @@
+# tests/test_outline_merge.py
+import pytest
+
+from domain.outline_merge import match_chapters, match_storylines
+from infrastructure.database.models import Chapter, PlotEvent, PlotLine
+from infrastructure.outline_manager import OutlineManager
+
+
+class TestOutlineMerge:
+    def test_match_chapters_by_title_then_number(self):
+        old = [(1, "Пробуждение"), (2, "Буря в порту"), (3, "Тайна маяка")]
+        new = [(1, "Пробуждение"), (2, "Новая встреча"), (3, "Буря в порту."), (4, "Финал")]
+
+        # «Буря» сместилась на 3-е место, 2-я глава заняла освободившуюся строку с тем же номером
+        assert match_chapters(new, old) == {0: 0, 2: 1}
+        assert match_storylines(["Мария", "Капитан Ной"], ["Капитан Ноа", "Город"]) == {1: 0}
+
+    def test_merge_outline_keeps_unchanged_chapters(self, db_session):
+        manager = OutlineManager(db_session)
+        chapters = [
+            {"chapter": n, "title": f"Глава {title}", "events": {"Линия": f"Событие {n}", "Фон": "Осень"}}
+            for n, title in [(1, "первая"), (2, "вторая"), (3, "третья")]
+        ]
+        manager.save_outline("Книга", "Описание", ["Линия", "Фон"], chapters, user_id=1)
+        for n in (1, 2, 3):
+            manager.update_chapter_summary(1, n, summary=f"Резюме {n}", content=f"Текст {n}")
+
+        new_chapters = [
+            {"chapter": 1, "title": "Глава первая", "events": {"Линия": "Событие 1", "Фон": "Осень"}},
+            {"chapter": 2, "title": "Глава вторая", "events": {"Линия": "Совсем другое", "Фон": "Осень"}},
+            {"chapter": 3, "title": "Эпилог", "events": {"Линия": "Конец"}},
+        ]
+        stats = manager.merge_outline(1, "Новое описание", ["Линия", "Фон"], new_chapters, propagation="none")
+
+        assert {k: stats[k] for k in ("kept", "changed", "added", "removed")} == {
+            "kept": 1, "changed": 2, "added": 0, "removed": 0
+        }
+        assert stats["stale"] == [2, 3]
+        rows = {ch.number: ch for ch in db_session.query(Chapter)}
+        assert (manager.get_chapter_content(1, 1), rows[1].generate_flag) == ("Текст 1", False)
+        assert (manager.get_chapter_content(1, 2), rows[2].generate_flag) == ("Текст 2", True)  # текст остаётся до перегенерации
+        assert rows[3].title == "Эпилог"
+        assert db_session.query(PlotLine).count() == 2
+        assert db_session.query(PlotEvent).count() == 5
+
+    @pytest.mark.parametrize("edit, stale", [
+        # Новая глава 2 сдвигает прежние 2–4 на 3–5
+        (lambda chapters: chapters[:1] + [{"chapter": 2, "title": "Вставка", "events": {"Линия": "Новое"}}]
+            + [dict(ch, chapter=ch["chapter"] + 1) for ch in chapters[1:]], [3, 4, 5]),
+        # Удалённая глава 2 пропадает из контекста глав 3–4, ставших 2–3
+        (lambda chapters: chapters[:1] + [dict(ch, chapter=ch["chapter"] - 1) for ch in chapters[2:]], [2, 3]),
+    ])
+    def test_insert_or_remove_marks_following_chapters(self, db_session, edit, stale):
+        manager = OutlineManager(db_session)
+        chapters = [
+            {"chapter": n, "title": title, "events": {"Линия": f"Событие {n}"}}
+            for n, title in [(1, "Пробуждение"), (2, "Буря в порту"), (3, "Тайна маяка"), (4, "Возвращение")]
+        ]
+        manager.save_outline("Книга", "Описание", ["Линия"], chapters, user_id=1)
+        for n in range(1, 5):
+            manager.update_chapter_summary(1, n, summary=f"Резюме {n}", content=f"Текст {n}")
+
+        stats = manager.merge_outline(1, "Описание", ["Линия"], edit(chapters), propagation="all")
+
+        assert stats["changed"] == 0
+        assert stats["stale"] == stale
+        flags = {ch.number: ch.generate_flag for ch in db_session.query(Chapter) if ch.body_hash}
+        assert [number for number, flag in sorted(flags.items()) if flag] == stale
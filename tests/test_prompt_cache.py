@@ -0,0 +1,64 @@
+# tests/test_prompt_cache.py
+import pytest
+
+from config.settings import settings
+from domain.book_logic import BookGenerator
+from infrastructure.fake_llm import FakeLLMClient
+from domain.prompt_prefix import cache_prefix
+from infrastructure.prompt_cache import prompt_cache_scope, split_prefix
+
+
+def count_words(text):
+    return len(text.split())
+
+
+class TestPromptCache:
+    @pytest.fixture
+    def min_tokens(self, monkeypatch):
+        monkeypatch.setattr(settings, "PROMPT_CACHE_MIN_TOKENS", 10)
+
+    def test_split_prefix_rules(self, min_tokens):
+        prefix = "правила ответа " * 10
+        with cache_prefix(prefix):
+            assert split_prefix(prefix + "глава 1", count_words) == (prefix, "глава 1")
+            assert split_prefix("другой промпт " + prefix, count_words) is None
+        assert split_prefix(prefix + "глава 1", count_words) is None  # вне cache_prefix
+        with cache_prefix("коротко"):
+            assert split_prefix("коротко и дальше", count_words) is None
+
+    def test_chapters_of_one_book_share_cached_prefix(self, min_tokens):
+        llm = FakeLLMClient("Русский", chapter_words=40, latency_ms=0)
+        generator = BookGenerator(llm)
+        summaries = []
+        with prompt_cache_scope("book-1-run-1"):
+            for n in (1, 2):
+                chapter = {"chapter": n, "title": f"Глава {n}", "events": {"Линия": f"Событие {n}"}}
+                prompt = generator.build_chapter_prompt(chapter, "Описание книги", ["Линия"], summaries, "короткая")
+                prefix = generator.chapter_prompt_prefix("Описание книги", ["Линия"], "короткая")
+                assert prompt.startswith(prefix)
+                with cache_prefix(prefix):
+                    assert llm._simulate_prefix_cache(prompt) == (0 if n == 1 else llm.count_tokens(prefix))
+                summaries.append(f"Резюме {n}")
+
+    def test_over_budget_prompt_keeps_cached_prefix(self, min_tokens):
+        storylines = [f"Линия {n}" for n in range(1, 6)]
+        chapter = {"chapter": 3, "title": "Глава 3", "events": {"Линия 1": "Событие " * 40, "Линия 2": ""}}
+        generator = BookGenerator(FakeLLMClient("Русский", latency_ms=0), input_token_budget=50)
+
+        prompt = generator.build_chapter_prompt(chapter, "Описание книги", storylines, ["Резюме 1", "Резюме 2"])
+        prefix = generator.chapter_prompt_prefix("Описание книги", storylines, "800-1200 слов")
+
+        assert generator.count_tokens(prompt) > 50
+        assert prompt.startswith(prefix)
+        with cache_prefix(prefix):
+            assert split_prefix(prompt, generator.count_tokens) == (prefix, prompt[len(prefix):])
+
+    def test_scope_releases_handles_once(self):
+        released = []
+        with prompt_cache_scope("outer") as outer:
+            with prompt_cache_scope("inner") as inner:
+                assert inner is outer
+                outer.get_or_create("gemini", "m", "префикс", lambda: "handle", released.append)
+                assert outer.get_or_create("gemini", "m", "префикс", lambda: "other", released.append) == "handle"
+            assert released == []
+        assert released == ["handle"]
@@ -0,0 +1,73 @@
+# tests/test_rate_limiter.py
+import pytest
+from unittest.mock import Mock, patch
+
+from domain.retry import backoff_delay
+from infrastructure.rate_limiter import RateLimitedLLMClient, SQLiteRateLimiter, retry_after_seconds
+
+
+class QuotaError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = Mock(headers={"retry-after": retry_after} if retry_after else {})
+
+
+def make_inner():
+    inner = Mock()
+    inner.language = "Русский"
+    inner.provider = "gemini"
+    inner.model_name = "test-model"
+    inner.temperature = 0.7
+    inner.system_instruction = ""
+    return inner
+
+
+class TestSQLiteRateLimiter:
+    def test_bucket_shared_between_instances(self, tmp_path):
+        path = str(tmp_path / "limits.db")
+        first = SQLiteRateLimiter(path, requests_per_minute=2, tokens_per_minute=1000)
+        second = SQLiteRateLimiter(path, requests_per_minute=2, tokens_per_minute=1000)
+
+        assert first.try_acquire(10) == 0
+        assert second.try_acquire(10) == 0
+        # Третий запрос в ту же минуту должен ждать ~30 с (2 RPM)
+        assert first.try_acquire(10) > 20
+
+    def test_token_budget(self, tmp_path):
+        limiter = SQLiteRateLimiter(str(tmp_path / "limits.db"), requests_per_minute=100, tokens_per_minute=600)
+
+        assert limiter.try_acquire(500) == 0
+        assert limiter.try_acquire(500) > 0
+        assert limiter.usage()["tokens"]["used"] >= 500
+
+
+class TestRateLimitedLLMClient:
+    def test_retries_quota_errors_with_retry_after(self, tmp_path):
+        inner = make_inner()
+        inner.generate_text.side_effect = [QuotaError(429, retry_after="2"), "text"]
+        limiter = SQLiteRateLimiter(str(tmp_path / "limits.db"), 100, 1_000_000)
+        client = RateLimitedLLMClient(inner, limiter, max_retries=3)
+
+        with patch("infrastructure.rate_limiter.time.sleep") as mock_sleep:
+            assert client.generate_text("prompt") == "text"
+
+        assert mock_sleep.call_args[0][0] >= 2
+        assert inner.generate_text.call_count == 2
+
+    def test_non_retryable_error_is_raised(self, tmp_path):
+        inner = make_inner()
+        inner.generate_text.side_effect = QuotaError(400)
+        limiter = SQLiteRateLimiter(str(tmp_path / "limits.db"), 100, 1_000_000)
+        client = RateLimitedLLMClient(inner, limiter)
+
+        with pytest.raises(QuotaError):
+            client.generate_text("prompt")
+        inner.generate_text.assert_called_once()
+
+
+class TestRetryHelpers:
+    def test_backoff_and_retry_after_parsing(self):
+        assert 0 <= backoff_delay(3, base=1, cap=5) <= 5
+        assert backoff_delay(0, retry_after=7) >= 7
+        assert retry_after_seconds(Exception("429 quota. retry_delay { seconds: 13 }")) == 13
@@ -0,0 +1,177 @@
+# tests/test_resilience.py
+import asyncio
+import threading
+import time
+import pytest
+from unittest.mock import Mock, patch
+
+from infrastructure import resilience
+from infrastructure.llm_client import LLMClient
+from infrastructure.rate_limiter import RateLimitedLLMClient
+from infrastructure.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    GuardedLLMClient,
+    ResilientLLMClient,
+)
+
+
+class QuotaError(Exception):
+    status_code = 429
+
+
+class ServerError(Exception):
+    status_code = 503
+
+
+class BadRequestError(Exception):
+    status_code = 400
+
+
+class APITimeoutError(Exception):
+    """Как openai.APITimeoutError — таймаут HTTP-клиента SDK"""
+
+
+class StubClient(LLMClient):
+    def __init__(self, provider, response="ok", delay=0.0, error=None):
+        super().__init__("Русский")
+        self.provider = provider
+        self.model_name = f"{provider}-model"
+        self.response = response
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.threads = []
+
+    def generate_text(self, prompt):
+        self.calls += 1
+        self.threads.append(threading.current_thread())
+        time.sleep(self.delay)
+        error = self.error.pop(0) if isinstance(self.error, list) else self.error
+        if error:
+            raise error
+        return self.response
+
+    async def agenerate_text(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.response
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    resilience._breakers.clear()
+    yield
+    resilience._breakers.clear()
+
+
+class TestCircuitBreaker:
+    def test_breaker_opens_and_half_opens(self):
+        breaker = CircuitBreaker("p", failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert not breaker.allow()
+
+        time.sleep(0.06)
+        assert breaker.allow()       # пробный запрос
+        assert not breaker.allow()   # второй — ждёт результата пробного
+        breaker.record_success()
+        assert breaker.state == "closed"
+
+
+class TestGuardedLLMClient:
+    def test_sdk_timeout_becomes_deadline_in_calling_thread(self):
+        provider = StubClient("slow", error=APITimeoutError("Request timed out"))
+        client = GuardedLLMClient(provider)
+
+        with pytest.raises(DeadlineExceeded):
+            client.generate_text("prompt")
+        # Вызов не уходит в пул — по дедлайну не остаётся брошенного потока
+        assert provider.threads == [threading.current_thread()]
+        assert client.stats()["timeouts"] == 1
+        assert client.stats()["failures"] == 1
+
+    def test_async_deadline_exceeded(self):
+        client = GuardedLLMClient(StubClient("slow", delay=0.5), timeout=0.05)
+
+        started = time.perf_counter()
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(client.agenerate_text("prompt"))
+        assert time.perf_counter() - started < 0.4
+        assert client.stats()["timeouts"] == 1
+
+    def test_request_errors_do_not_open_breaker(self):
+        client = GuardedLLMClient(StubClient("bad", error=BadRequestError("invalid schema")))
+
+        for _ in range(5):
+            with pytest.raises(BadRequestError):
+                client.generate_text("prompt")
+        assert client.stats()["state"] == "closed" and client.stats()["failures"] == 0
+
+    def test_quota_waits_do_not_count_against_deadline(self):
+        limiter = Mock()
+        provider = StubClient("quota", error=[QuotaError(), QuotaError(), None])
+        guarded = GuardedLLMClient(provider, timeout=0.1)
+        client = RateLimitedLLMClient(guarded, limiter, max_retries=3)
+
+        with patch("infrastructure.rate_limiter.backoff_delay", return_value=0.08):
+            assert client.generate_text("prompt") == "ok"  # две паузы по 0.08 с — дольше дедлайна в сумме
+
+        assert provider.calls == 3
+        assert guarded.stats()["timeouts"] == 0
+        assert resilience.get_circuit_breaker("quota").failures == 0  # 429 выключатель не размыкает
+
+
+class TestResilientLLMClient:
+    def test_failover_on_error_and_open_circuit(self):
+        primary = StubClient("primary", error=ServerError("503"))
+        fallback = StubClient("fallback", response="from fallback")
+        client = ResilientLLMClient(primary, fallback, hedge=False)
+
+        assert client.generate_text("prompt") == "from fallback"
+
+        resilience.get_circuit_breaker("primary").state = "open"
+        resilience.get_circuit_breaker("primary").opened_at = time.monotonic()
+        assert client.generate_text("prompt") == "from fallback"
+        assert primary.calls == 1
+
+    @pytest.mark.parametrize("use_async", [False, True])
+    def test_no_failover_on_request_error(self, use_async):
+        primary = StubClient("primary", error=BadRequestError("invalid schema"))
+        fallback = StubClient("fallback", response="from fallback")
+        client = ResilientLLMClient(primary, fallback, hedge=False)
+
+        with pytest.raises(BadRequestError):
+            if use_async:
+                asyncio.run(client.agenerate_text("prompt"))
+            else:
+                client.generate_text("prompt")
+        assert fallback.calls == 0
+        assert client.stats()["failovers"] == 0
+
+    def test_all_circuits_open(self):
+        client = ResilientLLMClient(StubClient("only"), hedge=False)
+        breaker = resilience.get_circuit_breaker("only")
+        breaker.state, breaker.opened_at = "open", time.monotonic()
+
+        with pytest.raises(CircuitOpenError):
+            client.generate_text("prompt")
+
+    @pytest.mark.parametrize("use_async", [False, True])
+    def test_hedge_after_p95(self, use_async):
+        primary = StubClient("primary", response="slow", delay=0.3)
+        fallback = StubClient("fallback", response="fast")
+        client = ResilientLLMClient(primary, fallback, hedge=True, hedge_min_samples=1)
+        client.routes[0].latency.add(0.02)
+
+        if use_async:
+            result = asyncio.run(client.agenerate_text("prompt"))
+        else:
+            result = client.generate_text("prompt")
+
+        assert result == "fast"
+        assert client.stats()["hedges"] == 1
@@ -0,0 +1,136 @@
+# tests/test_save_outline.py
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from infrastructure.database.models import Base, Book, Chapter, ChapterBody
+from infrastructure.outline_manager import OutlineManager
+
+STORYLINES = ["Линия A", "Линия B", "Линия C"]
+CHAPTERS = [
+    {"chapter": n, "title": f"Глава {n}", "events": {"Линия A": f"A{n}", "Линия B": f"B{n}" if n % 2 else " ", "Чужая": "x"}}
+    for n in range(1, 6)
+]
+
+
+def count_inserts(session, save):
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        save()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return sum(statement.lstrip().upper().startswith("INSERT") for statement in statements)
+
+
+class TestSaveOutline:
+    def test_bulk_and_row_paths_store_the_same_outline(self, db_session):
+        manager = OutlineManager(db_session)
+        inserts = {}
+        for bulk in (False, True):
+            inserts[bulk] = count_inserts(db_session, lambda: manager.save_outline(
+                f"Книга {bulk}", "Описание", STORYLINES, CHAPTERS, user_id=1, bulk=bulk
+            ))
+
+        row_book, bulk_book = db_session.query(Book).order_by(Book.id).all()
+        row_outline, bulk_outline = manager.load_outline(row_book.id), manager.load_outline(bulk_book.id)
+        assert bulk_outline["storylines"] == row_outline["storylines"] == STORYLINES
+        assert bulk_outline["chapters"] == row_outline["chapters"]
+        # Книга + три пакетных INSERT против INSERT на каждую линию, главу и событие
+        assert inserts[True] == 4
+        assert inserts[False] > 10
+
+    def test_load_outline_reads_content_flags_not_text(self, db_session):
+        manager = OutlineManager(db_session)
+        manager.save_outline("Книга", "Описание", STORYLINES, CHAPTERS, user_id=1)
+        manager.update_chapter_summary(1, 2, "Резюме", content="Текст главы")
+
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+        try:
+            data = manager.load_outline(1)
+        finally:
+            event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+
+        assert len(statements) == 2
+        assert all("chapter_bodies" not in statement for statement in statements)
+        chapters = {row["Chapter"]: row for row in data["chapters"]}
+        assert (chapters[2]["HasContent"], chapters[2]["ContentLength"]) == (True, len("Текст главы".encode("utf-8")))
+        assert not chapters[1]["HasContent"] and "Content" not in chapters[1]
+        assert (chapters[1]["Линия A"], chapters[2]["Линия B"], chapters[1]["Линия C"]) == ("A1", "", "")
+
+    def test_replace_outline_retry_repeats_the_delete(self, db_session):
+        manager = OutlineManager(db_session)
+        manager.save_outline("Книга", "Описание", STORYLINES, CHAPTERS, user_id=1)
+        manager.update_chapter_summary(1, 1, summary="Резюме", content="Текст")
+
+        save = manager._save_outline
+        calls = []
+
+        def locked_once(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                raise OperationalError("INSERT INTO chapters", {}, Exception("database is locked"))
+            return save(*args, **kwargs)
+
+        new_chapters = [{"chapter": 1, "title": "Новая", "events": {"Линия A": "Новое"}}]
+        with patch.object(manager, "_save_outline", side_effect=locked_once), \
+                patch("infrastructure.database.sqlite_profile.backoff_delay", return_value=0):
+            manager.replace_outline(1, 1, "Новое описание", ["Линия A"], new_chapters)
+
+        assert len(calls) == 2
+        assert [(ch.number, ch.title) for ch in db_session.query(Chapter)] == [(1, "Новая")]
+        assert db_session.query(ChapterBody).count() == 0
+        assert db_session.query(Book).one().premise == "Новое описание"
+
+
+    def test_chapter_stream_is_claimed_once(self, db_session):
+        manager = OutlineManager(db_session)
+        manager.save_outline("Книга", "Описание", STORYLINES, CHAPTERS, user_id=1)
+
+        assert manager.claim_chapter_stream(1, 1)
+        assert not manager.claim_chapter_stream(1, 1)
+        assert manager.claim_chapter_stream(1, 2)
+
+        manager.release_chapter_stream(1, 1)
+        assert manager.claim_chapter_stream(1, 1)
+
+        # Брошенная отметка (процесс упал, не сняв её) не блокирует главу навсегда
+        with patch("infrastructure.outline_manager.settings.CHAPTER_STREAM_LOCK_SECONDS", -1):
+            assert manager.claim_chapter_stream(1, 2)
+
+    def test_bulk_ids_are_reserved_under_write_lock(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'books.db'}", connect_args={"timeout": 0})
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        manager = OutlineManager(session)
+        manager.save_outline("Книга", "Описание", STORYLINES, CHAPTERS, user_id=1, bulk=True)
+
+        reserve = manager._reserve_ids
+        other = engine.connect()
+
+        def reserve_while_other_writes(*args):
+            # Пока id читаются, второй писатель блокировку записи не получит
+            with pytest.raises(OperationalError, match="locked"):
+                other.exec_driver_sql("BEGIN IMMEDIATE")
+            return reserve(*args)
+
+        try:
+            # Название и описание те же — flush книги ничего не пишет
+            with patch.object(manager, "_reserve_ids", side_effect=reserve_while_other_writes) as reserved:
+                manager.save_outline(
+                    "Книга", "Описание", ["Линия D"], [{"chapter": 9, "title": "Глава 9", "events": {"Линия D": "D9"}}],
+                    user_id=1, book_id=1, bulk=True
+                )
+            assert reserved.call_count == 2
+            assert session.query(Chapter).filter(Chapter.book_id == 1).count() == len(CHAPTERS) + 1
+        finally:
+            other.close()
+            session.close()
+            engine.dispose()
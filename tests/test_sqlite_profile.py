@@ -0,0 +1,59 @@
+# tests/test_sqlite_profile.py
+import asyncio
+
+import pytest
+from unittest.mock import Mock, patch
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from infrastructure.database.sqlite_profile import create_db_engine, retry_on_lock
+
+
+class TestSQLiteProfile:
+    def test_file_engine_applies_pragmas(self, tmp_path):
+        engine = create_db_engine(f"sqlite:///{tmp_path / 'app.db'}", tuned=True)
+        try:
+            with engine.connect() as conn:
+                pragmas = {
+                    name: conn.execute(text(f"PRAGMA {name}")).scalar()
+                    for name in ("journal_mode", "synchronous", "busy_timeout")
+                }
+        finally:
+            engine.dispose()
+        assert pragmas == {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 15000}
+
+
+class Writer:
+    def __init__(self, failures):
+        self.session = Mock()
+        self.calls = 0
+        self.failures = failures
+
+    @retry_on_lock
+    def save(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise OperationalError("UPDATE chapters", {}, Exception("database is locked"))
+        return "saved"
+
+
+class TestRetryOnLock:
+    @patch("infrastructure.database.sqlite_profile.backoff_delay", return_value=0)
+    def test_locked_write_is_retried_after_rollback(self, _):
+        writer = Writer(failures=2)
+        assert writer.save() == "saved"
+        assert writer.calls == 3 and writer.session.rollback.call_count == 2
+
+        with pytest.raises(OperationalError):
+            Writer(failures=10).save()
+
+    @patch("infrastructure.database.sqlite_profile.time.sleep")
+    def test_retry_does_not_sleep_on_event_loop(self, sleep):
+        async def save():
+            return Writer(failures=1).save()
+
+        assert asyncio.run(save()) == "saved"
+        sleep.assert_not_called()
+
+        assert Writer(failures=1).save() == "saved"
+        sleep.assert_called_once()
@@ -0,0 +1,102 @@
+# tests/test_summary_compaction.py
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from infrastructure.database.models import Book
+from infrastructure.outline_manager import OutlineManager
+from infrastructure.summary_compaction import SummaryCompactor
+
+
+def summaries(count):
+    return [(n, f"резюме {n}") for n in range(1, count + 1)]
+
+
+class TestSummaryCompactor:
+    @pytest.fixture
+    def manager(self, db_session):
+        db_session.add(Book(id=1, title="Test", premise="Premise", user_id=1))
+        db_session.commit()
+        return OutlineManager(db_session)
+
+    @pytest.fixture
+    def generator(self):
+        generator = Mock()
+        generator.summarize_digest.side_effect = lambda parts, start, end: f"дайджест {start}-{end}"
+        generator.asummarize_digest = AsyncMock(side_effect=lambda parts, start, end: f"дайджест {start}-{end}")
+        return generator
+
+    def test_short_book_is_verbatim(self, manager, generator):
+        compactor = SummaryCompactor(generator, manager, 1, recent=4, arc_size=4, max_arcs=2)
+
+        assert compactor.compact(summaries(8)) == [f"Глава {n}: резюме {n}" for n in range(1, 9)]
+        generator.summarize_digest.assert_not_called()
+
+    def test_context_size_stays_bounded(self, manager, generator):
+        compactor = SummaryCompactor(generator, manager, 1, recent=4, arc_size=4, max_arcs=2)
+
+        sizes = [len(compactor.compact(summaries(n))) for n in range(10, 60)]
+        context = compactor.compact(summaries(40))
+
+        assert max(sizes) <= 1 + 2 + 3 + 4
+        assert context[0] == "Главы 1–28 (кратко): дайджест 1-28"
+        assert context[1:3] == ["Главы 29–32 (кратко): дайджест 29-32", "Главы 33–36 (кратко): дайджест 33-36"]
+        assert context[-1] == "Глава 40: резюме 40"
+
+    def test_digests_are_stored_and_reused(self, manager, generator):
+        SummaryCompactor(generator, manager, 1, recent=4, arc_size=4, max_arcs=2).compact(summaries(30))
+        calls = generator.summarize_digest.call_count
+
+        # Новый компактор (другой запрос) берёт дайджесты из БД
+        SummaryCompactor(generator, manager, 1, recent=4, arc_size=4, max_arcs=2).compact(summaries(30))
+        assert generator.summarize_digest.call_count == calls
+
+        # Перегенерированная глава делает устаревшими только свои дайджесты
+        changed = summaries(30)
+        changed[1] = (2, "новое резюме 2")
+        SummaryCompactor(generator, manager, 1, recent=4, arc_size=4, max_arcs=2).compact(changed)
+        assert generator.summarize_digest.call_count > calls
+
+    def test_async_compaction_matches_sync(self, manager, generator):
+        compactor = SummaryCompactor(generator, manager, 1, recent=4, arc_size=4, max_arcs=2)
+
+        context = asyncio.run(compactor.acompact(summaries(40)))
+
+        generator.summarize_digest.assert_not_called()
+        assert generator.asummarize_digest.await_count > 0
+        assert context == compactor.compact(summaries(40))
+        generator.summarize_digest.assert_not_called()
+
+    def test_async_compaction_falls_back_to_verbatim(self, manager, generator):
+        generator.asummarize_digest.side_effect = TimeoutError("LLM не ответил")
+        compactor = SummaryCompactor(generator, manager, 1, recent=4, arc_size=4, max_arcs=2)
+
+        context = asyncio.run(compactor.acompact(summaries(20)))
+
+        assert context == [f"Глава {n}: резюме {n}" for n in range(1, 21)]
+
+    def test_concurrent_chapters_share_digest_requests(self, manager, generator):
+        async def slow_digest(parts, start, end):
+            await asyncio.sleep(0.01)
+            return f"дайджест {start}-{end}"
+
+        generator.asummarize_digest = AsyncMock(side_effect=slow_digest)
+        compactor = SummaryCompactor(generator, manager, 1, recent=4, arc_size=4, max_arcs=2)
+
+        async def pipeline():
+            return await asyncio.gather(*(compactor.acompact(summaries(n)) for n in (20, 20, 21)))
+
+        contexts = asyncio.run(pipeline())
+
+        assert contexts[0] == contexts[1] == compactor.compact(summaries(20))
+        requested = [call.args[1:] for call in generator.asummarize_digest.await_args_list]
+        assert len(requested) == len(set(requested))
+        assert compactor._inflight == {}
+
+    def test_digest_is_upserted_once_per_range(self, manager):
+        manager.save_summary_digest(1, "arc", 1, 4, "hash-1", "старый")
+        digest = manager.save_summary_digest(1, "arc", 1, 4, "hash-2", "новый")
+
+        assert (digest.source_hash, digest.text) == ("hash-2", "новый")
+        assert list(manager.get_summary_digests(1)) == [("arc", 1, 4)]
+        assert manager.get_summary_digests(1)[("arc", 1, 4)].text == "новый"
@@ -0,0 +1,76 @@
+# tests/test_tokenizer.py
+import hashlib
+import sys
+import types
+
+import pytest
+
+from domain import tokenizer
+from domain.tokenizer import count_tokens, estimate_tokens
+from infrastructure.token_usage import record_usage, track_usage
+
+
+class TestTokenizer:
+    def test_cyrillic_counts_more_than_words(self):
+        text = "Молодой волшебник отправился в далёкое путешествие за древним артефактом."
+        words = len(text.split())
+
+        assert estimate_tokens(text, "gemini") > words
+        assert estimate_tokens(text, "openai") >= estimate_tokens(text, "gemini")
+
+    def test_latin_and_empty(self):
+        assert estimate_tokens("") == 0
+        assert 2 <= estimate_tokens("Hello, world!") <= 5
+
+
+class TestTiktokenFallback:
+    @pytest.fixture
+    def fake_tiktoken(self, monkeypatch, tmp_path):
+        """tiktoken, который скачивает BPE-файл при первом get_encoding — как настоящий без кэша"""
+        downloads = []
+
+        def get_encoding(name):
+            downloads.append(name)
+            blob = f"https://openaipublic.blob.core.windows.net/encodings/{name}.tiktoken"
+            if not (tmp_path / hashlib.sha1(blob.encode()).hexdigest()).exists():
+                raise ConnectionError("нет сети")
+            return types.SimpleNamespace(encode=lambda text: text.split())
+
+        module = types.ModuleType("tiktoken")
+        module.get_encoding = get_encoding
+        model = types.ModuleType("tiktoken.model")
+        model.encoding_name_for_model = lambda name: "o200k_base" if name == "gpt-4o" else {}[name]
+        monkeypatch.setitem(sys.modules, "tiktoken", module)
+        monkeypatch.setitem(sys.modules, "tiktoken.model", model)
+        monkeypatch.setenv("TIKTOKEN_CACHE_DIR", str(tmp_path))
+        tokenizer._tiktoken_encoding.cache_clear()
+        yield tmp_path, downloads
+        tokenizer._tiktoken_encoding.cache_clear()
+
+    def test_uncached_encoding_is_not_downloaded(self, fake_tiktoken):
+        _, downloads = fake_tiktoken
+        text = "Молодой волшебник отправился в путь"
+
+        assert count_tokens(text, "openai", "gpt-4o") == estimate_tokens(text, "openai")
+        assert downloads == []
+
+    def test_cached_encoding_counts_exactly(self, fake_tiktoken):
+        cache_dir, _ = fake_tiktoken
+        for name in ("o200k_base", "cl100k_base"):
+            blob = f"https://openaipublic.blob.core.windows.net/encodings/{name}.tiktoken"
+            (cache_dir / hashlib.sha1(blob.encode()).hexdigest()).write_text("bpe")
+
+        assert count_tokens("один два три", "openai", "gpt-4o") == 3
+        assert count_tokens("один два три", "openai", "unknown-model") == 3  # cl100k_base по умолчанию
+
+
+class TestTrackUsage:
+    def test_collects_records_inside_block_only(self):
+        record_usage("gemini", "m", 1, 1)
+        with track_usage() as usage:
+            record_usage("gemini", "m", 100, 20)
+            record_usage("gemini", "m", 50, 10, estimated=True)
+        record_usage("gemini", "m", 1, 1)
+
+        assert [(r.input_tokens, r.output_tokens) for r in usage] == [(100, 20), (50, 10)]
+        assert usage[1].estimated
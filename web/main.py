@@ -9,6 +9,10 @@ Session = init_db(settings.DATABASE_URL)  # возвращает Session из se
 app = Flask(__name__)
 app.secret_key = settings.WEB_APP_SECRET_KEY
 
+# Метрики запросов + /metrics для Prometheus
+from infrastructure.metrics import instrument_flask
+instrument_flask(app)
+
 # 🔥 Только после init_db импортируем маршруты
 from web.routes.auth_routes import init_auth_routes
 from web.routes.book_routes import init_book_routes
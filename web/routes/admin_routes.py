@@ -1,7 +1,8 @@
 # web/routes/admin_routes.py
-from flask import render_template, session
+from flask import render_template, session, jsonify
 from infrastructure.database import get_session
 from infrastructure.database.models import Book, User
+from infrastructure.llm_registry import registry
 from logger import logger
 
 def init_admin_routes(app):
@@ -42,4 +43,13 @@ def init_admin_routes(app):
             return "<h1>Ошибка сервера</h1>", 500
 
         finally:
-            session_db.close()
\ No newline at end of file
+            session_db.close()
+
+    @app.route("/admin/llm-stats")
+    def admin_llm_stats():
+        """Состояние «тёплых» LLM-клиентов текущего воркера: вызовы, ошибки, задержки"""
+        if session.get("user_id") != 1:
+            return jsonify({"error": "forbidden"}), 403
+
+        import os
+        return jsonify({"pid": os.getpid(), "clients": registry.stats()})
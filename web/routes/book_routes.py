@@ -5,9 +5,13 @@ from sqlalchemy.orm import sessionmaker
 from infrastructure.database import get_session
 from infrastructure.database.models import Book, User
 from infrastructure.outline_manager import OutlineManager
+from infrastructure.job_queue import JobQueue
+from infrastructure.generation_runs import GenerationRuns
+from infrastructure.token_usage import track_usage
 from domain.book_logic import BookGenerator
 from infrastructure.llm_client import LLMClientFactory
 from cli.generate_chapters import main as generate_chapters_cli
+from config.settings import settings
 from logger import logger
 
 def get_current_user_id():
@@ -33,23 +37,32 @@ def init_book_routes(app):
 
     @app.route("/new-book")
     def new_book_form():
-        return render_template("new_book.html")
+        return render_template("new_book.html", max_chapters=settings.OUTLINE_WEB_MAX_CHAPTERS)
 
     @app.route("/create-book", methods=["POST"])
     def create_book():
         description = request.form["description"]
         title = request.form.get("title", "Новая книга")
+        chapter_count = request.form.get("chapters", type=int)  # пусто — модель выбирает сама (8–12)
         user_id = get_current_user_id()
 
+        # Сюжет строится прямо в запросе: длину книги ограничиваем на сервере, а не только в форме
+        if chapter_count is not None:
+            limited = min(max(chapter_count, 1), settings.OUTLINE_WEB_MAX_CHAPTERS)
+            if limited != chapter_count:
+                logger.warning(f"[WEB] Число глав {chapter_count} ограничено до {limited}")
+            chapter_count = limited
+
         logger.info(f"[WEB] Создание новой книги: {title}")
         session_db = get_session()
 
         try:
-            llm = LLMClientFactory.create_client(language='gemini')
+            llm = LLMClientFactory.get_client(settings.DEFAULT_LANGUAGE)
             generator = BookGenerator(llm)
             manager = OutlineManager(session_db)
 
-            storylines, chapters = generator.generate_outline(description)
+            with track_usage() as usage:
+                storylines, chapters = generator.generate_outline(description, chapter_count=chapter_count)
 
             manager.save_outline(
                 book_title=title,
@@ -60,6 +73,7 @@ def init_book_routes(app):
             )
 
             book = session_db.query(Book).filter(Book.user_id == user_id).order_by(Book.id.desc()).first()
+            manager.record_llm_usage(book.id, usage, operation="outline")
 
             response = app.response_class()
             response = make_response("", 307)   
@@ -88,8 +102,16 @@ def init_book_routes(app):
             if not data:
                 return "<div class='alert alert-warning'>Сюжет не сгенерирован</div>"
 
+            # Если по книге идёт фоновая генерация — показываем её прогресс
+            job = JobQueue(session_db).get_active_job(book_id)
+            # Прерванный запуск можно продолжить с первой незаконченной главы
+            resumable_run = None if job else GenerationRuns(session_db).get_resumable(book_id)
+
             return render_template("book_outline.html",
                                  book=book,
+                                 job=job,
+                                 resumable_run=resumable_run,
+                                 usage=manager.get_book_usage(book_id),
                                  storylines=data["storylines"],
                                  chapters=data["chapters"])
         finally:
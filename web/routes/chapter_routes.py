@@ -1,52 +1,120 @@
 # web/routes/chapter_routes.py
-from flask import request, session, render_template
+import json
+
+from flask import request, session, render_template, jsonify, Response, stream_with_context
 from sqlalchemy.orm import sessionmaker
 
 from infrastructure.database import get_session
 from infrastructure.database.models import Book, Chapter  
 from infrastructure.outline_manager import OutlineManager
-# from cli.generate_chapters import main as generate_chapters_cli
-from cli.generate_chapters import generate_chapters_for_book  
+from infrastructure.job_queue import JobQueue
+from infrastructure.generation_runs import GenerationRuns
+from infrastructure.llm_client import LLMClientFactory
+from infrastructure.token_usage import track_usage
+from infrastructure.metrics import llm_operation
+from domain.book_logic import BookGenerator, CHAPTER_SCHEMA
+from domain.json_stream import JSONFieldStream
+from domain.prompt_prefix import cache_prefix
+from cli.generate_chapters import build_chapter_context, make_compactor, make_retriever, retrieve_passages
+from config.settings import settings
 
 from logger import logger
 
 def init_chapter_routes(app):
+    def render_job(session_db, book, job):
+        """Таблица сюжета + блок прогресса задачи (пока задача активна, блок сам опрашивает /job/<id>)"""
+        manager = OutlineManager(session_db)
+        data = manager.load_outline(book.id)
+        if not data:
+            return "<div class='alert alert-warning'>Сюжет не сгенерирован</div>"
+
+        return render_template("job_status.html",
+                             job=job,
+                             book=book,
+                             storylines=data["storylines"],
+                             chapters=data["chapters"])
+
     @app.route("/generate-chapters", methods=["POST"])
     def generate_chapters():
         try:
             user_id = session.get("user_id")
             book_id = int(request.form["book_id"])
-            logger.info(f"Запуск генерации глав для {book_id=} (user_id={user_id})")
+            logger.info(f"Постановка генерации глав в очередь для {book_id=} (user_id={user_id})")
+
+            session_db = get_session()
+            try:
+                book = session_db.query(Book).filter(Book.id == book_id, Book.user_id == user_id).first()
+                if not book:
+                    return "<div class='alert alert-danger'>Книга не найдена</div>", 404
 
-            # ✅ Вызываем чистую функцию
-            success = generate_chapters_for_book(book_id=book_id, user_id=user_id)
+                # ✅ Не генерируем в запросе — только ставим задачу, её выполнит cli/job_worker.py
+                job = JobQueue(session_db).enqueue(book_id=book_id, user_id=user_id)
+                return render_job(session_db, book, job), 202
+            finally:
+                session_db.close()
 
-            if not success:
-                return "<div class='alert alert-danger'>Не удалось сгенерировать главы</div>"
+        except Exception as e:
+            logger.error(f"Ошибка при генерации глав: {e}")
+            return f"<div class='alert alert-danger mt-3'>❌ Ошибка: {str(e)}</div>"
+
+    @app.route("/resume-chapters", methods=["POST"])
+    def resume_chapters():
+        """Продолжает последний незавершённый запуск генерации книги (тоже через очередь)"""
+        try:
+            user_id = session.get("user_id")
+            book_id = int(request.form["book_id"])
 
-            # Перезагружаем данные
             session_db = get_session()
             try:
                 book = session_db.query(Book).filter(Book.id == book_id, Book.user_id == user_id).first()
                 if not book:
                     return "<div class='alert alert-danger'>Книга не найдена</div>", 404
 
-                manager = OutlineManager(session_db)
-                data = manager.load_outline(book_id)
-                if not data:
-                    return "<div class='alert alert-warning'>Сюжет не сгенерирован</div>"
+                runs = GenerationRuns(session_db)
+                run = runs.get_resumable(book_id)
+                if not run:
+                    return "<div class='alert alert-warning'>Нет незавершённой генерации для продолжения</div>"
 
-                return render_template("book_outline_table.html",
-                                     book=book,
-                                     storylines=data["storylines"],
-                                     chapters=data["chapters"])
+                # Повторный клик вернёт ту же активную задачу — запуск не продолжится дважды
+                job = JobQueue(session_db).enqueue(book_id=book_id, user_id=user_id)
+                runs.attach_job(run.id, job.id)
+                logger.info(f"Продолжение запуска {run.id} для {book_id=} поставлено в очередь (задача {job.id})")
+                return render_job(session_db, book, job), 202
             finally:
                 session_db.close()
 
         except Exception as e:
-            logger.error(f"Ошибка при генерации глав: {e}")
+            logger.error(f"Ошибка при продолжении генерации глав: {e}")
             return f"<div class='alert alert-danger mt-3'>❌ Ошибка: {str(e)}</div>"
-        
+
+    @app.route("/job/<int:job_id>")
+    def job_status(job_id):
+        user_id = session.get("user_id")
+        session_db = get_session()
+        try:
+            job = JobQueue(session_db).get(job_id, user_id=user_id)
+            if not job:
+                return "<div class='alert alert-danger'>Задача не найдена</div>", 404
+
+            if request.accept_mimetypes.best == "application/json":
+                return jsonify({
+                    "id": job.id,
+                    "book_id": job.book_id,
+                    "status": job.status,
+                    "done_chapters": job.done_chapters,
+                    "total_chapters": job.total_chapters,
+                    "current_chapter": job.current_chapter,
+                    "error": job.error,
+                })
+
+            book = session_db.query(Book).filter(Book.id == job.book_id, Book.user_id == user_id).first()
+            if not book:
+                return "<div class='alert alert-danger'>Книга не найдена</div>", 404
+
+            return render_job(session_db, book, job)
+        finally:
+            session_db.close()
+
     @app.route("/toggle-chapter", methods=["POST"])
     def toggle_chapter():
         user_id = session.get("user_id")
@@ -82,12 +150,155 @@ def init_chapter_routes(app):
                 Chapter.number == chapter_num
             ).first()
 
-            if not chapter or not chapter.content:
+            content = OutlineManager(session_db).bodies.get(chapter.body_hash) if chapter else None
+            if not content:
                 return "<div class='alert alert-warning'>Глава не найдена или ещё не сгенерирована.</div>", 404
 
-            return render_template("chapter.html", book=book, chapter=chapter)
+            return render_template("chapter.html", book=book, chapter=chapter, content=content)
         except Exception as e:
             logger.error(f"Ошибка при загрузке главы {chapter_num}: {e}")
             return "<div class='alert alert-danger'>Ошибка при загрузке главы.</div>", 500
         finally:
-            session_db.close()
\ No newline at end of file
+            session_db.close()
+
+    @app.route("/chapter/<int:book_id>/<int:chapter_num>/write")
+    def write_chapter(book_id, chapter_num):
+        """Страница главы, в которую текст приходит потоком (SSE) прямо во время генерации"""
+        user_id = session.get("user_id")
+        session_db = get_session()
+        try:
+            book = session_db.query(Book).filter(Book.id == book_id, Book.user_id == user_id).first()
+            if not book:
+                return "<div class='alert alert-danger'>Доступ запрещён</div>", 403
+
+            chapter = session_db.query(Chapter).filter(
+                Chapter.book_id == book_id,
+                Chapter.number == chapter_num
+            ).first()
+            if not chapter:
+                return "<div class='alert alert-warning'>Глава не найдена.</div>", 404
+
+            return render_template("chapter.html", book=book, chapter=chapter, streaming=True)
+        finally:
+            session_db.close()
+
+    @app.route("/chapter/<int:book_id>/<int:chapter_num>/stream")
+    def stream_chapter(book_id, chapter_num):
+        """
+        Server-Sent Events: событие chunk — очередной кусок текста главы (уже декодированный из JSON),
+        text — текст главы целиком получен и сохранён (резюме ещё генерируется),
+        done — глава сохранена через OutlineManager.update_chapter_summary, error — ошибка.
+        """
+        user_id = session.get("user_id")
+
+        def sse(event: str, payload) -> str:
+            return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        def events():
+            session_db = get_session()
+            manager = None
+            claimed = False
+            try:
+                book = session_db.query(Book).filter(Book.id == book_id, Book.user_id == user_id).first()
+                if not book:
+                    yield sse("error", "Доступ запрещён")
+                    return
+
+                manager = OutlineManager(session_db)
+                chapter = session_db.query(Chapter).filter(
+                    Chapter.book_id == book_id,
+                    Chapter.number == chapter_num
+                ).first()
+                if not chapter:
+                    yield sse("error", "Глава не найдена")
+                    return
+
+                # GET повторяется при каждом открытии страницы и переподключении EventSource —
+                # написанную главу отдаём из БД, а не генерируем заново
+                if chapter.body_hash and not chapter.generate_flag:
+                    yield sse("chunk", manager.bodies.get(chapter.body_hash))
+                    yield sse("done", {"summary": chapter.context_summary})
+                    return
+
+                job = JobQueue(session_db).get_active_job(book_id)
+                if job:
+                    yield sse("error", f"Главы этой книги уже генерирует задача {job.id}, дождитесь её завершения")
+                    return
+
+                data = manager.load_outline(book_id)
+                if not data:
+                    yield sse("error", "Сюжет не сгенерирован")
+                    return
+
+                # Второй вкладке или переподключению EventSource — отказ, а не вторая генерация той же главы
+                claimed = manager.claim_chapter_stream(book_id, chapter_num)
+                if not claimed:
+                    yield sse("error", "Глава уже генерируется, дождитесь завершения")
+                    return
+
+                llm = LLMClientFactory.get_client(settings.DEFAULT_LANGUAGE)
+                generator = BookGenerator(llm)
+                with track_usage() as digest_usage:
+                    chapter_data, previous_summaries = build_chapter_context(
+                        data, chapter_num, make_compactor(generator, manager, book_id)
+                    )
+                manager.record_llm_usage(book_id, digest_usage, operation="summary_digest")
+                passages = retrieve_passages(
+                    make_retriever(generator, manager, book_id), chapter_data, previous_summaries
+                )
+                prompt = generator.build_chapter_prompt(
+                    chapter_data=chapter_data,
+                    book_description=book.premise,
+                    storylines=data["storylines"],
+                    previous_summaries=previous_summaries,
+                    chapter_length=settings.CHAPTER_LENGTH,
+                    context_passages=passages
+                )
+
+                logger.info(f"Потоковая генерация главы {chapter_num} для {book_id=}")
+                text_saved = False
+                parts = []
+                stream = JSONFieldStream(("text", "summary"))
+                prefix = generator.chapter_prompt_prefix(book.premise, data["storylines"], settings.CHAPTER_LENGTH)
+                with track_usage() as usage, llm_operation("chapter_stream"), cache_prefix(prefix):
+                    for chunk in llm.generate_text_stream(prompt, **generator.json_kwargs(CHAPTER_SCHEMA)):
+                        parts.append(chunk)
+                        delta = stream.feed(chunk).get("text")
+                        if delta:
+                            yield sse("chunk", delta)
+                        if "text" in stream.completed and not text_saved:
+                            # Текст готов раньше резюме — сохраняем, чтобы обрыв потока его не потерял
+                            manager.save_chapter_content(book_id, chapter_num, stream.completed["text"])
+                            text_saved = True
+                            yield sse("text", {"saved": True})
+
+                    chapter_text, summary = generator.split_chapter_response(
+                        "".join(parts), chapter_num, fields=stream.completed
+                    )
+                    if summary is None:
+                        summary = generator.repair_summary(chapter_data, chapter_text)
+                manager.update_chapter_summary(
+                    book_id=book_id,
+                    chapter_number=chapter_num,
+                    summary=summary,
+                    content=chapter_text
+                )
+                manager.record_llm_usage(book_id, usage, operation="chapter", chapter_number=chapter_num)
+                yield sse("done", {"summary": summary})
+
+            except Exception as e:
+                logger.error(f"Ошибка потоковой генерации главы {chapter_num}: {e}")
+                session_db.rollback()
+                yield sse("error", str(e))
+            finally:
+                if claimed:
+                    try:
+                        manager.release_chapter_stream(book_id, chapter_num)
+                    except Exception as e:
+                        logger.error(f"Не удалось снять отметку генерации главы {chapter_num}: {e}")
+                session_db.close()
+
+        response = Response(stream_with_context(events()), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"  # nginx не должен буферизовать поток
+        return response
@@ -1,15 +1,25 @@
 # web/routes/outline_routes.py
 from flask import request, session, render_template
-from sqlalchemy import delete
 from sqlalchemy.orm import sessionmaker
 
 from infrastructure.database import get_session
-from infrastructure.database.models import Book, Chapter, PlotEvent, PlotLine
+from infrastructure.database.models import Book, Chapter
 from infrastructure.outline_manager import OutlineManager
+from infrastructure.job_queue import JobQueue
 from domain.book_logic import BookGenerator
 from infrastructure.llm_client import LLMClientFactory
+from infrastructure.token_usage import track_usage
+from config.settings import settings
 from logger import logger
 
+def _active_job_notice(session_db, book_id):
+    """Отказ, если главы книги сейчас пишет фоновая задача: новый сюжет удалил бы или перенумеровал её главы"""
+    job = JobQueue(session_db).get_active_job(book_id)
+    if job:
+        return f"<div class='alert alert-warning'>Главы этой книги уже генерирует задача {job.id}, дождитесь её завершения</div>"
+    return None
+
+
 def init_outline_routes(app):
     @app.route("/update-event", methods=["POST"])
     def update_event():
@@ -27,7 +37,10 @@ def init_outline_routes(app):
                     return "Access denied", 403
 
                 manager = OutlineManager(session_db)
-                manager.update_plot_event(book_id, chapter_num, storyline_name, new_text)
+                stale = manager.update_plot_event(
+                    book_id, chapter_num, storyline_name, new_text,
+                    propagation=request.form.get("propagation") or None
+                )
 
                 # 🔁 Загружаем обновлённый outline
                 data = manager.load_outline(book_id)
@@ -35,10 +48,17 @@ def init_outline_routes(app):
                     return "<div class='alert alert-danger'>Ошибка загрузки</div>", 500
 
                 # Возвращаем всю таблицу (как в regenerate-outline)
-                return render_template("book_outline_table.html",
+                table = render_template("book_outline_table.html",
                                     book=book,
                                     storylines=data["storylines"],
                                     chapters=data["chapters"])
+                if stale:
+                    chapters_list = ", ".join(str(number) for number in stale)
+                    table = (
+                        f"<div class='alert alert-info'>🔁 Главы {chapters_list} отмечены для перегенерации "
+                        f"— запустите генерацию глав</div>" + table
+                    )
+                return table
 
             finally:
                 session_db.close()
@@ -65,33 +85,52 @@ def init_outline_routes(app):
                 if not book:
                     return "<div class='alert alert-danger'>Доступ запрещён</div>", 403
 
-                # ✅ Удаляем ТОЛЬКО сюжет и главы, НО НЕ книгу
-                session_db.execute(delete(PlotEvent).where(PlotEvent.chapter.has(book_id=book_id)))
-                session_db.execute(delete(PlotLine).where(PlotLine.book_id == book_id))
-                session_db.execute(delete(Chapter).where(Chapter.book_id == book_id))
-                session_db.commit()
+                notice = _active_job_notice(session_db, book_id)
+                if notice:
+                    return notice, 409
 
-                # Теперь перезаписываем сюжет
-                llm = LLMClientFactory.create_client(language='gemini')
+                # Сначала новый сюжет — если LLM не ответит, старый останется нетронутым
+                llm = LLMClientFactory.get_client(settings.DEFAULT_LANGUAGE)
                 generator = BookGenerator(llm)
-                storylines, chapters = generator.generate_outline(new_premise)
+                # Длинная книга остаётся длинной: её сюжет снова строится по актам
+                existing = session_db.query(Chapter).filter(Chapter.book_id == book_id).count()
+                if existing > settings.OUTLINE_WEB_MAX_CHAPTERS:
+                    # Сюжет строится прямо в запросе — такой длинный в него не уложится
+                    return (
+                        f"<div class='alert alert-warning'>Сюжет книги из {existing} глав через веб не перегенерировать "
+                        f"(предел — {settings.OUTLINE_WEB_MAX_CHAPTERS}, OUTLINE_WEB_MAX_CHAPTERS)</div>"
+                    ), 400
+                chapter_count = existing if generator.is_long_outline(existing) else None
+                with track_usage() as usage:
+                    storylines, chapters = generator.generate_outline(new_premise, chapter_count=chapter_count)
+
+                # Пока строился сюжет, задачу могли поставить — проверяем ещё раз перед записью
+                notice = _active_job_notice(session_db, book_id)
+                if notice:
+                    return notice, 409
 
                 manager = OutlineManager(session_db)
-                manager.save_outline(
-                    book_title=book.title,
-                    premise=new_premise,
-                    storylines=storylines,
-                    chapters=chapters,
-                    user_id=user_id,
-                    book_id=book.id  # ✅ Передаём book_id
-                )
+                notice = ""
+                if request.form.get("mode", "merge") == "merge":
+                    # Слияние: написанные главы с прежними событиями сохраняются
+                    stats = manager.merge_outline(book.id, new_premise, storylines, chapters)
+                    notice = (
+                        f"<div class='alert alert-info'>🔀 Сохранено глав: {stats['kept']}, изменено: {stats['changed']}, "
+                        f"добавлено: {stats['added']}, удалено: {stats['removed']}"
+                        + (f"; на перегенерацию: {', '.join(map(str, stats['stale']))}" if stats["stale"] else "")
+                        + "</div>"
+                    )
+                else:
+                    # ✅ Удаляем ТОЛЬКО сюжет и главы, НО НЕ книгу — удаление и новый сюжет одной транзакцией
+                    manager.replace_outline(book.id, user_id, new_premise, storylines, chapters)
+                manager.record_llm_usage(book.id, usage, operation="outline")
 
                 # ✅ Теперь load_outline с тем же book_id
                 data = manager.load_outline(book_id)
                 if not data:
                     return "<div class='alert alert-danger'>Не удалось загрузить сюжет</div>", 500
 
-                return render_template("book_outline_table.html",
+                return notice + render_template("book_outline_table.html",
                                     book=book,
                                     storylines=data["storylines"],
                                     chapters=data["chapters"])